@@ -0,0 +1,56 @@
+""" Crawl time of the thread and async engines over a simulated network,
+    each command taking latency seconds. The async engine runs real SSH
+    sessions against a fake server in the same process, so its time
+    includes the handshakes and crypto of both ends. The thread engine gets
+    in-process sessions with no SSH
+
+    python benchmarks/bench_aio.py [devices] [latency] [threads] [sessions] """
+import os
+import sys
+import logging
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ndlib import aio, execute, parse, topology
+from ndlib.plan import CommandPlan
+import corpus
+import fakenet
+
+
+def crawl(engine, outputs, ips, latency, main):
+    'Seconds to crawl the network and the most sessions open at once'
+
+    net = fakenet.Network(outputs, ips, latency)
+    topology.config = parse.config = {'main': main}
+    topology.plan = CommandPlan()
+    nei = os.path.join(tempfile.mkdtemp(), 'nei.csv')
+
+    start = perf_counter()
+    if engine == 'thread':
+        execute.get_session = net.get_session
+        topology.crawl(['sw0.example.com'], 'u', 'pw', outf=nei)
+    else:
+        net.start()
+        try:
+            aio.crawl(['sw0.example.com'], 'u', 'pw', outf=nei)
+        finally:
+            net.stop()
+    return perf_counter() - start, net
+
+
+if __name__ == '__main__':
+    logging.disable(logging.WARNING)
+    devices = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    threads = sys.argv[3] if len(sys.argv) > 3 else '50'
+    sessions = sys.argv[4] if len(sys.argv) > 4 else '500'
+    main = {'max_crawl': str(devices), 'seed_os': 'cisco_nxos', 'quiet': '1', 'log_level': '40', \
+            'thread_count': threads, 'session_count': sessions, 'ignore_regex': '(oobsw|lab)'}
+    outputs, ips = corpus.network(devices)
+
+    print('%s devices, %ss per command, %s cpus' % (str(devices), str(latency), str(os.cpu_count())))
+    for engine, width in (('thread', threads), ('async', sessions)):
+        elapsed, net = crawl(engine, outputs, ips, latency, main)
+        print('%-6s %4s wide %7.2fs %7.1f devices/s %4s sessions peak, %s commands' % \
+              (engine, width, elapsed, net.sessions / elapsed, str(net.peak), str(net.commands)))
@@ -0,0 +1,51 @@
+""" Crawl time of one process against a coordinator with 1 to 4 local
+    worker processes over a simulated network, each command taking latency
+    seconds. Every worker runs threads sessions, so with free cores the
+    crawl scales with the number of workers until the coordinator's merge
+    loop is the limit
+
+    python benchmarks/bench_cluster.py [devices] [latency] [threads] """
+import os
+import sys
+import logging
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ndlib import cluster, execute, parse, topology
+from ndlib.plan import CommandPlan
+import corpus
+import fakenet
+
+
+def crawl(workers, net, main):
+    'Seconds to crawl the network, in this process when workers is 0'
+
+    topology.config = parse.config = {'main': main}
+    topology.plan = CommandPlan()
+    execute.get_session = net.get_session
+    nei = os.path.join(tempfile.mkdtemp(), 'nei.csv')
+
+    start = perf_counter()
+    if workers:
+        cluster.crawl(['sw0.example.com'], 'u', 'pw', outf=nei, workers=workers)
+    else:
+        topology.crawl(['sw0.example.com'], 'u', 'pw', outf=nei)
+    return perf_counter() - start
+
+
+if __name__ == '__main__':
+    logging.disable(logging.WARNING)
+    devices = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    threads = sys.argv[3] if len(sys.argv) > 3 else '50'
+    main = {'max_crawl': str(devices), 'seed_os': 'cisco_nxos', 'quiet': '1', 'log_level': '40', \
+            'thread_count': threads, 'ignore_regex': '(oobsw|lab)'}
+    net = fakenet.Network(*corpus.network(devices), latency=latency)
+
+    print('%s devices, %ss per command, %s threads per process, %s cpus' % \
+          (str(devices), str(latency), threads, str(os.cpu_count())))
+    for workers in (0, 1, 2, 4):
+        elapsed = crawl(workers, net, main)
+        print('%-12s %7.2fs %7.1f devices/s' % ('%s workers' % str(workers) if workers else 'one process', \
+                                              elapsed, devices / elapsed))
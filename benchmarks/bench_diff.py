@@ -0,0 +1,41 @@
+""" Snapshot diff time and peak memory on synthetic crawls, in memory and
+    with --stream
+
+    python benchmarks/bench_diff.py [links] """
+import os
+import sys
+import resource
+import tempfile
+import subprocess
+from time import perf_counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import corpus
+
+
+def run(prefix, stream):
+    'Wall time and peak RSS of ndcrawl.py diff in a child process'
+
+    argv = [sys.executable, os.path.join(ROOT, 'ndcrawl.py'), 'diff', prefix + '_old_nei.csv', \
+            prefix + '_new_nei.csv', '--devices', prefix + '_old_dev.csv', prefix + '_new_dev.csv', \
+            '--out', prefix + '_diff.jsonl']
+    if stream:
+        argv.append('--stream')
+    start = perf_counter()
+    subprocess.run(argv, cwd=ROOT, check=True, stderr=subprocess.DEVNULL)
+    elapsed = perf_counter() - start
+    return elapsed, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+
+if __name__ == '__main__':
+    links = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    with tempfile.TemporaryDirectory() as tmp:
+        prefix = os.path.join(tmp, 'snap')
+        corpus.snapshots(prefix, links)
+        print('%s links per snapshot' % str(links))
+
+        # Streaming first, the child peak RSS only ever goes up
+        for name, stream in (('--stream', True), ('in memory', False)):
+            elapsed, rss = run(prefix, stream)
+            print('%-10s %6.2fs %6.0f MB peak' % (name, elapsed, rss))
@@ -0,0 +1,33 @@
+""" CDP/LLDP parser throughput on large cores and access switches
+
+    python benchmarks/bench_parse.py [neighbors] """
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ndlib import parse
+from ndlib.record import Neighbor
+import corpus
+
+REPEAT = 20
+
+
+def bench(os_type, count):
+    cdp, lldp, lldp_sum = corpus.outputs(count, os_type)
+    device = Neighbor('', 'dut.example.com', os=os_type)
+    lines = len(cdp) + len(lldp) + len(lldp_sum)
+
+    start = perf_counter()
+    for i in range(REPEAT):
+        nd = parse.parse_nd(device, cdp, lldp, lldp_sum)
+    elapsed = (perf_counter() - start) / REPEAT
+    print('%-11s %5s neighbors %7s lines %8.2fms per device %9.0f lines/s' % \
+          (os_type, str(len(nd)), str(lines), elapsed * 1000, lines / elapsed))
+
+
+if __name__ == '__main__':
+    parse.config = {'main': {'ignore_regex': '(oobsw|lab)'}}
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    bench('cisco_nxos', count)
+    bench('cisco_ios', count)
@@ -0,0 +1,68 @@
+""" Crawl throughput with parsing in place against a parse pool. Threads
+    stand in for SSH workers: each device waits on simulated command
+    latency and then parses a large core's output. The pool only helps
+    with free cores, compare the results with os.cpu_count()
+
+    python benchmarks/bench_parsepool.py [devices] [neighbors] [latency] """
+import os
+import sys
+import logging
+import threading
+from queue import Queue
+from time import perf_counter, sleep
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ndlib import parse
+from ndlib.parsepool import ParsePool
+from ndlib.plan import CDP_DETAIL, LLDP_DETAIL, LLDP_SUMMARY
+from ndlib.record import Neighbor
+import corpus
+
+THREADS = 50
+MAIN = {'ignore_regex': '(oobsw|lab)'}
+
+
+def crawl(devices, outputs, latency, pool=None):
+    'Devices per second through THREADS workers'
+
+    q = Queue()
+    for i in range(devices):
+        q.put(Neighbor('', 'core%s.example.com' % str(i), os='cisco_nxos'))
+
+    def worker():
+        while True:
+            device = q.get()
+            if device is None:
+                return
+            sleep(latency)
+            if pool:
+                pool.parse(device, outputs)
+            else:
+                parse.parse_nd(device, outputs[CDP_DETAIL], outputs[LLDP_DETAIL], outputs[LLDP_SUMMARY])
+
+    start = perf_counter()
+    threads = [threading.Thread(target=worker) for i in range(THREADS)]
+    for t in threads:
+        q.put(None)
+        t.start()
+    for t in threads:
+        t.join()
+    return devices / (perf_counter() - start)
+
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    parse.config = {'main': MAIN}
+    devices = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+    cdp, lldp, lldp_sum = corpus.outputs(count, 'cisco_nxos')
+    outputs = {CDP_DETAIL: cdp, LLDP_DETAIL: lldp, LLDP_SUMMARY: lldp_sum}
+
+    print('%s cpus, %s devices with %s neighbors, %ss latency' % \
+          (str(os.cpu_count()), str(devices), str(count), str(latency)))
+    print('in place        %7.1f devices/s' % crawl(devices, outputs, latency))
+    for workers in (1, 2, 4, 8):
+        pool = ParsePool(workers, MAIN)
+        print('%s parse workers %7.1f devices/s' % (str(workers), crawl(devices, outputs, latency, pool)))
+        pool.close()
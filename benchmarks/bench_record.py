@@ -0,0 +1,60 @@
+""" Memory per neighbor for Neighbor records against the per-neighbor dicts
+    they replaced, on parsed output from many core switches
+
+    python benchmarks/bench_record.py [devices] [neighbors per device] """
+import os
+import sys
+import gc
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ndlib import parse
+from ndlib.record import Neighbor, FIELDS
+import corpus
+
+# Fields the original parser filled from regex groups
+MATCHED = ('remote_device_id', 'platform', 'local_int', 'remote_int', 'ipv4')
+
+
+def copy(value):
+    'A new string object with the same value, as each regex match returns'
+    return (value + ' ')[:-1] if isinstance(value, str) else value
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    records = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return records, size
+
+
+if __name__ == '__main__':
+    parse.config = {'main': {'ignore_regex': '(oobsw|lab)'}}
+    devices = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    cdp, lldp, lldp_sum = corpus.outputs(count, 'cisco_nxos')
+
+    def records():
+        nd = list()
+        for i in range(devices):
+            device = Neighbor('', 'core%s.example.com' % str(i), os='cisco_nxos')
+            nd.extend(parse.parse_cdp(cdp, device))
+        return nd
+
+    def dicts():
+        # The original eight keys per dict, with a string of its own for
+        # each value the original parser took from a regex match
+        nd = list()
+        for i in range(devices):
+            device = Neighbor('', 'core%s.example.com' % str(i), os='cisco_nxos')
+            for n in parse.parse_cdp(cdp, device):
+                nd.append({f: copy(n[f]) if f in MATCHED else n[f] for f in FIELDS[:8]})
+        return nd
+
+    nd, rsize = measure(records)
+    del nd
+    nd, dsize = measure(dicts)
+    print('%s neighbors: dicts %.1f MB (%s bytes each), Neighbor records %.1f MB (%s bytes each)' % \
+          (str(len(nd)), dsize / 1e6, str(dsize // len(nd)), rsize / 1e6, str(rsize // len(nd))))
@@ -0,0 +1,34 @@
+""" Wall time of short ndcrawl.py commands, against importing the SSH stack
+
+    python benchmarks/bench_startup.py [runs] """
+import os
+import sys
+import subprocess
+from time import perf_counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, 'tests', 'fixtures')
+
+COMMANDS = (
+    ('ndcrawl.py --help', ['ndcrawl.py', '--help']),
+    ('ndcrawl.py parse', ['ndcrawl.py', 'parse', os.path.join(FIXTURES, 'nxos_core_cdp_detail.txt'), \
+                          os.path.join(FIXTURES, 'nxos_core_lldp_detail.txt'), '--device', 'core1', \
+                          '--os', 'cisco_nxos']),
+    ('import netmiko, tqdm', ['-c', 'import netmiko, tqdm']),
+)
+
+
+def median(runs, argv):
+    times = list()
+    for i in range(runs):
+        start = perf_counter()
+        subprocess.run([sys.executable] + argv, cwd=ROOT, stdout=subprocess.DEVNULL, \
+                       stderr=subprocess.DEVNULL, check=True)
+        times.append(perf_counter() - start)
+    return sorted(times)[len(times) // 2]
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    for name, argv in COMMANDS:
+        print('%-22s %6.0fms' % (name, median(runs, argv) * 1000))
@@ -0,0 +1,36 @@
+""" Crawl bookkeeping cost per device as the network grows, the merge loop
+    of a crawl with no network I/O
+
+    python benchmarks/bench_state.py [devices ...] """
+import os
+import sys
+import logging
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ndlib.state import CrawlState
+import corpus
+
+
+def bench(count):
+    nd = corpus.topology(count)
+    cs = CrawlState(max_crawl=count)
+    cs.add_seed('sw0.example.com', 'cisco_nxos')
+
+    merged = 0
+    start = perf_counter()
+    while cs.ready():
+        key = cs.pop()
+        merged += len(nd[key])
+        cs.complete(key, nd[key])
+    elapsed = perf_counter() - start
+
+    print('%7s devices %8s neighbors %7.2fs %6.1fus per device %5.2fus per neighbor' % \
+          (str(cs.completed), str(merged), elapsed, elapsed / cs.completed * 1e6, elapsed / merged * 1e6))
+    return cs
+
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    for count in [int(c) for c in sys.argv[1:]] or (1000, 10000, 100000):
+        bench(count)
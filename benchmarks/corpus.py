@@ -0,0 +1,319 @@
+'Synthetic CDP/LLDP Output'
+import csv
+import zlib
+import random
+
+NXOS_VERSION = 'Cisco Nexus Operating System (NX-OS) Software, Version 9.3(8)'
+IOS_VERSION = 'Cisco IOS Software, IOS-XE Software, Catalyst L3 Switch Software ' \
+              '(CAT3K_CAA-UNIVERSALK9-M), Version 16.9.5, RELEASE SOFTWARE (fc2)'
+
+# Remote platform, os and CDP platform string
+PLATFORMS = (
+    ('N9K-C93180YC-EX', 'cisco_nxos', 'N9K-C93180YC-EX'),
+    ('N7K-C7010', 'cisco_nxos', 'N7K-C7010'),
+    ('WS-C3850-48P', 'cisco_ios', 'cisco WS-C3850-48P'),
+    ('C9300-48P', 'cisco_ios', 'cisco C9300-48P'),
+)
+
+
+def neighbors(count, seed=1, local='nxos'):
+    """ count (name, ipv4, platform, os, cdp platform, local int, remote int)
+        neighbors, with a few lab and out of band names for ignore_regex """
+
+    rnd = random.Random(seed)
+    nei = list()
+    for i in range(count):
+        platform, os, cdp_platform = PLATFORMS[rnd.randrange(len(PLATFORMS))]
+        if i % 25 == 7:
+            name = 'lab-sw%s.example.com' % str(i)
+        elif i % 25 == 13:
+            name = 'oobsw%s.example.com' % str(i)
+        else:
+            name = 'bldg%s-sw%s.example.com' % (str(rnd.randrange(1, 40)), str(i))
+        ipv4 = '10.%s.%s.%s' % (str(rnd.randrange(1, 250)), str(i // 250), str(i % 250 + 1))
+        if local == 'nxos':
+            lint = 'Ethernet%s/%s' % (str(i // 48 + 1), str(i % 48 + 1))
+        else:
+            lint = 'GigabitEthernet%s/0/%s' % (str(i // 48 + 1), str(i % 48 + 1))
+        # Unique per device, as on a real core
+        if os == 'cisco_nxos':
+            rint = 'Ethernet%s/%s' % (str(i // 52 + 1), str(i % 52 + 1))
+        elif platform.startswith('C9300'):
+            rint = 'TenGigabitEthernet%s/1/%s' % (str(i // 8 + 1), str(i % 8 + 1))
+        else:
+            rint = 'GigabitEthernet%s/0/%s' % (str(i // 52 + 1), str(i % 52 + 1))
+        nei.append((name, ipv4, platform, os, cdp_platform, lint, rint))
+    return nei
+
+
+def nxos_cdp(nei):
+    'show cdp neighbor detail from an NX-OS device'
+
+    lines = list()
+    for name, ipv4, platform, os, cdp_platform, lint, rint in nei:
+        lines += ['----------------------------------------',
+                  'Device ID:%s(FOX2%s)' % (name, str(zlib.crc32(name.encode()) % 100000).zfill(5)),
+                  'System Name: %s' % name.split('.')[0],
+                  '',
+                  'Interface address(es): 1',
+                  '    IPv4 Address: %s' % ipv4,
+                  'Platform: %s, Capabilities: Router Switch IGMP Filtering Supports-STP-Dispute' % cdp_platform,
+                  'Interface: %s, Port ID (outgoing port): %s' % (lint, rint),
+                  'Holdtime: 137 sec',
+                  '',
+                  'Version:',
+                  NXOS_VERSION if os == 'cisco_nxos' else IOS_VERSION,
+                  '',
+                  'Advertisement Version: 2',
+                  '',
+                  'Native VLAN: 1',
+                  'Duplex: full',
+                  '',
+                  'MTU: 9216',
+                  'Physical Location: bldg 1, row 4',
+                  'Mgmt address(es):',
+                  '    IPv4 Address: %s' % ipv4]
+    return lines
+
+
+def ios_cdp(nei):
+    'show cdp neighbor detail from an IOS device'
+
+    lines = list()
+    for name, ipv4, platform, os, cdp_platform, lint, rint in nei:
+        lines += ['-------------------------',
+                  'Device ID: %s' % name,
+                  'Entry address(es): ',
+                  '  IP address: %s' % ipv4,
+                  'Platform: %s,  Capabilities: Router Switch IGMP ' % cdp_platform,
+                  'Interface: %s,  Port ID (outgoing port): %s' % (lint, rint),
+                  'Holdtime : 164 sec',
+                  '',
+                  'Version :',
+                  NXOS_VERSION if os == 'cisco_nxos' else IOS_VERSION,
+                  'Technical Support: http://www.cisco.com/techsupport',
+                  'Copyright (c) 1986-2020 by Cisco Systems, Inc.',
+                  'Compiled Thu 30-Jan-20 17:49 by mcpre',
+                  '',
+                  'advertisement version: 2',
+                  'VTP Management Domain: \'\'',
+                  'Native VLAN: 1',
+                  'Duplex: full',
+                  'Management address(es): ',
+                  '  IP address: %s' % ipv4,
+                  '']
+    lines += ['', 'Total cdp entries displayed : %s' % str(len(nei))]
+    return lines
+
+
+def short_int(name):
+    'IOS LLDP abbreviation of an interface name'
+
+    for full, short in (('TenGigabitEthernet', 'Te'), ('GigabitEthernet', 'Gi'), ('Ethernet', 'Eth')):
+        if name.startswith(full):
+            return short + name[len(full):]
+    return name
+
+
+def nxos_lldp(nei):
+    'show lldp neighbor detail from an NX-OS device'
+
+    lines = list()
+    for name, ipv4, platform, os, cdp_platform, lint, rint in nei:
+        lines += ['Chassis id: 00%s' % str(zlib.crc32(name.encode())).zfill(10),
+                  'Port id: %s' % short_int(rint),
+                  'Local Port id: %s' % short_int(lint),
+                  'Port Description: uplink to core',
+                  'System Name: %s' % name,
+                  'System Description: %s' % (NXOS_VERSION if os == 'cisco_nxos' else IOS_VERSION),
+                  'Time remaining: 98 seconds',
+                  'System Capabilities: B, R',
+                  'Enabled Capabilities: B, R',
+                  'Management Address: %s' % ipv4,
+                  'Management Address IPV6: not advertised',
+                  'Vlan ID: 1',
+                  '']
+    lines += ['', 'Total entries displayed: %s' % str(len(nei))]
+    return lines
+
+
+def ios_lldp(nei):
+    'show lldp neighbor detail from an IOS device, local ports only in the summary'
+
+    lines = list()
+    for name, ipv4, platform, os, cdp_platform, lint, rint in nei:
+        lines += ['------------------------------------------------',
+                  'Chassis id: 00%s' % str(zlib.crc32(name.encode())).zfill(10),
+                  'Port id: %s' % short_int(rint),
+                  'Port Description: %s' % rint,
+                  'System Name: %s' % name,
+                  '',
+                  'System Description: ',
+                  NXOS_VERSION if os == 'cisco_nxos' else IOS_VERSION,
+                  '',
+                  'Time remaining: 91 seconds',
+                  'System Capabilities: B,R',
+                  'Enabled Capabilities: B,R',
+                  'Management Addresses:',
+                  '    IP: %s' % ipv4,
+                  'Auto Negotiation - not supported',
+                  'Physical media capabilities - not advertised',
+                  'Media Attachment Unit type - not advertised',
+                  'Vlan ID: - not advertised',
+                  '']
+    lines += ['', 'Total entries displayed: %s' % str(len(nei))]
+    return lines
+
+
+def ios_lldp_summary(nei):
+    'show lldp neighbor from an IOS device'
+
+    lines = ['Capability codes:',
+             '    (R) Router, (B) Bridge, (T) Telephone, (C) DOCSIS Cable Device',
+             '    (W) WLAN Access Point, (P) Repeater, (S) Station, (O) Other',
+             '',
+             'Device ID           Local Intf     Hold-time  Capability      Port ID']
+    for name, ipv4, platform, os, cdp_platform, lint, rint in nei:
+        lines.append('%-20s%-15s%-11s%-16s%s' % (name[:20], short_int(lint), '120', 'B,R', short_int(rint)))
+    lines += ['', 'Total entries displayed: %s' % str(len(nei))]
+    return lines
+
+
+def outputs(count, os='cisco_nxos', seed=1):
+    'CDP detail, LLDP detail and LLDP summary lines for a device with count neighbors'
+
+    if os == 'cisco_nxos':
+        nei = neighbors(count, seed, 'nxos')
+        return nxos_cdp(nei), nxos_lldp(nei), list()
+    nei = neighbors(count, seed, 'ios')
+    return ios_cdp(nei), ios_lldp(nei), ios_lldp_summary(nei)
+
+
+def topology(count, seed=1, cross=0.3):
+    """ Neighbor records seen from each device of a count device network, keyed
+        by device name. A tree with cross links, every link is reported from
+        both ends, the first device is the seed """
+
+    from ndlib.record import Neighbor
+
+    rnd = random.Random(seed)
+    names = ['sw%s.example.com' % str(i) for i in range(count)]
+    ports = dict()
+    nd = {name: list() for name in names}
+
+    def port(name):
+        ports[name] = ports.get(name, 0) + 1
+        return 'Ethernet%s/%s' % (str(ports[name] // 48 + 1), str(ports[name] % 48 + 1))
+
+    def link(a, b):
+        aint, bint = port(a), port(b)
+        nd[a].append(Neighbor(a, b, platform='N9K-C93180YC-EX', local_int=aint, remote_int=bint, \
+                              ipv4='10.0.0.1', os='cisco_nxos'))
+        nd[b].append(Neighbor(b, a, platform='N9K-C93180YC-EX', local_int=bint, remote_int=aint, \
+                              ipv4='10.0.0.1', os='cisco_nxos'))
+
+    for i in range(1, count):
+        link(names[rnd.randrange(0, max(1, i // 3 + 1))], names[i])
+        if rnd.random() < cross:
+            other = names[rnd.randrange(0, i)]
+            if other != names[i]:
+                link(other, names[i])
+    return nd
+
+
+def network(count, seed=1, cross=0.3):
+    """ CLI output for every device of a count device network, a tree with
+        cross links of NX-OS cores and IOS access switches. Returns a dict
+        of device name to {command: lines}, and one of IPv4 to name. The
+        first device is the seed """
+
+    rnd = random.Random(seed)
+    devs = dict()
+    for i in range(count):
+        name = 'sw%s.example.com' % str(i)
+        ipv4 = '10.%s.%s.%s' % (str(i // 62500), str(i // 250 % 250), str(i % 250 + 1))
+        devs[name] = (ipv4,) + PLATFORMS[0 if i < max(count // 25, 1) else 2]
+    names = list(devs)
+
+    ports = dict()
+    nei = {name: list() for name in names}
+
+    def port(name):
+        ports[name] = ports.get(name, 0) + 1
+        n = ports[name] - 1
+        if devs[name][2] == 'cisco_nxos':
+            return 'Ethernet%s/%s' % (str(n // 48 + 1), str(n % 48 + 1))
+        return 'GigabitEthernet%s/0/%s' % (str(n // 48 + 1), str(n % 48 + 1))
+
+    def link(a, b):
+        aint, bint = port(a), port(b)
+        nei[a].append((b,) + devs[b] + (aint, bint))
+        nei[b].append((a,) + devs[a] + (bint, aint))
+
+    for i in range(1, count):
+        link(names[rnd.randrange(0, min(i, max(count // 25, 1)))], names[i])
+        if rnd.random() < cross:
+            other = names[rnd.randrange(0, i)]
+            if other != names[i]:
+                link(other, names[i])
+
+    from ndlib.plan import CDP_DETAIL, LLDP_DETAIL, LLDP_SUMMARY
+    out = dict()
+    for name in names:
+        if devs[name][2] == 'cisco_nxos':
+            out[name] = {CDP_DETAIL: nxos_cdp(nei[name]), LLDP_DETAIL: nxos_lldp(nei[name]), \
+                         LLDP_SUMMARY: list()}
+        else:
+            out[name] = {CDP_DETAIL: ios_cdp(nei[name]), LLDP_DETAIL: ios_lldp(nei[name]), \
+                         LLDP_SUMMARY: ios_lldp_summary(nei[name])}
+    return out, {d[0]: name for name, d in devs.items()}
+
+
+def snapshots(prefix, links, changes=1000, seed=3):
+    """ Write two crawls of a links sized network to prefix_old_nei.csv,
+        prefix_new_nei.csv and the matching _dev.csv files. The new crawl
+        drops changes links, adds changes links, moves changes // 2 links to
+        new interfaces and readdresses changes // 2 devices. Its rows are
+        shuffled, and half are reported from the other end with abbreviated
+        interface names, so none of that may show up as a change """
+
+    rnd = random.Random(seed)
+    count = max(links // 2, 2)
+    nei_fields = ('local_device_id', 'remote_device_id', 'distance', 'local_int', 'remote_int', \
+                  'ipv4', 'os', 'platform', 'description')
+    devs = {i: ('10.%s.%s.%s' % (str(i >> 16), str((i >> 8) & 255), str(i & 255)), \
+                PLATFORMS[rnd.randrange(len(PLATFORMS))][0]) for i in range(count)}
+    old = [(rnd.randrange(count), i % 4 + 1, i % 48 + 1, rnd.randrange(count), i % 3 + 1, (i * 7) % 48 + 1) \
+           for i in range(links)]
+
+    new = old[changes:]
+    new += [(rnd.randrange(count), 9, i % 48 + 1, rnd.randrange(count), 9, i % 48 + 1) for i in range(changes)]
+    for j in range(changes // 2):
+        a, sa, pa, b, sb, pb = new[j]
+        new[j] = (a, 8, pa, b, 8, pb)
+    rnd.shuffle(new)
+    new_devs = dict(devs)
+    for i in range(changes // 2):
+        new_devs[i] = ('172.16.%s.%s' % (str(i >> 8), str(i & 255)), devs[i][1])
+
+    def row(link, d, flip):
+        a, sa, pa, b, sb, pb = link
+        ia = ('Eth%s/%s' if flip else 'Ethernet%s/%s') % (str(sa), str(pa))
+        ib = ('Gi1/%s/%s' if flip else 'GigabitEthernet1/%s/%s') % (str(sb), str(pb))
+        if flip:
+            return ['dev%s.example.com' % str(b), 'dev%s.example.com' % str(a), '1', ib, ia, d[a][0], \
+                    'cisco_nxos', d[a][1], '']
+        return ['dev%s.example.com' % str(a), 'dev%s.example.com' % str(b), '1', ia, ib, d[b][0], \
+                'cisco_nxos', d[b][1], '']
+
+    for name, ls, d, flip in (('old', old, devs, lambda: False), ('new', new, new_devs, lambda: rnd.random() < 0.5)):
+        with open('%s_%s_nei.csv' % (prefix, name), 'w', newline='') as f:
+            w = csv.writer(f)
+            w.writerow(nei_fields)
+            for link in ls:
+                w.writerow(row(link, d, flip()))
+        with open('%s_%s_dev.csv' % (prefix, name), 'w', newline='') as f:
+            w = csv.writer(f)
+            w.writerow(('device_id', 'ipv4', 'platform', 'os', 'distance', 'logged_in'))
+            for i, (ipv4, platform) in d.items():
+                w.writerow(('dev%s.example.com' % str(i), ipv4, platform, 'cisco_nxos', 1, True))
@@ -0,0 +1,185 @@
+""" Fake SSH targets serving corpus.network output, for crawl tests and
+    benchmarks with no devices. The thread engine gets netmiko style
+    sessions from get_session(), the async engine an asyncssh server on
+    localhost that every asyncssh.connect() is sent to, with the target
+    device passed as the username """
+import asyncio
+import threading
+from time import sleep
+
+# Lines the IOS | include filter is applied to
+INCLUDE = ' | include '
+
+
+class Network:
+    """ Devices keyed by name with their IPv4 addresses. latency is the
+        delay before each prompt, devices in hang stall on their first CDP
+        command until the session is closed """
+
+    def __init__(self, outputs, ips, latency=0.0, hang=()):
+        self.outputs = outputs
+        self.ips = ips
+        self.latency = latency
+        self.hang = set(hang)
+        self.lock = threading.Lock()
+        self.sessions = 0
+        self.commands = 0
+        self.peak = 0
+        self.open = 0
+        self.server = None
+        self.real_connect = None
+
+    def name(self, host):
+        'Device name for a host name or address, OSError if there is none'
+
+        name = self.ips.get(host, host)
+        if name not in self.outputs:
+            raise OSError('No route to host ' + host)
+        return name
+
+    def opened(self, name):
+        'Count a new session, returns True if it is to hang'
+
+        with self.lock:
+            self.sessions += 1
+            self.open += 1
+            self.peak = max(self.peak, self.open)
+            if name in self.hang:
+                self.hang.discard(name)
+                return True
+        return False
+
+    def closed(self):
+        with self.lock:
+            self.open -= 1
+
+    def reply(self, name, cmd):
+        'Output lines for a command'
+
+        with self.lock:
+            self.commands += 1
+        base, _, pattern = cmd.partition(INCLUDE)
+        if cmd.startswith('terminal') or not cmd:
+            return list()
+        if base not in self.outputs[name]:
+            return ['% Invalid input detected at \'^\' marker.']
+        out = self.outputs[name][base]
+        if pattern:
+            words = pattern.strip('"').split('|')
+            out = [l for l in out if any(w in l for w in words)]
+        return out
+
+    def get_session(self, host, platform, username, password, dname=None, delay_factor=None, limit=None):
+        'Stands in for execute.get_session'
+
+        sleep(self.latency)
+        name = self.name(host)
+        return Session(self, name, self.opened(name))
+
+    async def handle(self, proc):
+        'IOS style shell for one asyncssh session'
+
+        name = proc.get_extra_info('username')
+        hang = self.opened(name)
+        prompt = name.split('.')[0] + '#'
+        try:
+            await asyncio.sleep(self.latency)
+            proc.stdout.write('\r\n' + prompt)
+            while True:
+                line = await proc.stdin.readline()
+                if not line or line.strip() == 'exit':
+                    break
+                cmd = line.strip()
+                await asyncio.sleep(self.latency)
+                if hang and cmd.startswith('show cdp'):
+                    await asyncio.sleep(3600)
+                body = self.reply(name, cmd)
+                proc.stdout.write(cmd + '\r\n' + ''.join(l + '\r\n' for l in body) + prompt)
+        except Exception:
+            pass
+        finally:
+            self.closed()
+        proc.exit(0)
+
+    def start(self):
+        'Serve the async engine from a background event loop and route asyncssh.connect to it'
+
+        import asyncssh
+
+        class Server(asyncssh.SSHServer):
+            def begin_auth(self, username):
+                return True
+
+            def password_auth_supported(self):
+                return True
+
+            def validate_password(self, username, password):
+                return True
+
+        ready = threading.Event()
+        loop = asyncio.new_event_loop()
+
+        async def serve():
+            key = asyncssh.generate_private_key('ssh-ed25519')
+            self.server = await asyncssh.create_server(Server, '127.0.0.1', 0, server_host_keys=[key], \
+                                                       process_factory=self.handle, backlog=4096, \
+                                                       line_editor=False)
+            ready.set()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(serve())
+            loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        ready.wait()
+        self.loop = loop
+        port = self.server.sockets[0].getsockname()[1]
+        self.real_connect = real_connect = asyncssh.connect
+
+        def connect(host, port_=22, **kw):
+            kw['username'] = self.name(host)
+            return real_connect('127.0.0.1', port, **kw)
+
+        asyncssh.connect = connect
+        return self
+
+    def stop(self):
+        'Stop the server and restore asyncssh.connect'
+
+        import asyncssh
+        asyncssh.connect = self.real_connect
+
+        async def shutdown():
+            self.server.close()
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result(10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class Session:
+    'netmiko style session on a fake device'
+
+    def __init__(self, network, name, hang=False):
+        self.network = network
+        self.name = name
+        self.hang = hang
+        self.closed = threading.Event()
+
+    def send_command(self, cmd, read_timeout=None):
+        if self.closed.is_set():
+            raise OSError('Socket is closed')
+        if self.hang and cmd.startswith('show cdp'):
+            self.closed.wait()
+            raise OSError('Socket is closed')
+        sleep(self.network.latency)
+        return '\n'.join(self.network.reply(self.name, cmd))
+
+    def disconnect(self):
+        if not self.closed.is_set():
+            self.closed.set()
+            self.network.closed()
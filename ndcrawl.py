@@ -4,82 +4,157 @@ import sys
 import argparse
 import configparser
 import logging
-import getpass
-from ndlib.log import init_logging
-from ndlib import topology
-from ndlib import parse
 
 CONFIG_FILE = 'ndcrawl.ini'
 
-parser = argparse.ArgumentParser(description='Discover Network Topology via CDP/LLDP')
-parser.add_argument('-seed', metavar="switch1[,switch2]", help="Seed devices to start crawl")
-parser.add_argument('-nei_file', metavar="file", help="Output Neighbors to File", type=str)
-parser.add_argument('-dev_file', metavar="file", help="Output Neighbors to File", type=str)
-parser.add_argument('-ng_file', metavar="file", help="Output NetGrph Topology File", type=str)
-parser.add_argument('--quiet', help='Quiet output, log to file only', action="store_true")
-parser.add_argument("--seed_os", metavar='cisco_nxos', help="Netmiko OS type for seed devices",
-                    type=str)
-parser.add_argument("--seed_file", metavar='file', help="Seed devices from a file, one per line",
-                    type=str)
-parser.add_argument("--user", metavar='username', help="Username to execute as",
-                    type=str)
-parser.add_argument("--max_crawl", metavar='int', help="Max devices to crawl (default 10000)",
-                    type=int)
-parser.add_argument("--conf", metavar='file', help="Alternate Config File",
-                    type=str)
-parser.add_argument("--debug", help="Set debugging level", type=int)
-parser.add_argument("-v", help="Verbose Output", action="store_true")
-
-args = parser.parse_args()
-
-log_level = logging.WARNING
-logging.getLogger('paramiko').setLevel(logging.WARNING)
-
-if args.v and not args.debug:
-    args.debug = 1
-
-if args.debug:
-    if args.debug:
-        log_level = logging.INFO
-    if args.debug > 1:
-        log_level = logging.DEBUG
-    if args.debug > 1 and args.debug < 3:
-        logging.getLogger('netmiko').setLevel(logging.INFO)
-        logging.getLogger('paramiko').setLevel(logging.INFO)
+# Subcommands, a command line without one is a crawl
+COMMANDS = ('crawl', 'daemon', 'replay', 'rebuild', 'parse', 'diff', 'worker')
+
+# Commands that never touch the network log to the console only
+OFFLINE = ('replay', 'rebuild', 'parse', 'diff')
+
+# Config options a coordinator crawl does not use
+CLUSTER_IGNORED = ('adaptive', 'subnet_rate', 'platform_rate', 'state_file')
 
 logger = logging.getLogger('ndcrawl.py')
 
-# Local config files to import
-config = configparser.ConfigParser()
 
-if os.path.exists(CONFIG_FILE):
-    config.read(CONFIG_FILE)
-else:
-    logger.warning('Warning: Loading Sample Config File: Please create ndcrawl.ini from ndcrawl-sample.ini')
-    config.read('ndcrawl-sample.ini')
+def build_parser():
+    'Command line parser, one subparser per command'
+
+    # Options shared by every command
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('-nei_file', metavar="file", help="Output Neighbors to File", type=str)
+    common.add_argument('-dev_file', metavar="file", help="Output Neighbors to File", type=str)
+    common.add_argument('-ng_file', metavar="file", help="Output NetGrph Topology File", type=str)
+    common.add_argument('--quiet', help='Quiet output, log to file only', action="store_true")
+    common.add_argument("--conf", metavar='file', help="Alternate Config File",
+                        type=str)
+    common.add_argument("--debug", help="Set debugging level", type=int)
+    common.add_argument("-v", help="Verbose Output", action="store_true")
+
+    parser = argparse.ArgumentParser(description='Discover Network Topology via CDP/LLDP',
+                                     epilog='Options without a command are passed to crawl')
+    sub = parser.add_subparsers(dest='command', metavar='command')
+
+    # Options shared by crawl and daemon
+    crawl_opts = argparse.ArgumentParser(add_help=False)
+    crawl_opts.add_argument('-seed', metavar="switch1[,switch2]", help="Seed devices to start crawl")
+    crawl_opts.add_argument("--seed_os", metavar='cisco_nxos', help="Netmiko OS type for seed devices",
+                            type=str)
+    crawl_opts.add_argument("--seed_file", metavar='file', help="Seed devices from a file, one per line",
+                            type=str)
+    crawl_opts.add_argument("--user", metavar='username', help="Username to execute as",
+                            type=str)
+    crawl_opts.add_argument("--max_crawl", metavar='int', help="Max devices to crawl (default 10000)",
+                            type=int)
+    crawl_opts.add_argument("--engine", metavar='thread', help="Crawl engine: thread or async (default thread)",
+                            type=str, choices=['thread', 'async'])
+    crawl_opts.add_argument("--capture", metavar='dir', help="Save raw CDP/LLDP output to a capture store",
+                            type=str)
+    crawl_opts.add_argument("--incremental", help="Only re-scrape devices whose CDP neighbors changed since the last run",
+                            action="store_true")
+    crawl_opts.add_argument("--stream", metavar='file', help="Stream neighbors to a JSONL file (and nei_file) as devices complete",
+                            type=str)
+    crawl_opts.add_argument("--timing", metavar='file', help="Write per device phase timings to a JSONL file",
+                            type=str)
+    crawl_opts.add_argument("--prom", metavar='file', help="Write timing histograms to a Prometheus textfile",
+                            type=str)
+    crawl_opts.add_argument("--db", metavar='file', help="Checkpoint the crawl to a SQLite database",
+                            type=str)
+    crawl_opts.add_argument("--resume", help="Resume an interrupted crawl from the --db database",
+                            action="store_true")
+    crawl_opts.add_argument("--workers", metavar='int', help="Coordinate the crawl across N local worker processes",
+                            type=int)
+    crawl_opts.add_argument("--listen", metavar='host:port', help="Coordinate the crawl and accept remote workers on host:port",
+                            type=str)
+
+    crawl = sub.add_parser('crawl', parents=[common, crawl_opts], help='Crawl the network from seed devices (default)')
+
+    # Older spellings of the replay, rebuild and worker commands
+    crawl.add_argument("--replay", metavar='dir', help=argparse.SUPPRESS, type=str)
+    crawl.add_argument("--rebuild", metavar='file', help=argparse.SUPPRESS, type=str)
+    crawl.add_argument("--worker", metavar='host:port', help=argparse.SUPPRESS, type=str)
+    crawl.set_defaults(print_help=crawl.print_help)
+
+    daemon = sub.add_parser('daemon', parents=[common, crawl_opts], help='Recrawl on a schedule and serve the topology over HTTP')
+    daemon.add_argument("--api", metavar='host:port', help="Serve the topology API on host:port (default 127.0.0.1:8080)",
+                        type=str)
+    daemon.add_argument("--interval", metavar='seconds', help="Seconds between crawls, 0 to serve the files without crawling",
+                        type=float)
+    daemon.set_defaults(print_help=daemon.print_help)
+
+    replay = sub.add_parser('replay', parents=[common], help='Rebuild output files from a capture store')
+    replay.add_argument('replay', metavar='dir', help="Capture store directory")
+    replay.add_argument('-seed', metavar="switch1[,switch2]", help="Seed devices (default: seeds of the capture)")
 
-config['main']['log_level'] = str(log_level)
-topology.config = config
-parse.config = config
+    rebuild = sub.add_parser('rebuild', parents=[common], help='Rebuild nei_file and ng_file from a streamed JSONL file')
+    rebuild.add_argument('rebuild', metavar='file', help="Streamed JSONL file")
 
-if args.quiet:
-    config['main']['quiet'] = '1'
-else:
-    config['main']['quiet'] = ''
+    parse = sub.add_parser('parse', parents=[common], help='Parse saved CDP/LLDP output from one device')
+    parse.add_argument('cdp', metavar='cdp_file', help="show cdp neighbor detail output")
+    parse.add_argument('lldp', metavar='lldp_file', nargs='?', help="show lldp neighbor detail output")
+    parse.add_argument('lldp_sum', metavar='lldp_sum_file', nargs='?', help="show lldp neighbor output")
+    parse.add_argument("--device", metavar='name', help="Device the output came from",
+                       type=str, default='Unknown')
+    parse.add_argument("--os", metavar='cisco_ios', help="Netmiko OS type of the device (default cisco_ios)",
+                       type=str, default='cisco_ios')
 
-init_logging(log_level, config['main']['log_file'], args.quiet)
+    diff = sub.add_parser('diff', parents=[common], help='Compare two crawls, changes as JSON lines')
+    diff.add_argument('old', metavar='old_nei_file', help="Neighbor file from the earlier crawl")
+    diff.add_argument('new', metavar='new_nei_file', help="Neighbor file from the later crawl")
+    diff.add_argument("--devices", metavar='file', nargs=2, help="Also compare two device files, old then new",
+                      type=str)
+    diff.add_argument("--out", metavar='file', help="Write changes to file instead of stdout",
+                      type=str)
+    diff.add_argument("--stream", help="Hold only link hashes in memory, moves show as removed and added",
+                      action="store_true")
 
-if args.max_crawl:
-    config['main']['max_crawl'] = str(args.max_crawl)
+    worker = sub.add_parser('worker', parents=[common], help='Scrape devices for a crawl coordinator')
+    worker.add_argument('worker', metavar='host:port', help="Coordinator address")
+    worker.add_argument("--user", metavar='username', help="Username to execute as",
+                        type=str)
 
-if args.seed_os:
-    config['main']['seed_os'] = args.seed_os
+    return parser
 
-if not args.seed:
-    if 'seeds' in config['main'] and config['main']['seeds']:
-        args.seed = config['main']['seeds']
 
-if args.seed or args.seed_file:
+def load_config(args, log_level):
+    'Read the config file and apply command line overrides'
+
+    config = configparser.ConfigParser()
+
+    conf_file = args.conf or CONFIG_FILE
+    if os.path.exists(conf_file):
+        config.read(conf_file)
+    else:
+        logger.warning('Warning: Loading Sample Config File: Please create ndcrawl.ini from ndcrawl-sample.ini')
+        config.read('ndcrawl-sample.ini')
+
+    config['main']['log_level'] = str(log_level)
+
+    if args.quiet:
+        config['main']['quiet'] = '1'
+    else:
+        config['main']['quiet'] = ''
+
+    return config
+
+
+def output_defaults(args, config):
+    'Check for output files from config'
+
+    if not args.nei_file:
+        if 'nei_file' in config['main'] and config['main']['nei_file']:
+            args.nei_file = config['main']['nei_file']
+    if not args.dev_file:
+        if 'dev_file' in config['main'] and config['main']['dev_file']:
+            args.dev_file = config['main']['dev_file']
+
+
+def get_credentials(args, config):
+    'Username and password from the command line, config or a prompt'
+
+    import getpass
 
     if not args.user:
         if 'username' in config['main'] and config['main']['username']:
@@ -91,14 +166,241 @@ if args.seed or args.seed_file:
         password = config['main']['password']
     else:
         password = getpass.getpass('Password for ' + args.user + ': ')
+    return args.user, password
 
-    # Check for output files from config
-    if not args.nei_file:
-        if 'nei_file' in config['main'] and config['main']['nei_file']:
-            args.nei_file = config['main']['nei_file']
-    if not args.dev_file:
-        if 'dev_file' in config['main'] and config['main']['dev_file']:
-            args.dev_file = config['main']['dev_file']
+
+def get_credential_set(config, username, password):
+    'Credentials from [credentials:name] config sections, tried after the main login'
+
+    sections = [s for s in config.sections() if s.startswith('credentials:')]
+    if not sections:
+        return None
+
+    import getpass
+    from ndlib.creds import CredentialSet
+
+    creds = [('default', username, password)]
+    for s in sections:
+        name = s.split(':', 1)[1]
+        user = config[s].get('username') or username
+        if config[s].get('password'):
+            password = config[s]['password']
+        else:
+            password = getpass.getpass('Password for %s (%s): ' % (user, name))
+        creds.append((name, user, password))
+    return CredentialSet(creds, config['main'].get('cred_file'))
+
+
+def get_logins(args, config):
+    'Main login and any credential sets, passwords are prompted for once'
+
+    username, password = get_credentials(args, config)
+    return username, password, get_credential_set(config, username, password)
+
+
+def get_profiles(config):
+    'Learned timing profiles, enabled by profile_file'
+
+    if not config['main'].get('profile_file'):
+        return None
+
+    from ndlib.profiles import TimingProfiles
+    return TimingProfiles(config['main']['profile_file'])
+
+
+def get_parse_pool(args, config):
+    'Parse worker processes, enabled by parse_workers, coordinators leave parsing to their workers'
+
+    if not config['main'].get('parse_workers') or args.workers or args.listen:
+        return None
+
+    logger.info('parse_workers is experimental, check benchmarks/bench_parsepool.py on this host')
+
+    from ndlib.parsepool import ParsePool
+    return ParsePool(int(config['main']['parse_workers']), config['main'])
+
+
+def get_authkey(config):
+    'Shared cluster_key for coordinators and remote workers'
+
+    if 'cluster_key' in config['main'] and config['main']['cluster_key']:
+        return config['main']['cluster_key'].encode()
+    print('\nError: Must set cluster_key in the config file to use --listen or --worker\n')
+    sys.exit(1)
+
+
+def run_rebuild(args, config):
+    'Rebuild nei_file and ng_file from a streamed JSONL file'
+
+    output_defaults(args, config)
+
+    from ndlib.output import rebuild_files
+    rebuild_files(args.rebuild, outf=args.nei_file, ngout=args.ng_file, dout=args.dev_file)
+
+
+def run_replay(args, config):
+    'Rebuild output files from a capture store'
+
+    output_defaults(args, config)
+
+    from ndlib import topology
+    from ndlib import parse
+    topology.config = config
+    parse.config = config
+
+    seeds = None
+    if args.seed:
+        seeds = args.seed.split(',')
+
+    if not args.quiet:
+        print('Replaying capture store:', args.replay)
+
+    topology.replay(args.replay, outf=args.nei_file, dout=args.dev_file, ngout=args.ng_file, seeds=seeds)
+
+
+def run_parse(args, config):
+    'Parse saved output from one device, neighbors to nei_file/ng_file or CSV on stdout'
+
+    import csv
+    from ndlib import parse
+    from ndlib.record import Neighbor
+    from ndlib.output import NEI_FIELDS, output_files
+    parse.config = config
+
+    def lines(path):
+        if not path:
+            return list()
+        with open(path, 'r') as f:
+            return f.read().splitlines()
+
+    device = Neighbor(args.device, args.device, os=args.os)
+    nd = parse.parse_nd(device, lines(args.cdp), lines(args.lldp), lines(args.lldp_sum))
+
+    if args.nei_file or args.ng_file:
+        output_files(args.nei_file, args.ng_file, None, nd, dict(), dict())
+    else:
+        dw = csv.DictWriter(sys.stdout, fieldnames=NEI_FIELDS, extrasaction='ignore')
+        dw.writeheader()
+        for n in nd:
+            dw.writerow(n)
+
+
+def run_diff(args):
+    'Compare two crawls, change records to --out or stdout and counts to stderr'
+
+    from ndlib.diff import diff
+
+    old_dev, new_dev = args.devices or (None, None)
+    out = open(args.out, 'w') if args.out else sys.stdout
+    try:
+        counts = diff(args.old, args.new, out, old_dev, new_dev, stream=args.stream)
+    except (OSError, ValueError) as e:
+        print('\nError: ' + str(e) + '\n', file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if args.out:
+            out.close()
+
+    if not args.quiet:
+        for k in sorted(counts):
+            print('%s: %s' % (k.capitalize(), str(counts[k])), file=sys.stderr)
+        if not counts:
+            print('No changes', file=sys.stderr)
+
+
+def run_worker(args, config):
+    'Scrape devices for a crawl coordinator'
+
+    from ndlib import topology
+    from ndlib import parse
+    from ndlib import cluster
+    topology.config = config
+    parse.config = config
+
+    username, password, topology.credentials = get_logins(args, config)
+    topology.profiles = get_profiles(config)
+    authkey = get_authkey(config)
+
+    if not args.quiet:
+        print('Working for coordinator:', args.worker)
+    cluster.work(cluster.parse_address(args.worker), authkey, username, password)
+
+
+def run_crawl(args, config, logins=None, parse_pool=None):
+    """ Crawl the network from the seed devices, logins from get_logins() are
+        prompted for if not given. A parse_pool passed in is left running """
+
+    output_defaults(args, config)
+
+    if args.max_crawl:
+        config['main']['max_crawl'] = str(args.max_crawl)
+
+    if args.seed_os:
+        config['main']['seed_os'] = args.seed_os
+
+    if args.engine:
+        config['main']['engine'] = args.engine
+
+    if not args.seed:
+        if 'seeds' in config['main'] and config['main']['seeds']:
+            args.seed = config['main']['seeds']
+
+    if not args.capture:
+        if 'capture_dir' in config['main'] and config['main']['capture_dir']:
+            args.capture = config['main']['capture_dir']
+
+    if not args.stream:
+        if 'stream_file' in config['main'] and config['main']['stream_file']:
+            args.stream = config['main']['stream_file']
+
+    if not args.db:
+        if 'db_file' in config['main'] and config['main']['db_file']:
+            args.db = config['main']['db_file']
+
+    if not args.timing:
+        if 'timing_file' in config['main'] and config['main']['timing_file']:
+            args.timing = config['main']['timing_file']
+
+    if not args.prom:
+        if 'prom_file' in config['main'] and config['main']['prom_file']:
+            args.prom = config['main']['prom_file']
+
+    if not (args.seed or args.seed_file or args.resume):
+        print('\nError: Must provide -seed devices if not using config file\n')
+        args.print_help()
+        return
+
+    from ndlib import topology
+    from ndlib import parse
+    topology.config = config
+    parse.config = config
+
+    username, password, credentials = logins or get_logins(args, config)
+    topology.credentials = credentials
+    topology.profiles = get_profiles(config)
+
+    # Remote workers need the shared cluster_key
+    authkey = None
+    if args.listen:
+        authkey = get_authkey(config)
+
+    if (args.workers or args.listen) and (args.capture or args.incremental):
+        print('\nError: --capture and --incremental are not supported with --workers or --listen\n')
+        sys.exit(1)
+
+    # Workers scrape on their own threads and give up on timed out devices
+    if args.workers or args.listen:
+        ignored = [k for k in CLUSTER_IGNORED if config['main'].get(k)]
+        if config['main'].get('device_timeout') and int(config['main'].get('timeout_retries') or 0):
+            ignored.append('timeout_retries')
+        if config['main'].get('engine') == 'async':
+            ignored.append('engine = async')
+        if ignored:
+            logger.warning('Not supported with --workers or --listen, ignoring: %s', ', '.join(ignored))
+
+    if args.resume and not args.db:
+        print('\nError: Must provide --db or db_file in the config file to use --resume\n')
+        sys.exit(1)
 
     if args.seed_file:
         seeds = list()
@@ -107,13 +409,222 @@ if args.seed or args.seed_file:
             l = l.strip()
             if l:
                 seeds.append(l)
-    else:
+    elif args.seed:
         seeds = args.seed.split(',')
+    else:
+        seeds = list()
+
+    if not args.quiet:
+        if args.resume:
+            print('Resuming crawl from:', args.db)
+        else:
+            print('Beginning crawl on:', ', '.join(seeds))
+
+    db = None
+    if args.db:
+        from ndlib.db import TopologyDB
+        db = TopologyDB(args.db, resume=args.resume)
+        topology.db = db
+
+    store = None
+    if args.capture:
+        from ndlib.capture import CaptureStore
+        store = CaptureStore(args.capture, seeds, config['main']['seed_os'])
+        topology.store = store
+
+    previous = None
+    if 'state_file' in config['main'] and config['main']['state_file']:
+        from ndlib.incremental import PreviousRun
+        previous = PreviousRun(config['main']['state_file'], args.nei_file, args.incremental, \
+                              args.dev_file)
+        topology.previous = previous
+    elif args.incremental:
+        print('\nError: Must set state_file in the config file to use --incremental\n')
+        sys.exit(1)
 
+    stream = None
+    if args.stream:
+        from ndlib.output import NeighborStream
+        stream = NeighborStream(args.nei_file, args.stream, append=args.resume)
+        topology.stream = stream
+
+    preflight = None
+    if config['main'].get('preflight'):
+        from ndlib.connect import Preflight
+        preflight = Preflight(timeout=float(config['main'].get('probe_timeout', 3)))
+        topology.preflight = preflight
+
+    # A fresh plan per crawl, daemon recrawls relearn platform capabilities
+    from ndlib.plan import CommandPlan
+    topology.plan = CommandPlan(filtered=bool(config['main'].get('filtered_commands')))
+
+    throttle = None
+    if config['main'].get('adaptive') or config['main'].get('subnet_rate') or \
+       config['main'].get('platform_rate'):
+        from ndlib.throttle import Throttle
+        ceiling = int(config['main']['thread_count'])
+        if config['main'].get('engine') == 'async':
+            ceiling = int(config['main']['session_count'])
+        throttle = Throttle(ceiling, adaptive=bool(config['main'].get('adaptive')), \
+                            subnet_rate=float(config['main'].get('subnet_rate') or 0), \
+                            platform_rate=float(config['main'].get('platform_rate') or 0), \
+                            history_file=config['main'].get('throttle_file'))
+        topology.throttle = throttle
+
+    watchdog = None
+    if config['main'].get('device_timeout'):
+        from ndlib.deadline import Watchdog
+        from ndlib import execute
+        watchdog = Watchdog(float(config['main']['device_timeout']), \
+                            retries=int(config['main'].get('timeout_retries') or 0), \
+                            backoff=float(config['main'].get('retry_backoff') or 30), \
+                            close=execute.close_session)
+        topology.watchdog = watchdog
+
+    if args.timing or args.prom:
+        from ndlib import timing
+        timing.enabled = True
+        timing.records.clear()
+
+    # Tag JSON log lines with the device and phase
+    if config['main'].get('log_queue') and config['main'].get('log_json'):
+        from ndlib import timing
+        timing.tagged = True
+
+    # Started before any crawl threads, workers are forked
+    own_pool = parse_pool is None
+    if own_pool:
+        parse_pool = get_parse_pool(args, config)
+    topology.parse_pool = parse_pool
+
+    if args.workers or args.listen:
+        from ndlib import cluster
+        listen = None
+        if args.listen:
+            listen = cluster.parse_address(args.listen)
+        cluster.crawl(seeds, username, password, outf=args.nei_file, dout=args.dev_file, \
+                      ngout=args.ng_file, workers=args.workers or 0, listen=listen, authkey=authkey)
+    elif config['main'].get('engine') == 'async':
+        from ndlib import aio
+        aio.crawl(seeds, username, password, outf=args.nei_file, dout=args.dev_file, ngout=args.ng_file)
+    else:
+        topology.crawl(seeds, username, password, outf=args.nei_file, dout=args.dev_file, ngout=args.ng_file)
+
+    if store:
+        store.close()
+
+    if watchdog:
+        watchdog.stop()
+
+    if parse_pool and own_pool:
+        parse_pool.close()
+
+    if args.timing or args.prom:
+        timing.write_files(args.timing or 'timing.jsonl', args.prom)
+
+
+def run_daemon(args, config):
+    'Serve the topology API and recrawl on a schedule'
+
+    from ndlib.daemon import Daemon
+    from ndlib.cluster import parse_address
+
+    output_defaults(args, config)
+    if not (args.nei_file and args.dev_file):
+        print('\nError: Must provide -nei_file and -dev_file, the API serves them\n')
+        sys.exit(1)
+
+    address = args.api or config['main'].get('api_address') or '127.0.0.1:8080'
+    interval = args.interval
+    if interval is None:
+        interval = float(config['main'].get('crawl_interval') or 0)
+
+    logins = None
+    if interval:
+        if not (args.seed or args.seed_file or config['main'].get('seeds')):
+            print('\nError: Must provide -seed devices to recrawl\n')
+            sys.exit(1)
+        logins = get_logins(args, config)
+
+    # One pool for every recrawl, forked before the API and crawl threads start
+    parse_pool = get_parse_pool(args, config) if interval else None
+
+    def crawl():
+        run_crawl(args, config, logins, parse_pool)
+
+        # Only the first crawl resumes from the checkpoint
+        args.resume = False
+
+    daemon = Daemon(crawl, args.nei_file, args.dev_file, parse_address(address), interval)
     if not args.quiet:
-        print('Beginning crawl on:', ', '.join(seeds))
+        print('Serving topology on http://%s:%s/' % daemon.address[:2])
+    try:
+        daemon.run()
+    finally:
+        if parse_pool:
+            parse_pool.close()
+
+
+def main(argv):
+    'Run a command, heavy modules are only imported by the commands that need them'
+
+    parser = build_parser()
+
+    # Command lines without a command are crawls
+    if not argv or (argv[0] not in COMMANDS and argv[0] not in ('-h', '--help')):
+        argv = ['crawl'] + argv
+    args = parser.parse_args(argv)
+
+    # Older --replay, --rebuild and --worker flags pick the command
+    command = args.command
+    if command == 'crawl':
+        if args.rebuild:
+            command = 'rebuild'
+        elif args.replay:
+            command = 'replay'
+        elif args.worker:
+            command = 'worker'
+
+    log_level = logging.WARNING
+    logging.getLogger('paramiko').setLevel(logging.WARNING)
+
+    if args.v and not args.debug:
+        args.debug = 1
+
+    if args.debug:
+        if args.debug:
+            log_level = logging.INFO
+        if args.debug > 1:
+            log_level = logging.DEBUG
+        if args.debug > 1 and args.debug < 3:
+            logging.getLogger('netmiko').setLevel(logging.INFO)
+            logging.getLogger('paramiko').setLevel(logging.INFO)
+
+    config = load_config(args, log_level)
+
+    from ndlib.log import init_logging
+    log_file = config['main']['log_file']
+    if command in OFFLINE:
+        log_file = None
+    init_logging(log_level, log_file, args.quiet, queued=bool(config['main'].get('log_queue')), \
+                 json_file=config['main'].get('log_json'), \
+                 aggregate=float(config['main'].get('log_aggregate') or 0))
+
+    if command == 'rebuild':
+        run_rebuild(args, config)
+    elif command == 'replay':
+        run_replay(args, config)
+    elif command == 'parse':
+        run_parse(args, config)
+    elif command == 'diff':
+        run_diff(args)
+    elif command == 'worker':
+        run_worker(args, config)
+    elif command == 'daemon':
+        run_daemon(args, config)
+    else:
+        run_crawl(args, config)
+
 
-    topology.crawl(seeds, args.user, password, outf=args.nei_file, dout=args.dev_file, ngout=args.ng_file)
-else:
-    print('\nError: Must provide -seed devices if not using config file\n')
-    parser.print_help()
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,293 @@
+'Asyncio Crawl Engine'
+import asyncio
+import logging
+import re
+from time import monotonic
+from . import parse
+from . import incremental
+from . import timing
+from . import log
+from . import topology
+from .plan import CDP_DETAIL, LLDP_DETAIL, LLDP_SUMMARY
+from .state import canonical
+from .creds import AuthFailed
+
+logger = logging.getLogger(__name__)
+
+# The config and optional crawl parts (store, throttle, watchdog, ...) are the
+# ones set on topology, shared with the thread engine
+
+# Seconds to wait on a command before giving up on the session
+READ_TIMEOUT = 60
+
+# CLI prompt on the last line of output, eg switch1# or switch1>
+PROMPT_RE = re.compile(r'\n([^\n]+[>#])\s*$')
+
+# Enable password prompt, or the prompt when no password is asked for
+ENABLE_RE = re.compile(r'(assword:|\n[^\n]+[>#])\s*$')
+
+# Terminal width, as netmiko sets it, so long commands are echoed on one line
+TERM_WIDTH = 511
+
+
+def crawl(seeds, username, password, outf=None, dout=None, ngout=None):
+    'Crawl CDP/LLDP Neighbors to build a topology using the asyncio engine'
+
+    return asyncio.run(crawl_async(seeds, username, password, outf=outf, dout=dout, ngout=ngout))
+
+
+async def crawl_async(seeds, username, password, outf=None, dout=None, ngout=None):
+    """ Crawl all devices on a single event loop, keeping up to session_count
+        SSH sessions open instead of a thread per device """
+
+    try:
+        import asyncssh
+    except ImportError:
+        raise RuntimeError('The async engine requires asyncssh: pip install asyncssh')
+
+    run = topology.Crawl(seeds, int(topology.config['main']['session_count']))
+    tasks = dict()
+
+    # Keep up to session_count devices in flight and merge results as each completes
+    while run.running():
+        for key in run.dispatch():
+            tasks[asyncio.ensure_future(gather_within(key, run.cs.devices[key], username, password))] = key
+
+        # Come back to the frontier when a rate limited device may start or
+        # timed out devices are due a retry
+        wait = run.wait()
+        if not tasks:
+            await asyncio.sleep(wait or 0.01)
+            continue
+        done, _ = await asyncio.wait(tasks, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            run.merge(tasks.pop(task), task.result())
+
+    graph = run.finish(outf, dout, ngout)
+    run.report()
+    return graph
+
+
+async def gather_within(key, device, username, password):
+    'gather_nd cancelled when it runs over the watchdog budget, closing its session'
+
+    if not topology.watchdog:
+        return await gather_nd(device, username, password)
+    try:
+        nd = await asyncio.wait_for(gather_nd(device, username, password), topology.watchdog.budget)
+    except asyncio.TimeoutError:
+        topology.watchdog.expire(key)
+        return list()
+    topology.watchdog.passed(key)
+    return nd
+
+
+async def gather_nd(device, username, password):
+    'Gather neighbors from device'
+
+    dname = device['remote_device_id']
+    nd = list()
+
+    log.tag(dname)
+    logger.info('Gathering Neighbors on %s', dname)
+
+    # Device id first, then IPv4
+    hosts = [dname]
+    if device['ipv4'] != 'Unknown' and device['ipv4'] != dname:
+        hosts.append(device['ipv4'])
+
+    # Race both with a TCP probe and only SSH to the winner
+    if topology.preflight:
+        host = await topology.preflight.apick(dname, device['ipv4'])
+        if not host:
+            logger.warning('No reachable address for %s', dname)
+            return nd
+        hosts = [host]
+
+    # Connect latencies, and whether a failure to connect is not the device's fault
+    connects = list()
+    excused = False
+
+    try:
+        for host in hosts:
+            try:
+                nd = await scrape_device(device, host, username, password, connects)
+                break
+            except AuthFailed as e:
+                logger.warning('Login failed on %s: %s', dname, str(e))
+                excused = True
+                break
+            except Exception as e:
+                logger.info('Failed to scrape %s via %s: %s', dname, host, str(e))
+        else:
+            logger.warning('Failed to scrape %s', dname)
+
+    # Cancelled by the watchdog, still counts if it connected
+    except asyncio.CancelledError:
+        excused = True
+        raise
+    finally:
+        topology.record_connect(connects, excused)
+
+    if nd:
+        logger.info('Completed Scraping %s', dname)
+
+    return nd
+
+
+async def scrape_device(device, host, username, password, connects=None):
+    """ Scrape a device over an interactive shell and return the results as list
+        of neighbors, appending the connect latency to the optional connects list """
+
+    import asyncssh
+
+    dname = device['remote_device_id']
+    tp = topology.profiles.session(device) if topology.profiles else None
+
+    # Password of the login that worked, also tried as the enable secret
+    secret = None
+
+    async def connect(username, password):
+        nonlocal secret
+        secret = password
+        try:
+            with timing.phase(dname, 'connect'):
+                return await asyncssh.connect(host, username=username, password=password, known_hosts=None,
+                                              client_keys=None, connect_timeout=20)
+        except asyncssh.PermissionDenied as e:
+            raise AuthFailed(str(e))
+
+    connect_start = monotonic()
+    if topology.credentials:
+        conn = await topology.credentials.alogin(device, host, connect)
+    else:
+        conn = await connect(username, password)
+    if connects is not None:
+        connects.append(monotonic() - connect_start)
+    async with conn:
+        proc = await conn.create_process(term_type='vt100', term_size=(TERM_WIDTH, 24))
+
+        # Find the prompt, enable and disable paging and line wrap
+        proc.stdin.write('\n')
+        prompt = await read_until_prompt(proc)
+        if prompt.endswith('>'):
+            with timing.phase(dname, 'enable'):
+                prompt = await enable(proc, secret)
+        await send_command(proc, prompt, 'terminal length 0', dname, tp)
+        await send_command(proc, prompt, 'terminal width ' + str(TERM_WIDTH), dname, tp)
+
+        # Reuse previous neighbors if the adjacency summary is unchanged
+        if topology.previous:
+            summary = await send_command(proc, prompt, incremental.SUMMARY_CMD, dname, tp)
+            nd = topology.previous.check(canonical(dname), summary, topology.plan.planned(device))
+            if nd is not None:
+                proc.stdin.write('exit\n')
+                return nd
+
+        async def send(cmd):
+            return await send_command(proc, prompt, cmd, dname, tp)
+
+        outputs = await topology.plan.arun(device, send)
+
+        proc.stdin.write('exit\n')
+
+    # Compress and write captured output off the event loop
+    if topology.store:
+        await asyncio.get_running_loop().run_in_executor(None, topology.store.save, \
+            canonical(dname), device, host, outputs)
+
+    if topology.parse_pool:
+        return await topology.parse_pool.aparse(device, outputs)
+    return parse.parse_nd(device, outputs[CDP_DETAIL], outputs[LLDP_DETAIL], outputs[LLDP_SUMMARY])
+
+
+async def enable(proc, secret):
+    """ Enter enable mode from a > prompt, sending secret if a password is
+        asked for. Returns the new prompt, still the > prompt if enable failed """
+
+    proc.stdin.write('enable\n')
+    buf = ''
+    while not ENABLE_RE.search('\n' + buf[-256:]):
+        chunk = await asyncio.wait_for(proc.stdout.read(65536), READ_TIMEOUT)
+        if not chunk:
+            raise EOFError('Session closed waiting for enable')
+        buf += chunk.replace('\r', '')
+    if buf.rstrip().endswith('assword:'):
+        proc.stdin.write((secret or '') + '\n')
+
+    proc.stdin.write('\n')
+    prompt = await read_until_prompt(proc)
+    if prompt.endswith('>'):
+        logger.info('Enable failed, staying at %s', prompt)
+    return prompt
+
+
+def strip_echo(lines, cmd, prompt):
+    """ Output lines after the echoed cmd, None if the echo hasn't arrived.
+        The echo is matched by length rather than text since a narrow terminal
+        wraps or scrolls it over several lines """
+
+    # Stray prompts and blank lines ahead of the echo
+    i = 0
+    while i < len(lines) and lines[i].strip() in ('', prompt):
+        i += 1
+
+    # The echo can follow a stray prompt on the same line
+    if i < len(lines) and lines[i].startswith(prompt):
+        lines[i] = lines[i][len(prompt):]
+
+    need = len(''.join(cmd.split()))
+    got = 0
+    while i < len(lines) and got < need:
+        got += len(''.join(lines[i].split()))
+        i += 1
+    if got < need:
+        return None
+    return lines[i:]
+
+
+async def read_until_prompt(proc, prompt=None, cmd=None, tp=None):
+    """ Read shell output until the prompt is seen, returns the prompt when
+        prompt is None, otherwise the output after the echoed cmd up to the prompt.
+        A tuned read timeout from tp that runs short falls back to the long one """
+
+    timeout = tp.read_timeout if tp and tp.read_timeout else READ_TIMEOUT
+    buf = ''
+    while True:
+        try:
+            chunk = await asyncio.wait_for(proc.stdout.read(65536), timeout)
+        except asyncio.TimeoutError:
+            if not tp or not tp.fallback():
+                raise
+            timeout = tp.read_timeout
+            continue
+        if not chunk:
+            raise EOFError('Session closed waiting for prompt')
+        buf += chunk.replace('\r', '')
+
+        # Only the tail of the buffer can hold the prompt
+        tail = '\n' + buf[-256:]
+        m = PROMPT_RE.search(tail)
+        if not m or (prompt is not None and m.group(1) != prompt):
+            continue
+        if prompt is None:
+            return m.group(1)
+
+        lines = strip_echo(buf[:max(0, len(buf) - (len(tail) - m.start()))].split('\n'), cmd, prompt)
+        if lines is None:
+            continue
+        return '\n'.join(lines)
+
+
+async def send_command(proc, prompt, cmd, host='', tp=None):
+    """ Send command and return results as list, the latency is recorded in tp """
+
+    logger.debug('Executing Command on %s: %s', host, cmd)
+    with timing.phase(host, 'command'):
+        start = monotonic()
+        proc.stdin.write(cmd + '\n')
+        results = await read_until_prompt(proc, prompt, cmd, tp)
+    if tp:
+        tp.command(monotonic() - start)
+
+    return results.split('\n')
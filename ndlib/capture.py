@@ -0,0 +1,97 @@
+'Raw Output Capture Store'
+import os
+import re
+import gzip
+import json
+import logging
+import threading
+from time import time
+from . import parse
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.jsonl'
+
+
+class CaptureStore:
+    """ Archive of raw CDP/LLDP command output. Each device is written to its
+        own gzipped JSON file and index.jsonl lists the devices in the order
+        they were captured, after a line with the crawl seeds. Crawls into an
+        existing store append to its index, so devices this crawl does not
+        reach keep their earlier output. """
+
+    def __init__(self, path, seeds, seed_os):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+        self.index = open(os.path.join(path, INDEX_FILE), 'a')
+        self.index.write(json.dumps({'seeds': seeds, 'seed_os': seed_os}) + '\n')
+        self.index.flush()
+
+    def save(self, key, device, host, outputs):
+        'Write one device worth of command output, outputs is a dict of cmd: lines'
+
+        fname = re.sub(r'[^\w\.\-]', '_', key) + '.json.gz'
+        tmp = os.path.join(self.path, fname + '.tmp')
+        record = {'device': dict(device), 'host': host, 'time': time(), \
+                  'outputs': {cmd: '\n'.join(lines) for cmd, lines in outputs.items()}}
+
+        with gzip.open(tmp, 'wt') as f:
+            json.dump(record, f)
+        os.replace(tmp, os.path.join(self.path, fname))
+
+        with self.lock:
+            self.index.write(json.dumps({'key': key, 'file': fname, 'os': device['os']}) + '\n')
+            self.index.flush()
+
+    def close(self):
+        'Close the index'
+        self.index.close()
+
+
+def load_index(path):
+    """ Return the seed info and list of device entries from a capture store,
+        the seeds of the latest crawl and one entry per device """
+
+    meta = dict()
+    entries = dict()
+    with open(os.path.join(path, INDEX_FILE), 'r') as f:
+        for l in f:
+            entry = json.loads(l)
+            if 'seeds' in entry:
+                meta = entry
+            else:
+                entries[entry['key']] = entry
+    return meta, list(entries.values())
+
+
+def load_device(path, entry):
+    'Load a device record from the store, outputs as lists of lines'
+
+    with gzip.open(os.path.join(path, entry['file']), 'rt') as f:
+        record = json.load(f)
+    record['outputs'] = {cmd: text.split('\n') for cmd, text in record['outputs'].items()}
+    return record
+
+
+def init_worker(main_config):
+    'Set parser config in replay worker processes'
+    parse.config = {'main': main_config}
+
+
+def parse_entry(args):
+    'Load and parse one stored device, returns (key, neighbors)'
+
+    path, entry = args
+    record = load_device(path, entry)
+    out = record['outputs']
+
+    try:
+        nd = parse.parse_nd(record['device'], out.get('show cdp neighbor detail', []), \
+                            out.get('show lldp neighbor detail', []), \
+                            out.get('show lldp neighbor', []))
+    except Exception as e:
+        logger.warning('Failed to parse stored output for %s: %s', entry['key'], str(e))
+        nd = list()
+    return entry['key'], nd
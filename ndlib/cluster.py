@@ -0,0 +1,246 @@
+'Coordinator and Worker Routines'
+import os
+import socket
+import logging
+import threading
+import multiprocessing
+from multiprocessing.connection import Listener, Client, wait
+from queue import Queue, Empty
+from . import parse
+from . import topology
+from .record import pack, unpack
+
+logger = logging.getLogger(__name__)
+
+# Config options workers need from the coordinator, never the logins or cluster_key
+WORKER_KEYS = ('ignore_regex', 'preflight', 'probe_timeout', 'parse_workers', 'device_timeout', \
+               'filtered_commands')
+
+
+def parse_address(address):
+    'host:port string to a Listener/Client address'
+
+    host, port = address.rsplit(':', 1)
+    return (host, int(port))
+
+
+class Peer:
+    'A connected worker and the devices it is scraping'
+
+    __slots__ = ('name', 'capacity', 'outstanding')
+
+    def __init__(self, name, capacity):
+        self.name = name
+        self.capacity = capacity
+        self.outstanding = set()
+
+
+def worker_config(main):
+    'The options in WORKER_KEYS from the coordinator config'
+    return {k: main[k] for k in WORKER_KEYS if k in main}
+
+
+def drop(peers, conn, cs):
+    'Forget a lost worker and put the devices it had back in the frontier'
+
+    peer = peers.pop(conn)
+    logger.warning('Lost worker %s, requeueing %s devices', peer.name, str(len(peer.outstanding)))
+    for key in peer.outstanding:
+        cs.requeue(key)
+    try:
+        conn.close()
+    except OSError:
+        pass
+
+
+def accept(listener, conns, main_config):
+    'Accept and handshake workers, handing them to the coordinator on conns'
+
+    while True:
+        try:
+            conn = listener.accept()
+        except multiprocessing.AuthenticationError:
+            logger.warning('Rejected worker with bad cluster_key')
+            continue
+        except (OSError, EOFError, AttributeError):
+            # Listener closed, accept() has no clean way to be interrupted
+            return
+
+        try:
+            msg = conn.recv()
+            conn.send(('config', main_config))
+        except (EOFError, OSError):
+            continue
+        if msg[0] == 'hello':
+            conns.put((conn, msg[1], msg[2]))
+
+
+def crawl(seeds, username, password, outf=None, dout=None, ngout=None, workers=0, \
+          listen=None, authkey=None):
+    """ Crawl as a coordinator. Owns the frontier, visited set and output,
+        using the config, stream and db set on topology, and hands device
+        batches to worker processes, each running gather_nd on its own thread
+        pool. Workers are local processes (workers=N) and/or remote
+        ndcrawl.py --worker processes connecting to listen. """
+
+    if authkey is None:
+        authkey = os.urandom(16)
+    # The default backlog of 1 drops connects when workers start together
+    listener = Listener(listen or ('127.0.0.1', 0), backlog=128, authkey=authkey)
+    logger.info('Coordinator listening on %s', str(listener.address))
+
+    procs = list()
+    for i in range(workers):
+        p = multiprocessing.Process(target=work, daemon=True, \
+            args=(listener.address, authkey, username, password))
+        p.start()
+        procs.append(p)
+
+    conns = Queue()
+    threading.Thread(target=accept, daemon=True, \
+        args=(listener, conns, worker_config(topology.config['main']))).start()
+
+    # Devices are handed out per worker capacity rather than from dispatch()
+    run = topology.Crawl(seeds, 0)
+    cs = run.cs
+
+    peers = dict()
+    while run.running():
+
+        # Pick up newly connected workers, wait for one if there are none
+        while True:
+            try:
+                conn, name, capacity = conns.get(block=not peers, timeout=1)
+            except Empty:
+                break
+            peers[conn] = Peer(name, capacity)
+            logger.info('Worker %s connected with capacity %s', name, str(capacity))
+
+        if not peers:
+            if not listen and not any(p.is_alive() for p in procs):
+                logger.error('All workers exited, stopping crawl')
+                break
+            continue
+
+        # Top up every worker to its capacity
+        for conn, peer in list(peers.items()):
+            batch = list()
+            while cs.ready() and len(peer.outstanding) < peer.capacity:
+                key = cs.pop()
+                logger.info('Processing %s on %s', key, peer.name)
+                peer.outstanding.add(key)
+                batch.append((key, pack(cs.devices[key])))
+            if batch:
+                try:
+                    conn.send(('work', batch))
+                except (BrokenPipeError, EOFError, OSError):
+                    drop(peers, conn, cs)
+
+        # Merge results as they stream back
+        for conn in wait(list(peers), timeout=1):
+            peer = peers[conn]
+            try:
+                _, key, packed = conn.recv()
+            except (EOFError, OSError):
+                drop(peers, conn, cs)
+                continue
+
+            peer.outstanding.discard(key)
+            run.merge(key, [unpack(t) for t in packed])
+
+    # Stop all workers, including any that connected after the last device
+    listener.close()
+    stop = list(peers)
+    while not conns.empty():
+        stop.append(conns.get()[0])
+    for conn in stop:
+        try:
+            conn.send(('stop',))
+            conn.close()
+        except OSError:
+            pass
+    for p in procs:
+        p.join(timeout=1)
+        if p.is_alive():
+            p.terminate()
+
+    return run.finish(outf, dout, ngout)
+
+
+def work(address, authkey, username, password):
+    """ Worker loop. Connects to a coordinator, scrapes the devices it is
+        handed with a thread pool and streams each device back as it is done """
+
+    try:
+        conn = Client(address, authkey=authkey)
+    except OSError as e:
+        logger.warning('Could not connect to coordinator %s: %s', str(address), str(e))
+        return
+
+    # Capacity from the local config, parser settings from the coordinator
+    capacity = int(topology.config['main']['thread_count'])
+    conn.send(('hello', '%s:%s' % (socket.gethostname(), os.getpid()), capacity))
+    _, main = conn.recv()
+    topology.config = {'main': main}
+    parse.config = topology.config
+
+    if main.get('filtered_commands'):
+        from .plan import CommandPlan
+        topology.plan = CommandPlan(filtered=True)
+
+    if main.get('preflight'):
+        from .connect import Preflight
+        topology.preflight = Preflight(timeout=float(main.get('probe_timeout', 3)))
+
+    # Local workers are daemon processes and cannot start a pool of their own
+    if main.get('parse_workers') and not multiprocessing.current_process().daemon:
+        from .parsepool import ParsePool
+        topology.parse_pool = ParsePool(int(main['parse_workers']), main)
+
+    # Stuck devices are given up on here, retries are left to the next crawl
+    if main.get('device_timeout'):
+        from .deadline import Watchdog
+        topology.watchdog = Watchdog(float(main['device_timeout']), close=topology.execute.close_session)
+
+    q = Queue()
+    out_q = Queue()
+    for i in range(capacity):
+        threading.Thread(target=topology.crawl_worker, daemon=True, \
+            kwargs={"q": q, "out_q": out_q, "username": username, "password": password}).start()
+
+    # Reader thread feeds q, the main thread sends results back
+    def reader():
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                msg = ('stop',)
+            if msg[0] == 'stop':
+                for i in range(capacity):
+                    q.put(None)
+                out_q.put(None)
+                return
+            for key, device in msg[1]:
+                q.put((key, unpack(device)))
+
+    threading.Thread(target=reader, daemon=True).start()
+
+    while True:
+        item = out_q.get()
+        if item is None:
+            break
+        key, nd = item
+        try:
+            conn.send(('result', key, [pack(n) for n in nd]))
+        except OSError:
+            break
+
+    conn.close()
+
+    # Credentials and timing profiles learned on this worker's devices
+    if topology.credentials:
+        topology.credentials.save()
+        topology.credentials.report()
+    if topology.profiles:
+        topology.profiles.save()
+        topology.profiles.report()
@@ -0,0 +1,211 @@
+'Connection Preflight Routines'
+import socket
+import asyncio
+import logging
+import selectors
+import threading
+from time import monotonic
+
+logger = logging.getLogger(__name__)
+
+
+def is_ipv4(host):
+    'True if host is an IPv4 address literal'
+
+    try:
+        socket.inet_pton(socket.AF_INET, host)
+    except OSError:
+        return False
+    return True
+
+
+class Preflight:
+    """ Cached DNS and a non-blocking TCP probe that races a device's hostname
+        against its IPv4 address, happy eyeballs style, so only the target that
+        answers first gets the SSH handshake. Names that don't resolve and
+        targets that don't answer are cached for the rest of the crawl. """
+
+    def __init__(self, port=22, timeout=3):
+        self.port = port
+        self.timeout = timeout
+        self.lock = threading.Lock()
+
+        # Hostname to address, None if the name did not resolve
+        self.dns = dict()
+
+        # Targets that did not answer the probe
+        self.unreachable = set()
+
+        self.probes = 0
+        self.avoided = 0
+
+    def candidates(self, dname, ipv4):
+        'Targets worth probing in preference order, device id first'
+
+        hosts = list()
+        for host in (dname, ipv4):
+            if host and host != 'Unknown' and host not in hosts:
+                if host in self.unreachable or self.dns.get(host, '') is None:
+                    with self.lock:
+                        self.avoided += 1
+                    logger.debug('Skipping cached unreachable target %s', host)
+                else:
+                    hosts.append(host)
+        return hosts
+
+    def resolve(self, host):
+        'Resolve host to an IPv4 address with caching, None if it does not resolve'
+
+        if is_ipv4(host):
+            return host
+        if host in self.dns:
+            return self.dns[host]
+
+        try:
+            addr = socket.getaddrinfo(host, self.port, socket.AF_INET, socket.SOCK_STREAM)[0][4][0]
+        except (OSError, UnicodeError):
+            logger.info('DNS lookup failed for %s', host)
+            addr = None
+        with self.lock:
+            self.dns[host] = addr
+        return addr
+
+    def pick(self, dname, ipv4):
+        """ Race TCP connects to the device id and IPv4 address, returns the
+            first target to answer or None if neither is reachable """
+
+        hosts = self.candidates(dname, ipv4)
+        sel = selectors.DefaultSelector()
+        socks = dict()
+        winner = None
+
+        try:
+            # Start address literals first so their probe runs during DNS lookups
+            for host in sorted(hosts, key=lambda h: not is_ipv4(h)):
+                addr = self.resolve(host)
+                if addr is None:
+                    continue
+                if addr in [socks[s][1] for s in socks]:
+                    continue
+                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                s.setblocking(False)
+                s.connect_ex((addr, self.port))
+                sel.register(s, selectors.EVENT_WRITE)
+                socks[s] = (host, addr)
+                with self.lock:
+                    self.probes += 1
+
+            deadline = monotonic() + self.timeout
+            answered = list()
+            while socks and not answered and monotonic() < deadline:
+                for key, _ in sel.select(timeout=max(0, deadline - monotonic())):
+                    s = key.fileobj
+                    sel.unregister(s)
+                    host, addr = socks.pop(s)
+                    if s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                        answered.append(host)
+                    else:
+                        self.mark_unreachable(host)
+                    s.close()
+
+            # Prefer the device id if both answered in the same round, and an
+            # address shared by both names is reached through the device id
+            for host in hosts:
+                if host in answered or (answered and self.dns.get(host) in answered):
+                    winner = host
+                    break
+
+            # Nothing answered before the deadline
+            if not answered:
+                for s in socks:
+                    self.mark_unreachable(socks[s][0])
+
+        finally:
+            for s in socks:
+                s.close()
+            sel.close()
+
+        if winner is None:
+            for host in hosts:
+                self.mark_unreachable(host)
+        return winner
+
+    async def apick(self, dname, ipv4):
+        'Asyncio version of pick() for the async engine'
+
+        hosts = self.candidates(dname, ipv4)
+        loop = asyncio.get_running_loop()
+        tasks = dict()
+        addrs = list()
+
+        # Same order and address dedupe as pick()
+        for host in sorted(hosts, key=lambda h: not is_ipv4(h)):
+            addr = await self.aresolve(loop, host)
+            if addr is None or addr in addrs:
+                continue
+            addrs.append(addr)
+            tasks[asyncio.ensure_future(self.aprobe(host, addr))] = host
+
+        winner = None
+        deadline = loop.time() + self.timeout
+        while tasks and winner is None:
+            done, _ = await asyncio.wait(tasks, timeout=max(0, deadline - loop.time()), \
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            answered = list()
+            for t in done:
+                host = tasks.pop(t)
+                if t.result():
+                    answered.append(host)
+            for host in hosts:
+                if host in answered or (answered and self.dns.get(host) in answered):
+                    winner = host
+                    break
+
+        for t in tasks:
+            t.cancel()
+        if winner is None:
+            for host in hosts:
+                self.mark_unreachable(host)
+        return winner
+
+    async def aresolve(self, loop, host):
+        'Asyncio version of resolve()'
+
+        if is_ipv4(host):
+            return host
+        if host not in self.dns:
+            try:
+                info = await loop.getaddrinfo(host, self.port, family=socket.AF_INET, \
+                                              type=socket.SOCK_STREAM)
+                self.dns[host] = info[0][4][0]
+            except (OSError, UnicodeError):
+                logger.info('DNS lookup failed for %s', host)
+                self.dns[host] = None
+        return self.dns[host]
+
+    async def aprobe(self, host, addr):
+        'TCP probe one target, returns True if it answered'
+
+        self.probes += 1
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(addr, self.port), self.timeout)
+        except (OSError, asyncio.TimeoutError):
+            self.mark_unreachable(host)
+            return False
+        writer.close()
+        return True
+
+    def mark_unreachable(self, host):
+        'Negative cache a target for the rest of the crawl'
+
+        with self.lock:
+            self.unreachable.add(host)
+        logger.debug('Marking %s unreachable', host)
+
+    def report(self):
+        'Log probe and cache statistics'
+
+        logger.info('Preflight: %s probes, %s unreachable targets, %s connection attempts avoided', \
+                    str(self.probes), str(len(self.unreachable)), str(self.avoided))
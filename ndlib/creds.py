@@ -0,0 +1,177 @@
+'Credential Sets'
+import os
+import re
+import json
+import fcntl
+import logging
+import threading
+from .connect import is_ipv4
+from .record import canonical
+
+logger = logging.getLogger(__name__)
+
+# Mapping kinds, in the order their best credential is tried. A device entry
+# holds the last credential that worked on it, the others count logins
+KINDS = ('device', 'subnet', 'pattern', 'platform')
+
+DIGITS_RE = re.compile(r'\d+')
+
+
+class AuthFailed(Exception):
+    'A device rejected the username and password'
+
+
+def name_pattern(name):
+    'Device name pattern shared by similar devices, digits become #, eg bldg#-sw#.domain.com'
+    return DIGITS_RE.sub('#', name.lower())
+
+
+class CredentialSet:
+    """ Ordered (name, username, password) credentials, tried in turn when a
+        device rejects a login. The credential that worked is learned per
+        device, /24 subnet, device name pattern and platform. A device tries
+        its own credential first on later runs, and new devices try the best
+        match from the other keys, so a region on its own TACACS source or
+        devices with local accounts cost one failed login to learn instead of
+        one per device.
+
+        The mapping holds credential names only, never passwords, and is kept
+        in learn_file across runs. """
+
+    def __init__(self, creds, learn_file=None):
+        self.creds = creds
+        self.names = [c[0] for c in creds]
+        self.learn_file = learn_file
+        self.lock = threading.Lock()
+
+        # {kind: {key: {credential name: logins}}}, and this run's additions
+        self.learned = {k: dict() for k in KINDS}
+        self.added = {k: dict() for k in KINDS}
+
+        self.failures = 0
+        self.avoided = 0
+
+        if learn_file and os.path.exists(learn_file):
+            with open(learn_file, 'r') as f:
+                saved = json.load(f)
+            for kind in KINDS:
+                self.learned[kind] = saved.get(kind, dict())
+            logger.info('Loaded learned credentials from %s', learn_file)
+
+    def keys(self, device, host):
+        'Mapping keys for a device as (kind, key) pairs'
+
+        keys = [('device', canonical(device['remote_device_id']))]
+        ip = device['ipv4'] if is_ipv4(device['ipv4']) else host
+        if is_ipv4(ip):
+            keys.append(('subnet', ip.rsplit('.', 1)[0] + '.0/24'))
+        keys.append(('pattern', name_pattern(device['remote_device_id'])))
+        if device['platform'] != 'Unknown':
+            keys.append(('platform', device['platform']))
+        return keys
+
+    def order(self, device, host):
+        'Credentials to try on a device, most likely first'
+
+        first = list()
+        with self.lock:
+            for kind, key in self.keys(device, host):
+                counts = self.learned[kind].get(key)
+                if counts:
+                    best = max(counts, key=counts.get)
+                    if best in self.names and best not in first:
+                        first.append(best)
+        names = first + [n for n in self.names if n not in first]
+        return [self.creds[self.names.index(n)] for n in names]
+
+    def login(self, device, host, connect):
+        'Open a session with connect(username, password), moving to the next credential on AuthFailed'
+
+        failed = 0
+        error = AuthFailed('No credentials to try on ' + device['remote_device_id'])
+        for name, username, password in self.order(device, host):
+            try:
+                session = connect(username, password)
+            except AuthFailed as e:
+                failed += 1
+                error = e
+                logger.info('Login as %s (%s) failed on %s', username, name, device['remote_device_id'])
+                continue
+            self.learn(device, host, name, failed)
+            return session
+        self.learn(device, host, None, failed)
+        raise error
+
+    async def alogin(self, device, host, connect):
+        'login() for the async engine, connect is a coroutine function'
+
+        failed = 0
+        error = AuthFailed('No credentials to try on ' + device['remote_device_id'])
+        for name, username, password in self.order(device, host):
+            try:
+                session = await connect(username, password)
+            except AuthFailed as e:
+                failed += 1
+                error = e
+                logger.info('Login as %s (%s) failed on %s', username, name, device['remote_device_id'])
+                continue
+            self.learn(device, host, name, failed)
+            return session
+        self.learn(device, host, None, failed)
+        raise error
+
+    def learn(self, device, host, name, failed):
+        """ Record a login. Failures the configured order would have made
+            before reaching the working credential, less the ones actually
+            made, were avoided by the learned order """
+
+        with self.lock:
+            self.failures += failed
+            if name is None:
+                return
+            self.avoided += max(self.names.index(name) - failed, 0)
+            for kind, key in self.keys(device, host):
+                for mapping in (self.learned, self.added):
+                    if kind == 'device':
+                        mapping[kind][key] = {name: 1}
+                        continue
+                    counts = mapping[kind].setdefault(key, dict())
+                    counts[name] = counts.get(name, 0) + 1
+
+    def save(self):
+        """ Add this run's logins to learn_file. The file is read again and
+            replaced under a lock file, so worker processes sharing it don't
+            drop each other's logins """
+
+        if not self.learn_file:
+            return
+
+        with open(self.learn_file + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            saved = dict()
+            if os.path.exists(self.learn_file):
+                with open(self.learn_file, 'r') as f:
+                    saved = json.load(f)
+            with self.lock:
+                for kind in KINDS:
+                    mapping = saved.setdefault(kind, dict())
+                    for key, counts in self.added[kind].items():
+                        if kind == 'device':
+                            mapping[key] = counts
+                            continue
+                        current = mapping.setdefault(key, dict())
+                        for name, n in counts.items():
+                            current[name] = current.get(name, 0) + n
+                    self.added[kind] = dict()
+
+            tmp = '%s.%s.tmp' % (self.learn_file, str(os.getpid()))
+            with open(tmp, 'w') as f:
+                json.dump(saved, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.learn_file)
+
+    def report(self):
+        'Log failed logins and those the learned order avoided'
+
+        logger.warning('Credentials: %s failed logins, %s avoided by learned credential order', \
+                       str(self.failures), str(self.avoided))
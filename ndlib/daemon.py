@@ -0,0 +1,266 @@
+'Topology Daemon and Query API'
+import os
+import csv
+import json
+import logging
+import threading
+from time import time, monotonic
+from collections import OrderedDict
+from urllib.parse import unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from .graph import Topology
+from .record import canonical
+from .output import NEI_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Encoded responses kept per topology version
+CACHE_SIZE = 10000
+
+
+class Snapshot:
+    """ One crawl's topology loaded from nei_file and dev_file, never changed
+        after loading. Requests take the current snapshot once, so a recrawl
+        swapping in a new one never shows a request half of each. """
+
+    def __init__(self, version, topo, devices):
+        self.version = version
+        self.topo = topo
+        self.devices = devices
+        self.loaded = time()
+
+        # Unique across daemon restarts, versions start over at 1
+        self.etag = '"%s-%s"' % (str(version), str(int(self.loaded)))
+
+    @classmethod
+    def load(cls, nei_file, dev_file, version):
+        'Build the graph and device index from the output files'
+
+        topo = Topology.load(nei_file)
+        devices = dict()
+        with open(dev_file, 'r') as f:
+            for row in csv.DictReader(f):
+                devices[canonical(row['device_id'])] = row
+                topo.add_device(row['device_id'])
+        return cls(version, topo, devices)
+
+    def device(self, name):
+        'Device row with its neighbor count, None if unknown'
+
+        key = canonical(name)
+        if key not in self.topo.adj:
+            return None
+        d = self.devices.get(key) or {'device_id': self.topo.names[key]}
+        return dict(d, neighbors=len(self.topo.adj[key]))
+
+    def neighbors(self, name):
+        'Links of a device, oriented so local_device_id is the device, None if unknown'
+
+        key = canonical(name)
+        if key not in self.topo.adj:
+            return None
+
+        local = self.devices.get(key, dict())
+        links = list()
+        for nkey, records in self.topo.adj[key].items():
+            remote = self.devices.get(nkey, dict())
+            for n in records:
+                link = {f: n[f] for f in NEI_FIELDS}
+                if canonical(n['local_device_id']) != key:
+                    link['local_device_id'], link['remote_device_id'] = n['remote_device_id'], n['local_device_id']
+                    link['local_int'], link['remote_int'] = n['remote_int'], n['local_int']
+                    link['description'] = ''
+                for f in ('ipv4', 'platform', 'os'):
+                    if f in remote:
+                        link[f] = remote[f]
+                if 'distance' in local:
+                    link['distance'] = local['distance']
+                links.append(link)
+        return links
+
+    def path(self, a, b):
+        'Shortest path as a list of hops with the links to the next hop, None if not connected'
+
+        keys = self.topo.path(a, b)
+        if keys is None:
+            return None
+
+        hops = list()
+        for i, key in enumerate(keys):
+            hop = {'device_id': self.topo.names[key]}
+            if i + 1 < len(keys):
+                hop['links'] = [[n['local_int'], n['remote_int']] if canonical(n['local_device_id']) == key \
+                                else [n['remote_int'], n['local_int']] \
+                                for n in self.topo.adj[key][keys[i + 1]]]
+            hops.append(hop)
+        return hops
+
+    def status(self):
+        return {'version': self.version, 'loaded': round(self.loaded, 3), \
+                'devices': len(self.topo.adj), 'links': len(self.topo.links)}
+
+
+class TopologyAPI:
+    """ Answers GET requests from the current snapshot. Encoded responses are
+        cached by topology version and path, so repeated lookups between
+        crawls skip the query and the JSON encoding. """
+
+    def __init__(self):
+        self.snapshot = None
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.crawling = False
+        self.next_crawl = None
+        self.last_error = None
+
+    def swap(self, snapshot):
+        'Make snapshot the current topology'
+
+        with self.lock:
+            self.snapshot = snapshot
+            self.cache.clear()
+        logger.warning('Serving topology version %s: %s devices, %s links', str(snapshot.version), \
+                       str(len(snapshot.topo.adj)), str(len(snapshot.topo.links)))
+
+    def get(self, path):
+        'Returns (status, body bytes, ETag) for a request path'
+
+        snap = self.snapshot
+        if path == '/status':
+            body = snap.status() if snap else {'version': None}
+            body.update(crawling=self.crawling, next_crawl=self.next_crawl, last_error=self.last_error)
+            return 200, json.dumps(body).encode(), None
+        if snap is None:
+            return 503, json.dumps({'error': 'No topology loaded yet'}).encode(), None
+
+        ckey = (snap.version, path)
+        with self.lock:
+            cached = self.cache.get(ckey)
+            if cached:
+                self.cache.move_to_end(ckey)
+                return cached + (snap.etag,)
+
+        status, body = self.query(snap, path)
+        result = (status, json.dumps(body).encode())
+
+        with self.lock:
+            if self.snapshot is snap:
+                self.cache[ckey] = result
+                if len(self.cache) > CACHE_SIZE:
+                    self.cache.popitem(last=False)
+        return result + (snap.etag,)
+
+    def query(self, snap, path):
+        'Run a lookup on a snapshot, returns (status, body)'
+
+        parts = [unquote(p) for p in path.strip('/').split('/')]
+        result = None
+        if len(parts) == 2 and parts[0] == 'device':
+            result = snap.device(parts[1])
+        elif len(parts) == 2 and parts[0] == 'neighbors':
+            result = snap.neighbors(parts[1])
+        elif len(parts) == 3 and parts[0] == 'path':
+            result = snap.path(parts[1], parts[2])
+        else:
+            return 404, {'error': 'Unknown request, use /device/<name>, /neighbors/<name>, ' \
+                         '/path/<from>/<to> or /status'}
+
+        if result is None:
+            return 404, {'error': 'Not found: ' + '/'.join(parts[1:])}
+        return 200, result
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    'JSON GET requests, tagged with the topology version'
+
+    def do_GET(self):
+        api = self.server.api
+        path = self.path.split('?', 1)[0]
+        status, body, etag = api.get(path)
+
+        if etag and status == 200 and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug('%s %s', self.address_string(), format % args)
+
+
+class Daemon:
+    """ Serves the topology API on address and runs crawl() every interval
+        seconds, loading nei_file and dev_file into a new snapshot after each
+        crawl. The files from the last run are served at startup, and the first
+        crawl is due interval seconds after nei_file was written. A failed
+        crawl is logged and the previous topology stays up. An interval of 0
+        serves the files without crawling. """
+
+    def __init__(self, crawl, nei_file, dev_file, address, interval=0):
+        self.crawl = crawl
+        self.nei_file = nei_file
+        self.dev_file = dev_file
+        self.interval = interval
+        self.version = 0
+        self.api = TopologyAPI()
+        self.stopped = threading.Event()
+
+        self.server = ThreadingHTTPServer(address, RequestHandler)
+        self.server.daemon_threads = True
+        self.server.api = self.api
+        self.address = self.server.server_address
+
+    def load(self):
+        'Load the output files into a new snapshot and swap it in'
+
+        start = monotonic()
+        self.version += 1
+        snapshot = Snapshot.load(self.nei_file, self.dev_file, self.version)
+        self.api.swap(snapshot)
+        logger.info('Loaded topology version %s in %.2fs', str(self.version), monotonic() - start)
+
+    def run(self):
+        'Serve and recrawl until stop() or Ctrl-C'
+
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        logger.warning('Topology API listening on http://%s:%s/', *self.address[:2])
+
+        due = time()
+        if os.path.exists(self.nei_file) and os.path.exists(self.dev_file):
+            self.load()
+            due = os.path.getmtime(self.nei_file) + self.interval
+
+        try:
+            while self.interval:
+                self.api.next_crawl = round(due, 3)
+                if self.stopped.wait(max(due - time(), 0)):
+                    break
+                self.api.crawling = True
+                try:
+                    self.crawl()
+                    self.load()
+                    self.api.last_error = None
+                except (Exception, SystemExit) as e:
+                    logger.exception('Recrawl failed, still serving version %s', str(self.version))
+                    self.api.last_error = str(e) or type(e).__name__
+                finally:
+                    self.api.crawling = False
+                due = time() + self.interval
+            self.stopped.wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,173 @@
+'SQLite Topology Database'
+import json
+import sqlite3
+import logging
+from time import monotonic
+from .record import Neighbor, FIELDS, canonical
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ', '.join(FIELDS)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS devices (key TEXT PRIMARY KEY, dist INTEGER, %s);
+CREATE INDEX IF NOT EXISTS devices_id ON devices (remote_device_id);
+CREATE TABLE IF NOT EXISTS neighbors (lkey TEXT, %s);
+CREATE INDEX IF NOT EXISTS neighbors_link ON neighbors (local_device_id, remote_device_id, local_int, remote_int);
+CREATE INDEX IF NOT EXISTS neighbors_lkey ON neighbors (lkey);
+CREATE TABLE IF NOT EXISTS visited (key TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS frontier (seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT UNIQUE);
+""" % (COLUMNS, COLUMNS)
+
+TABLES = ('meta', 'devices', 'neighbors', 'visited', 'frontier')
+
+
+class TopologyDB:
+    """ Crawl checkpoint in SQLite. Device registry, neighbors, visited set
+        and frontier are written from the merge loop in batches, each batch in
+        one transaction, so the database always matches a point in the crawl
+        where every completed device is fully recorded. A resumed crawl picks
+        up the frontier and never re-contacts a completed device. """
+
+    def __init__(self, path, resume=False, batch=500, interval=1.0):
+        self.path = path
+        self.resume = resume
+        self.batch = batch
+        self.interval = interval
+
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+        self.clear_pending()
+
+    def clear_pending(self):
+        'Reset the uncommitted batch'
+
+        self.neighbors = list()
+        self.devices = dict()
+        self.visited = list()
+        self.queued = list()
+        self.done = list()
+        self.count = 0
+        self.last = monotonic()
+
+    def begin(self, cs, seeds, seed_os):
+        'Restore cs from the database when resuming, otherwise start fresh from seeds'
+
+        if self.resume:
+            if self.load(cs):
+                return
+            logger.warning('Nothing to resume in %s, starting a new crawl', self.path)
+
+        with self.conn:
+            for t in TABLES:
+                self.conn.execute('DELETE FROM ' + t)
+
+        for s in seeds:
+            cs.add_seed(s, seed_os)
+
+        self.conn.execute('INSERT INTO meta VALUES (?, ?)', ('seeds', json.dumps(seeds)))
+        for key in cs.devices:
+            self.devices[key] = self.device_row(cs, key)
+        self.visited.extend(cs.visited)
+        self.queued.extend(cs.frontier)
+        self.flush(cs)
+
+    def load(self, cs):
+        'Load a saved crawl into cs, returns False if there is none'
+
+        meta = dict(self.conn.execute('SELECT name, value FROM meta'))
+        if 'seeds' not in meta:
+            return False
+
+        for s in json.loads(meta['seeds']):
+            cs.seeds.append(s)
+            cs.graph.add_device(s)
+        cs.crawl_count = cs.completed = int(meta.get('crawl_count', 0))
+
+        for row in self.conn.execute('SELECT key, dist, %s FROM devices' % COLUMNS):
+            cs.devices[row[0]] = Neighbor(*row[2:-1], logged_in=bool(row[-1]))
+            if row[1] is not None:
+                cs.distances[row[0]] = row[1]
+
+        for row in self.conn.execute('SELECT %s FROM neighbors' % COLUMNS):
+            n = Neighbor(*row[:-1], logged_in=bool(row[-1]))
+            cs.neighbors.append(n)
+            cs.graph.add(n)
+
+        cs.visited.update(r[0] for r in self.conn.execute('SELECT key FROM visited'))
+        for (key,) in self.conn.execute('SELECT key FROM frontier ORDER BY seq'):
+            cs.enqueued.add(key)
+            cs.frontier.push(key, cs.score(key))
+
+        logger.warning('Resuming crawl: %s devices done, %s queued, %s neighbors', \
+                       str(cs.crawl_count), str(len(cs.frontier)), str(len(cs.neighbors)))
+        return True
+
+    def device_row(self, cs, key):
+        'Registry entry for key as a devices row'
+
+        d = cs.devices[key]
+        return (key, cs.distances.get(key)) + tuple(getattr(d, f) for f in FIELDS)
+
+    def record(self, cs, key, nd, new, links):
+        'Queue one completed device and its new links for the next batch, commits when the batch is due'
+
+        neighbors = [(canonical(n.local_device_id),) + tuple(getattr(n, f) for f in FIELDS) for n in links]
+        devices = {key: self.device_row(cs, key)}
+        for n in nd:
+            rkey = canonical(n.remote_device_id)
+            if rkey in cs.devices:
+                devices[rkey] = self.device_row(cs, rkey)
+
+        self.neighbors.extend(neighbors)
+        self.devices.update(devices)
+        self.visited.extend(canonical(n.remote_device_id) for n in nd)
+        self.queued.extend(new)
+        self.done.append(key)
+
+        self.count += 1
+        if self.count >= self.batch or monotonic() - self.last >= self.interval:
+            self.flush(cs)
+
+    def retry(self, cs, keys):
+        'Put completed devices back in the frontier table and commit, so a resume retries them'
+
+        keys = set(keys)
+        self.done = [k for k in self.done if k not in keys]
+        self.queued.extend(keys)
+        self.flush(cs)
+
+    def flush(self, cs):
+        'Commit the pending batch in one transaction'
+
+        with self.conn:
+            self.conn.executemany('INSERT INTO neighbors VALUES (?%s)' % (', ?' * len(FIELDS)), \
+                                  self.neighbors)
+            self.conn.executemany('INSERT OR REPLACE INTO devices VALUES (?, ?%s)' % (', ?' * len(FIELDS)), \
+                                  self.devices.values())
+            self.conn.executemany('INSERT OR IGNORE INTO visited VALUES (?)', ((k,) for k in self.visited))
+            # Queued before done, a device can be both within one batch
+            self.conn.executemany('INSERT OR IGNORE INTO frontier (key) VALUES (?)', ((k,) for k in self.queued))
+            self.conn.executemany('DELETE FROM frontier WHERE key = ?', ((k,) for k in self.done))
+            # Devices done, in flight devices are still in the frontier table
+            self.conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('crawl_count', \
+                              str(cs.crawl_count - len(cs.inflight))))
+
+        logger.debug('Committed %s devices to %s', str(self.count), self.path)
+        self.clear_pending()
+
+    def close(self, cs):
+        'Commit what is left, store final distances and close'
+
+        self.flush(cs)
+        with self.conn:
+            self.conn.executemany('UPDATE devices SET dist = ? WHERE key = ?', \
+                                  ((d, k) for k, d in cs.distances.items()))
+            self.conn.executemany('UPDATE neighbors SET distance = ? WHERE lkey = ?', \
+                                  ((d, k) for k, d in cs.distances.items()))
+            self.conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('complete', '1'))
+        self.conn.close()
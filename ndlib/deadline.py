@@ -0,0 +1,207 @@
+'Per Device Deadlines'
+import heapq
+import logging
+import threading
+from time import monotonic
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(Exception):
+    'A device ran over its time budget'
+
+
+class Deadline:
+    'Time budget for one device, with the session to tear down when it runs out'
+
+    __slots__ = ('watchdog', 'key', 'expires', 'callback', 'session', 'expired', 'done')
+
+    def __init__(self, watchdog, key, expires, callback):
+        self.watchdog = watchdog
+        self.key = key
+        self.expires = expires
+        self.callback = callback
+        self.session = None
+        self.expired = False
+        self.done = False
+
+    def attach(self, session):
+        'Hand the open session to the watchdog, closes it and raises if already expired'
+
+        with self.watchdog.lock:
+            if not self.expired:
+                self.session = session
+                return
+        self.watchdog.close(session)
+        raise DeadlineExceeded('%s ran over %ss' % (self.key, str(self.watchdog.budget)))
+
+    def check(self):
+        'Raise if the watchdog expired the device, called between commands'
+
+        if self.expired:
+            raise DeadlineExceeded('%s ran over %ss' % (self.key, str(self.watchdog.budget)))
+
+    def remaining(self):
+        'Seconds left in the budget, raises if there are none'
+
+        left = self.expires - monotonic()
+        if self.expired or left <= 0:
+            raise DeadlineExceeded('%s ran over %ss' % (self.key, str(self.watchdog.budget)))
+        return left
+
+
+class Watchdog:
+    """ Enforces an overall time budget per device across connect, commands
+        and parse. One thread sleeps until the earliest deadline; a device
+        that runs over has its session closed with close(session) and its
+        callback run, which lets the engine report the device right away
+        instead of waiting on the stuck worker. Connects have no session to
+        close yet, the engine bounds them with remaining(). Late results are
+        discarded.
+
+        Timed out devices are recorded, and up to retries more attempts are
+        handed back by retry() once their backoff has passed. Devices timing
+        out while a round waits go in the next one, and the backoff doubles
+        each round. """
+
+    def __init__(self, budget, retries=0, backoff=30.0, close=None):
+        self.budget = budget
+        self.retries = retries
+        self.backoff = backoff
+        self.close = close or (lambda session: session.disconnect())
+
+        self.lock = threading.Lock()
+        self.wake = threading.Condition(self.lock)
+        self.heap = list()
+        self.seq = 0
+        self.thread = None
+        self.stopped = False
+
+        # Device key to times timed out, devices due a retry, the round of
+        # retries waiting out its backoff and when it ends, and devices that
+        # finished on a retry
+        self.timed_out = dict()
+        self.due = list()
+        self.waiting = list()
+        self.retry_at = None
+        self.recovered = set()
+        self.rounds = 0
+
+    def start(self, key, callback=None):
+        'Start the clock on a device, callback(key) runs on the watchdog thread if it expires'
+
+        d = Deadline(self, key, monotonic() + self.budget, callback)
+        with self.lock:
+            self.seq += 1
+            heapq.heappush(self.heap, (d.expires, self.seq, d))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            self.wake.notify()
+        return d
+
+    def finish(self, d):
+        'Stop the clock, returns False if the device ran over and its result must be dropped'
+
+        with self.lock:
+            # Past due but not yet popped, the watchdog thread reports it
+            if d.expired or monotonic() >= d.expires:
+                return False
+            d.done = True
+            d.session = None
+        self.passed(d.key)
+        return True
+
+    def passed(self, key):
+        'Record a device that finished within its budget'
+
+        if key in self.timed_out:
+            self.recovered.add(key)
+
+    def run(self):
+        'Expire deadlines in order, sleeping until the next one is due'
+
+        while True:
+            with self.lock:
+                while True:
+                    if self.stopped:
+                        return
+                    while self.heap and self.heap[0][2].done:
+                        heapq.heappop(self.heap)
+                    if not self.heap:
+                        self.wake.wait()
+                        continue
+                    wait = self.heap[0][0] - monotonic()
+                    if wait > 0:
+                        self.wake.wait(wait)
+                        continue
+                    d = heapq.heappop(self.heap)[2]
+                    d.expired = True
+                    session, d.session = d.session, None
+                    break
+
+            self.expire(d.key)
+            if session is not None:
+                try:
+                    self.close(session)
+                except Exception as e:
+                    logger.debug('Error closing session on %s: %s', d.key, str(e))
+            if d.callback:
+                d.callback(d.key)
+
+    def stop(self):
+        'End the watchdog thread, deadlines still pending never expire'
+
+        with self.lock:
+            self.stopped = True
+            self.wake.notify()
+
+    def expire(self, key):
+        'Record a device that ran over its budget'
+
+        with self.lock:
+            count = self.timed_out.get(key, 0) + 1
+            self.timed_out[key] = count
+            if count <= self.retries:
+                self.due.append(key)
+        logger.warning('%s ran over device_timeout (%ss), giving up on it', key, str(self.budget))
+
+    def retry(self, merged):
+        """ Timed out devices whose backoff has passed. A round waits for
+            merged(key) to be True for its devices, so none is retried before
+            the crawl has taken in its timeout """
+
+        now = monotonic()
+        with self.lock:
+            keys = list()
+            if self.waiting and now >= self.retry_at:
+                keys, self.waiting = self.waiting, list()
+
+            if self.due and not self.waiting:
+                self.waiting = [k for k in self.due if merged(k)]
+                self.due = [k for k in self.due if not merged(k)]
+                if self.waiting:
+                    delay = self.backoff * 2 ** self.rounds
+                    self.rounds += 1
+                    self.retry_at = now + delay
+                    logger.info('Retrying %s timed out devices in %ss', str(len(self.waiting)), str(delay))
+        return keys
+
+    def retry_wait(self):
+        'Seconds until the waiting round of retries is due, None if there is none'
+
+        with self.lock:
+            if not self.waiting:
+                return None
+            return max(self.retry_at - monotonic(), 0)
+
+    def report(self):
+        'Log devices that timed out and whether a retry got them'
+
+        if not self.timed_out:
+            return
+        failed = sorted(set(self.timed_out) - self.recovered)
+        logger.warning('Timed out: %s devices, %s recovered on retry', str(len(self.timed_out)), \
+                       str(len(self.recovered)))
+        if failed:
+            logger.warning('Gave up on: %s', ', '.join(failed))
@@ -0,0 +1,194 @@
+'Snapshot Diff'
+import csv
+import json
+import logging
+from operator import itemgetter
+from hashlib import blake2b
+from .record import canonical, normalize_int
+
+logger = logging.getLogger(__name__)
+
+# Neighbor file columns that identify a link
+LINK_FIELDS = ('local_device_id', 'local_int', 'remote_device_id', 'remote_int')
+
+# Device fields compared between snapshots
+DEV_FIELDS = ('device_id', 'ipv4', 'platform', 'os')
+
+
+def rows(path, fields):
+    """ Tuples of fields from each CSV row, without building a dict per row.
+        Raises ValueError naming the file if a field is missing from the
+        header or a row is too short to have it """
+
+    with open(path, 'r', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if not header:
+            raise ValueError('%s: no CSV header' % path)
+        missing = [f for f in fields if f not in header]
+        if missing:
+            raise ValueError('%s: missing columns %s' % (path, ', '.join(missing)))
+
+        cols = [header.index(f) for f in fields]
+        width = max(cols) + 1
+        get = itemgetter(*cols)
+        for r in reader:
+            if len(r) < width:
+                if not r:
+                    continue
+                raise ValueError('%s: line %s has %s of %s columns' % \
+                                 (path, str(reader.line_num), str(len(r)), str(len(header))))
+            yield get(r)
+
+
+def link_key(n):
+    """ Canonical link key for a LINK_FIELDS tuple, both endpoints as (device,
+        normalized interface) in sorted order so the link matches from either
+        side and in either row order """
+
+    a = (canonical(n[0]), normalize_int(n[1]))
+    b = (canonical(n[2]), normalize_int(n[3]))
+    return (a, b) if a <= b else (b, a)
+
+
+def digest(key):
+    'Eight byte hash of a link key, for indexes too large to hold the keys'
+
+    return int.from_bytes(blake2b(repr(key).encode(), digest_size=8).digest(), 'little')
+
+
+def link_change(change, n, old=None):
+    'Change record for a neighbor row, old is the previous row of a moved link'
+
+    c = {'change': change, 'kind': 'link'}
+    c.update(zip(LINK_FIELDS, n))
+    if old is not None:
+        # Old interfaces in the same orientation as the new row
+        if canonical(old[0]) == canonical(n[0]):
+            c['old_local_int'], c['old_remote_int'] = old[1], old[3]
+        else:
+            c['old_local_int'], c['old_remote_int'] = old[3], old[1]
+    return c
+
+
+def device_change(change, d, old=None):
+    'Change record for a device row, old holds the previous values of changed fields'
+
+    c = {'change': change, 'kind': 'device'}
+    c.update(zip(DEV_FIELDS, d))
+    if old:
+        c['old'] = old
+    return c
+
+
+def diff_links(old_file, new_file):
+    """ Added, removed and moved links between two neighbor files, in one pass
+        over each. Removed and added links between the same two devices are
+        paired up as interface moves """
+
+    index = dict()
+    for n in rows(old_file, LINK_FIELDS):
+        index.setdefault(link_key(n), n)
+
+    added = list()
+    seen = set()
+    for n in rows(new_file, LINK_FIELDS):
+        key = link_key(n)
+        if key in seen:
+            continue
+        seen.add(key)
+        if index.pop(key, None) is None:
+            added.append((key, n))
+    removed = index
+
+    # Pair up by device pair
+    gone = dict()
+    for key, n in removed.items():
+        gone.setdefault((key[0][0], key[1][0]), list()).append(key)
+
+    changes = list()
+    for key, n in added:
+        pair = (key[0][0], key[1][0])
+        if gone.get(pair):
+            changes.append(link_change('moved', n, removed.pop(gone[pair].pop())))
+        else:
+            changes.append(link_change('added', n))
+    for n in removed.values():
+        changes.append(link_change('removed', n))
+    return changes
+
+
+def stream_links(old_file, new_file):
+    """ Added and removed links as a generator, holding only an eight byte
+        hash per old link. The new file is read once and added links are
+        yielded as they are found, then the old file is read a second time
+        for the removed ones. Moves are reported as a removed and an added
+        link """
+
+    index = set()
+    for n in rows(old_file, LINK_FIELDS):
+        index.add(digest(link_key(n)))
+
+    seen = set()
+    for n in rows(new_file, LINK_FIELDS):
+        h = digest(link_key(n))
+        if h in seen:
+            continue
+        seen.add(h)
+        if h in index:
+            index.discard(h)
+        else:
+            yield link_change('added', n)
+    del seen
+
+    for n in rows(old_file, LINK_FIELDS):
+        h = digest(link_key(n))
+        if h in index:
+            index.discard(h)
+            yield link_change('removed', n)
+
+
+def diff_devices(old_file, new_file):
+    'Added, removed and changed devices between two device files'
+
+    index = dict()
+    for d in rows(old_file, DEV_FIELDS):
+        index[canonical(d[0])] = d
+
+    changes = list()
+    for d in rows(new_file, DEV_FIELDS):
+        old = index.pop(canonical(d[0]), None)
+        if old is None:
+            changes.append(device_change('added', d))
+            continue
+        if old[1:] != d[1:]:
+            was = {f: old[i] for i, f in enumerate(DEV_FIELDS) if i and old[i] != d[i]}
+            changes.append(device_change('changed', d, was))
+    for d in index.values():
+        changes.append(device_change('removed', d))
+    return changes
+
+
+def write_diff(changes, out):
+    'Write change records as JSON lines, returns counts per kind and change'
+
+    counts = dict()
+    for c in changes:
+        out.write(json.dumps(c) + '\n')
+        k = c['kind'] + ' ' + c['change']
+        counts[k] = counts.get(k, 0) + 1
+    return counts
+
+
+def diff(old_nei, new_nei, out, old_dev=None, new_dev=None, stream=False):
+    """ Diff two snapshots to out as JSON lines, devices only when both device
+        files are given. Returns counts per kind and change """
+
+    if stream:
+        counts = write_diff(stream_links(old_nei, new_nei), out)
+    else:
+        counts = write_diff(diff_links(old_nei, new_nei), out)
+    if old_dev and new_dev:
+        for k, v in write_diff(diff_devices(old_dev, new_dev), out).items():
+            counts[k] = v
+    return counts
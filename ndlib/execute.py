@@ -2,34 +2,78 @@
 import logging
 import re
 from time import sleep
-from netmiko import ConnectHandler
+from . import timing
+from .creds import AuthFailed
+from .profiles import DELAY_FACTOR, ReadTimedOut
 
 logger = logging.getLogger(__name__)
 
-def get_session(host, platform, username, password):
-    """ Get an SSH session on device """
+def get_session(host, platform, username, password, dname=None, delay_factor=DELAY_FACTOR, limit=None):
+    """ Get an SSH session on device, timings are recorded under dname. The
+        TCP, banner, auth and read timeouts are capped at limit seconds """
 
-    net_connect = ConnectHandler(device_type=platform,
-                                 ip=host,
-                                 global_delay_factor=0.2,
-                                 username=username,
-                                 password=password,
-                                 timeout=20)
+    # Loaded on first connect so offline commands never import the SSH stack
+    from netmiko import ConnectHandler, NetmikoAuthenticationException
 
-    net_connect.enable()
+    dname = dname or host
+
+    timeouts = {'timeout': 20}
+    if limit is not None:
+        timeouts = {'timeout': min(20, limit), 'conn_timeout': min(10, limit), \
+                    'banner_timeout': min(15, limit), 'auth_timeout': limit}
+
+    with timing.phase(dname, 'connect'):
+        try:
+            net_connect = ConnectHandler(device_type=platform,
+                                         ip=host,
+                                         global_delay_factor=delay_factor,
+                                         username=username,
+                                         password=password,
+                                         **timeouts)
+        except NetmikoAuthenticationException as e:
+            raise AuthFailed(str(e))
+
+    with timing.phase(dname, 'enable'):
+        net_connect.enable()
 
     return net_connect
 
+def close_session(session):
+    """ Tear down a session from another thread without the exit handshake,
+        blocked reads on it fail instead of waiting out their timeout """
+
+    conn = getattr(session, 'remote_conn_pre', None)
+    if conn is None:
+        session.disconnect()
+        return
+    conn.close()
+
 def send_command_timing(session, cmd, delay_factor=1, host=''):
     """ Send command and return results as list """
 
     logger.debug('Executing Command on %s: %s', host, cmd)
-    results = session.send_command_timing(cmd, delay_factor=delay_factor)
+    with timing.phase(host, 'command'):
+        results = session.send_command_timing(cmd, delay_factor=delay_factor)
     return results.split('\n')
 
-def send_command(session, cmd, host=''):
-    """ Send command and return results as list """
+def send_command(session, cmd, host='', read_timeout=None):
+    """ Send command and return results as list, raises ReadTimedOut if
+        the prompt doesn't come back within read_timeout seconds """
 
     logger.debug('Executing Command on %s: %s', host, cmd)
-    results = session.send_command(cmd)
+    with timing.phase(host, 'command'):
+        if read_timeout is None:
+            results = session.send_command(cmd)
+        else:
+            from netmiko import ReadTimeout
+            try:
+                results = session.send_command(cmd, read_timeout=read_timeout)
+            except ReadTimeout as e:
+                raise ReadTimedOut(str(e))
     return results.split('\n')
+
+def clear_session(session, read_timeout):
+    """ Read and drop whatever is left of a command that timed out, up to
+        the next prompt, so the session can be reused """
+
+    session.read_until_prompt(read_timeout=read_timeout)
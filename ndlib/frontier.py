@@ -0,0 +1,107 @@
+'Crawl Frontier'
+import re
+import heapq
+import logging
+from itertools import count
+
+logger = logging.getLogger(__name__)
+
+# Platform classes, crawled in this order at the same distance
+CORE, DIST, ACCESS = 0, 1, 2
+
+# Default platform regexes for the core and distribution classes
+CORE_PLATFORMS = r'N7K|N77|N9K|N5K|C65\d\d|C68\d\d|C9[56]\d\d|ASR'
+DIST_PLATFORMS = r'N3K|N56|C45\d\d|C94\d\d'
+
+# Times seen as a neighbor that still improve a device's score
+MAX_SEEN = 4
+
+
+class Frontier:
+    """ Devices waiting to be scraped, lowest score first. A heap with lazy
+        deletion: lowering the score of a queued device pushes a new entry
+        and marks the old one stale, stale entries are skipped when they come
+        to the top. Pushing a device that is already queued at the same or a
+        better score does nothing. Equal scores come out in arrival order. """
+
+    def __init__(self):
+        self.heap = list()
+        self.entries = dict()
+        self.seq = count()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def push(self, key, score):
+        'Queue key at score or lower its score, returns False if it was already queued at least as well'
+
+        entry = self.entries.get(key)
+        if entry is not None:
+            if score >= entry[0]:
+                return False
+            entry[2] = None
+            entry = [score, entry[1], key]
+        else:
+            entry = [score, next(self.seq), key]
+        self.entries[key] = entry
+        heapq.heappush(self.heap, entry)
+        return True
+
+    def pop(self):
+        'Remove and return the key with the lowest score'
+
+        while self.heap:
+            key = heapq.heappop(self.heap)[2]
+            if key is not None:
+                del self.entries[key]
+                return key
+        raise IndexError('pop from an empty frontier')
+
+    def score(self, key):
+        'Current score of a queued key'
+        return self.entries[key][0]
+
+
+class Priority:
+    """ Scoring policy for the frontier, lower is crawled first. Starts from
+        the provisional BFS distance, adds two per platform class so core and
+        distribution switches a few hops further out still come before access
+        switches, takes off half a point per time the device was seen as a
+        neighbor (up to MAX_SEEN) and four for devices matching the optional
+        user regex. """
+
+    def __init__(self, core=CORE_PLATFORMS, dist=DIST_PLATFORMS, regex=None):
+        self.core = re.compile(core) if core else None
+        self.dist = re.compile(dist) if dist else None
+        self.regex = re.compile(regex) if regex else None
+
+    @classmethod
+    def from_config(cls, main):
+        'Policy from the priority_* options in the main config section'
+
+        return cls(core=main.get('priority_core') or CORE_PLATFORMS, \
+                   dist=main.get('priority_dist') or DIST_PLATFORMS, \
+                   regex=main.get('priority_regex') or None)
+
+    def platform_class(self, platform):
+        'Platform class of a device, ACCESS when unknown'
+
+        if self.core and self.core.search(platform):
+            return CORE
+        if self.dist and self.dist.search(platform):
+            return DIST
+        return ACCESS
+
+    def score(self, device, distance, seen=1):
+        'Score a device Neighbor entry at a provisional distance'
+
+        score = distance + 2 * self.platform_class(device.platform) - 0.5 * min(seen, MAX_SEEN)
+        if self.regex and self.regex.search(device.remote_device_id):
+            score -= 4
+        return score
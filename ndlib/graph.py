@@ -0,0 +1,138 @@
+'Topology Graph'
+import csv
+import logging
+from collections import deque
+from .record import Neighbor, canonical, normalize_int
+
+logger = logging.getLogger(__name__)
+
+
+class Topology:
+    """ Undirected topology graph built from neighbor records. Links are keyed
+        on both endpoints and normalized interface names so a link reported
+        from both sides is stored once. Devices are keyed by canonical name.
+
+        distances() runs a single multi-source BFS from the seeds and indexes
+        the result, after which at_distance() and distance() are lookups. """
+
+    def __init__(self):
+        # Device key to {neighbor key: [link records]}
+        self.adj = dict()
+
+        # Canonical link key to the first record seen for the link
+        self.links = dict()
+
+        # Device key to display name
+        self.names = dict()
+
+        # Filled in by distances()
+        self.dist = dict()
+        self.levels = dict()
+
+    def add(self, n):
+        'Add a neighbor record, returns False if the link was already known'
+
+        lkey = canonical(n['local_device_id'])
+        rkey = canonical(n['remote_device_id'])
+        link = frozenset(((lkey, normalize_int(n['local_int'])), (rkey, normalize_int(n['remote_int']))))
+
+        self.names.setdefault(lkey, n['local_device_id'])
+        self.names.setdefault(rkey, n['remote_device_id'])
+        self.adj.setdefault(lkey, dict())
+        self.adj.setdefault(rkey, dict())
+
+        if link in self.links:
+            return False
+
+        self.links[link] = n
+        self.adj[lkey].setdefault(rkey, list()).append(n)
+        self.adj[rkey].setdefault(lkey, list()).append(n)
+        return True
+
+    def add_device(self, name):
+        'Add a device with no links yet, eg a seed that could not be scraped'
+
+        key = canonical(name)
+        self.names.setdefault(key, name)
+        self.adj.setdefault(key, dict())
+
+    @classmethod
+    def load(cls, nei_file):
+        'Build a topology from a neighbor CSV file'
+
+        topo = cls()
+        with open(nei_file, 'r') as f:
+            for row in csv.DictReader(f):
+                topo.add(Neighbor.from_dict(row))
+        return topo
+
+    def distances(self, seeds):
+        """ Hop count from the nearest seed for every reachable device, one
+            O(V+E) multi-source BFS. Returns {device key: distance} """
+
+        dist = dict()
+        q = deque()
+        for s in seeds:
+            key = canonical(s)
+            if key not in dist:
+                self.add_device(s)
+                dist[key] = 0
+                q.append(key)
+
+        while q:
+            key = q.popleft()
+            for nkey in self.adj[key]:
+                if nkey not in dist:
+                    dist[nkey] = dist[key] + 1
+                    q.append(nkey)
+
+        levels = dict()
+        for key, d in dist.items():
+            levels.setdefault(d, list()).append(key)
+
+        self.dist = dist
+        self.levels = levels
+        return dist
+
+    def distance(self, name, default=None):
+        'Distance of a device from the nearest seed after distances()'
+        return self.dist.get(canonical(name), default)
+
+    def at_distance(self, hops):
+        'Device keys at exactly hops from the nearest seed after distances()'
+        return self.levels.get(hops, list())
+
+    def neighbors_of(self, name):
+        'Device keys directly connected to a device'
+        return list(self.adj.get(canonical(name), dict()))
+
+    def links_between(self, a, b):
+        'Link records between two devices'
+        return self.adj.get(canonical(a), dict()).get(canonical(b), list())
+
+    def path(self, a, b):
+        """ Shortest path between two devices as a list of device keys, None if
+            they are not connected """
+
+        src, dst = canonical(a), canonical(b)
+        if src not in self.adj or dst not in self.adj:
+            return None
+
+        parent = {src: None}
+        q = deque([src])
+        while q:
+            key = q.popleft()
+            if key == dst:
+                path = list()
+                while key is not None:
+                    path.append(key)
+                    key = parent[key]
+                return path[::-1]
+            for nkey in self.adj[key]:
+                if nkey not in parent:
+                    parent[nkey] = key
+                    q.append(nkey)
+        return None
+
+    def __len__(self):
+        return len(self.adj)
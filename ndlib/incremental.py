@@ -0,0 +1,127 @@
+'Incremental Recrawl Routines'
+import os
+import csv
+import json
+import hashlib
+import logging
+import threading
+from .state import canonical
+from .record import Neighbor
+
+logger = logging.getLogger(__name__)
+
+# Cheap adjacency check run before the detail commands
+SUMMARY_CMD = 'show cdp neighbor'
+
+
+def summary_hash(lines):
+    """ Hash show cdp neighbor output, dropping numeric-only fields such as
+        holdtime that change on every run without any adjacency change """
+
+    h = hashlib.sha1()
+    for l in lines:
+        fields = [f for f in l.split() if not f.isdigit()]
+        if fields:
+            h.update(' '.join(fields).encode() + b'\n')
+    return h.hexdigest()
+
+
+class PreviousRun:
+    """ Summary hashes and neighbors from the last run. Devices whose hash is
+        unchanged reuse their previous neighbors instead of running the
+        detail commands. Hashes are collected on every run with a state file
+        so the next run can be incremental. """
+
+    def __init__(self, state_file, nei_file=None, incremental=False, dev_file=None):
+        self.state_file = state_file
+        self.lock = threading.Lock()
+
+        self.hashes = dict()
+        self.neighbors = dict()
+        self.full_elapsed = None
+        self.new_hashes = dict()
+        self.incremental = incremental
+        self.skipped = 0
+        self.scraped = 0
+        self.saved = 0
+
+        if os.path.exists(state_file):
+            with open(state_file, 'r') as f:
+                saved = json.load(f)
+            self.hashes = saved['hashes']
+            self.full_elapsed = saved.get('full_elapsed')
+
+        if incremental:
+            if not nei_file or not os.path.exists(nei_file):
+                logger.warning('No previous neighbor file, running a full crawl')
+                self.incremental = False
+            else:
+                self.load_neighbors(nei_file, dev_file)
+
+    def load_neighbors(self, nei_file, dev_file=None):
+        """ Load the previous neighbor file grouped by device. Each link is in
+            the file once, so it is also listed under the remote device,
+            reversed, with that device's details from the device file or a
+            row naming it """
+
+        rows = list()
+        details = dict()
+        with open(nei_file, 'r') as f:
+            for row in csv.DictReader(f):
+                n = Neighbor.from_dict(row)
+                rows.append(n)
+                details[canonical(n.remote_device_id)] = n
+
+        # Seeds are never a remote device, only the device file has them
+        if dev_file and os.path.exists(dev_file):
+            with open(dev_file, 'r') as f:
+                for d in csv.DictReader(f):
+                    details[canonical(d['device_id'])] = Neighbor('', d['device_id'], \
+                        ipv4=d['ipv4'], platform=d['platform'], os=d['os'])
+
+        for n in rows:
+            self.neighbors.setdefault(canonical(n.local_device_id), list()).append(n)
+
+            r = Neighbor(n.remote_device_id, n.local_device_id, local_int=n.remote_int, \
+                         remote_int=n.local_int)
+            d = details.get(canonical(n.local_device_id))
+            if d:
+                r.platform, r.ipv4, r.os = d.platform, d.ipv4, d.os
+            self.neighbors.setdefault(canonical(n.remote_device_id), list()).append(r)
+        logger.info('Loaded previous neighbors for %s devices', str(len(self.neighbors)))
+
+    def check(self, key, summary, commands=0):
+        """ Record the summary hash for a device, returns the previous neighbors
+            if the device is unchanged, otherwise None. commands is the number
+            of detail commands skipping the device saves """
+
+        digest = summary_hash(summary)
+        with self.lock:
+            self.new_hashes[key] = digest
+            if self.incremental and self.hashes.get(key) == digest and key in self.neighbors:
+                self.skipped += 1
+                self.saved += commands
+                logger.info('Neighbors unchanged on %s, skipping detail scrape', key)
+                return self.neighbors.pop(key)
+            self.scraped += 1
+        return None
+
+    def save(self, elapsed):
+        'Save hashes for the next run and report savings from this one'
+
+        saved = {'hashes': self.new_hashes, 'full_elapsed': self.full_elapsed}
+        if not self.incremental:
+            saved['full_elapsed'] = elapsed
+
+        tmp = self.state_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(saved, f)
+        os.replace(tmp, self.state_file)
+
+        if self.incremental:
+            logger.warning('Incremental crawl: %s of %s devices unchanged, %s detail commands saved', \
+                           str(self.skipped), str(self.skipped + self.scraped), \
+                           str(self.saved))
+            if self.full_elapsed:
+                logger.warning('Incremental crawl took %.1fs vs %.1fs for the last full crawl (%.1fx)', \
+                               elapsed, self.full_elapsed, self.full_elapsed / max(elapsed, 0.001))
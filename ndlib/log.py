@@ -1,44 +1,208 @@
 'Logging Initialization'
+import json
+import atexit
 import logging
-from logging.handlers import DatagramHandler
+from time import monotonic
+from queue import SimpleQueue
+from contextvars import ContextVar
+from logging.handlers import DatagramHandler, QueueHandler, QueueListener
 
 logger = logging.getLogger(__name__)
 
-def init_logging(log_level, log_file, quiet):
-    'Initialize Logging Globally'
+# Device and crawl phase for structured log lines, set by the crawl engines.
+# Context variables follow both worker threads and asyncio tasks.
+device = ContextVar('device', default=None)
+phase = ContextVar('phase', default=None)
+
+# Per neighbor messages pass extra=REPEAT so they can be aggregated
+REPEAT = {'repeat': True}
+
+# Messages from one call site logged as is per aggregation window, the rest are counted
+REPEAT_BURST = 5
+
+# The queue listener from init_logging(queued=True)
+listener = None
+
+
+def tag(dev, ph=None):
+    'Set the device and phase attached to log lines from this thread or task'
+
+    device.set(dev)
+    phase.set(ph)
+
+
+# Log arguments safe to format later on the listener thread
+IMMUTABLE = (str, int, float, type(None))
+
+
+class ContextQueueHandler(QueueHandler):
+    """ Puts records on the queue unformatted, so formatting happens on the
+        listener thread instead of the crawl threads. The device and phase
+        are captured here since they belong to the calling context, and
+        arguments such as a Neighbor that may change before the listener
+        gets to them are converted to strings """
+
+    def prepare(self, record):
+        record.device = device.get()
+        record.phase = phase.get()
+        args = record.args
+        if args and isinstance(args, tuple):
+            for a in args:
+                if not isinstance(a, IMMUTABLE):
+                    record.args = tuple(a if isinstance(a, IMMUTABLE) else str(a) for a in args)
+                    break
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    'One JSON object per line with the device and phase as fields'
+
+    def format(self, record):
+        entry = {'time': round(record.created, 3), 'level': record.levelname, \
+                 'logger': record.name, 'message': record.getMessage()}
+        if getattr(record, 'device', None):
+            entry['device'] = record.device
+        if getattr(record, 'phase', None):
+            entry['phase'] = record.phase
+        if getattr(record, 'repeated', None):
+            entry['repeated'] = record.repeated
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class AggregatingListener(QueueListener):
+    """ Queue listener that rate limits repeated messages. Each call site
+        logging with extra=REPEAT (logger and message template) gets
+        REPEAT_BURST lines per window, the rest are counted and reported in
+        one line when the window closes, eg the Regex Ignore message logged
+        for every phone and AP """
+
+    def __init__(self, queue, *handlers, window=None):
+        super().__init__(queue, *handlers, respect_handler_level=True)
+        self.window = window
+        self.sites = dict()
+        self.next_flush = None
+
+    def handle(self, record):
+        if not self.window:
+            return super().handle(record)
+
+        now = monotonic()
+        if self.next_flush is None:
+            self.next_flush = now + self.window
+        elif now >= self.next_flush:
+            self.flush()
+            self.next_flush = now + self.window
+
+        if not getattr(record, 'repeat', False):
+            return super().handle(record)
+
+        site = (record.name, record.levelno, record.msg)
+        count = self.sites.get(site)
+        if count is None:
+            self.sites[site] = [1, 0, record]
+        elif count[0] < REPEAT_BURST:
+            count[0] += 1
+        else:
+            count[1] += 1
+            count[2] = record
+            return
+        super().handle(record)
+
+    def flush(self):
+        'Report call sites that went over the burst this window and start a new one'
+
+        sites, self.sites = self.sites, dict()
+        for _, suppressed, last in sites.values():
+            if not suppressed:
+                continue
+            record = logging.makeLogRecord(last.__dict__)
+            record.msg = '%s (repeated %s more times, last shown)' % (last.getMessage(), str(suppressed))
+            record.args = None
+            record.repeated = suppressed
+            super().handle(record)
+
+    def stop(self):
+        super().stop()
+        if self.window:
+            self.flush()
+
+
+def init_logging(log_level, log_file, quiet, queued=False, json_file=None, aggregate=None):
+    """ Initialize Logging Globally. With queued the crawl threads only
+        enqueue records and a listener thread formats and writes them, which
+        also enables the JSON log file and repeated message aggregation """
 
     # Specify our log format for handlers
     log_format = logging.Formatter('%(asctime)s %(name)s:%(levelname)s: %(message)s')
 
     # Get the root_logger to attach log handlers to
     root_logger = logging.getLogger()
-
-    # Set root logger to debug level always
-    # Control log levels at log handler level
-    root_logger.setLevel(logging.DEBUG)
+    handlers = list()
 
     if not quiet:
         # Console Handler (always use log_level)
         ch = logging.StreamHandler()
         ch.setLevel(log_level)
         ch.setFormatter(log_format)
-        root_logger.addHandler(ch)
+        handlers.append(ch)
 
-    # Logfile Handler
-    fh = logging.FileHandler(log_file)
+    # Logfile Handler, offline commands pass no log_file
+    if log_file:
+        fh = logging.FileHandler(log_file)
 
-    # Always log at INFO or below
-    if log_level < logging.INFO:
-        fh.setLevel(log_level)
-    else:
-        fh.setLevel(logging.INFO)
-    
-    # Attach logfile handler
-    fh.setFormatter(log_format)
-    root_logger.addHandler(fh)
+        # Always log at INFO or below
+        if log_level < logging.INFO:
+            fh.setLevel(log_level)
+        else:
+            fh.setLevel(logging.INFO)
+
+        # Attach logfile handler
+        fh.setFormatter(log_format)
+        handlers.append(fh)
+
+        # Structured log next to the logfile, same levels
+        if queued and json_file:
+            jh = logging.FileHandler(json_file)
+            jh.setLevel(fh.level)
+            jh.setFormatter(JsonFormatter())
+            handlers.append(jh)
 
     # # Attach Datagram Handler
     # dh = DatagramHandler('232.8.8.8', port=1900)
     # dh.setFormatter(log_format)
     # dh.setLevel(log_level)
     # root_logger.addHandler(dh)
+
+    # Root logger passes the lowest handler level, control log levels at log
+    # handler level. Skips building records nobody would write.
+    root_logger.setLevel(min([h.level for h in handlers] or [log_level]))
+
+    if not queued:
+        for h in handlers:
+            root_logger.addHandler(h)
+        return None
+
+    # Crawl threads only enqueue, the listener thread does the rest
+    global listener
+    queue = SimpleQueue()
+    root_logger.addHandler(ContextQueueHandler(queue))
+    listener = AggregatingListener(queue, *handlers, window=aggregate)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def unqueue():
+    """ Log straight to the listener's handlers, for forked processes whose
+        copy of the queue has no listener thread reading it """
+
+    if listener is None:
+        return
+    root_logger = logging.getLogger()
+    for h in list(root_logger.handlers):
+        if isinstance(h, QueueHandler):
+            root_logger.removeHandler(h)
+    for h in listener.handlers:
+        root_logger.addHandler(h)
@@ -1,57 +1,144 @@
 'File output routines'
+import os
 import csv
+import json
 import logging
+from .state import canonical
 
 logger = logging.getLogger(__name__)
 
+NEI_FIELDS = ['local_device_id', 'remote_device_id', 'distance', 'local_int', \
+              'remote_int', 'ipv4', 'os', 'platform', 'description']
+NG_FIELDS = ['LocalName', 'LocalPort', 'RemoteName', 'RemotePort']
+DEV_FIELDS = ['device_id', 'ipv4', 'platform', 'os', 'distance', 'logged_in']
+
+
+class NeighborStream:
+    """ Append neighbor rows to CSV and JSONL as each device's results come
+        off out_q, flushing every batch rows so a crash keeps everything
+        merged so far. Either file is optional, append continues the files
+        from an interrupted crawl. """
+
+    def __init__(self, outf=None, jsonf=None, batch=500, append=False):
+        self.batch = batch
+        self.count = 0
+        self.csvf = None
+        self.jsonf = None
+
+        mode = 'w'
+        if append:
+            mode = 'a'
+
+        if outf:
+            header = not append or not os.path.exists(outf)
+            self.csvf = open(outf, mode)
+            self.dw = csv.DictWriter(self.csvf, fieldnames=NEI_FIELDS, extrasaction='ignore')
+            if header:
+                self.dw.writeheader()
+        if jsonf:
+            self.jsonf = open(jsonf, mode)
+
+    def write(self, nd):
+        'Append one device worth of neighbors'
+
+        for n in nd:
+            if self.csvf:
+                self.dw.writerow(n)
+            if self.jsonf:
+                self.jsonf.write(json.dumps({f: n[f] for f in NEI_FIELDS}) + '\n')
+
+        self.count += len(nd)
+        if self.count >= self.batch:
+            self.flush()
+
+    def flush(self):
+        'Flush pending rows to disk'
+
+        for f in (self.csvf, self.jsonf):
+            if f:
+                f.flush()
+        self.count = 0
+
+    def close(self):
+        'Flush and close the stream files'
+
+        for f in (self.csvf, self.jsonf):
+            if f:
+                f.close()
+
+
+def ng_row(n):
+    'NetGrph row for a neighbor'
+
+    return {'LocalName': n['local_device_id'].split('.')[0],
+            'LocalPort': n['local_int'],
+            'RemoteName': n['remote_device_id'].split('.')[0],
+            'RemotePort': n['remote_int'],
+           }
+
+
 def output_files(outf, ngout, dout, neighbors, devices, distances):
     """ Output files to CSV if requested """
 
     # Output Neighbor CSV File
     if outf:
-        fieldnames = ['local_device_id', 'remote_device_id', 'distance', 'local_int', \
-                      'remote_int', 'ipv4', 'os', 'platform', 'description']
-        f = open(outf, 'w')
-        dw = csv.DictWriter(f, fieldnames=fieldnames)
-        dw.writeheader()
-        for n in neighbors:
-            nw = n.copy()
-            if 'logged_in' in nw:
-                nw.pop('logged_in')
-            dw.writerow(nw)
-        f.close()
+        with open(outf, 'w') as f:
+            dw = csv.DictWriter(f, fieldnames=NEI_FIELDS, extrasaction='ignore')
+            dw.writeheader()
+            for n in neighbors:
+                dw.writerow(n)
 
     # Output NetGrph CSV File
     if ngout:
-        fieldnames = ['LocalName', 'LocalPort', 'RemoteName', 'RemotePort']
-        f = open(ngout, 'w')
-        dw = csv.DictWriter(f, fieldnames=fieldnames)
-        dw.writeheader()
-        for n in neighbors:
-
-            ng = {'LocalName': n['local_device_id'].split('.')[0],
-                  'LocalPort': n['local_int'],
-                  'RemoteName': n['remote_device_id'].split('.')[0],
-                  'RemotePort': n['remote_int'],
-                 }
-            dw.writerow(ng)
-        f.close()
+        with open(ngout, 'w') as f:
+            dw = csv.DictWriter(f, fieldnames=NG_FIELDS)
+            dw.writeheader()
+            for n in neighbors:
+                dw.writerow(ng_row(n))
 
     if dout:
-        fieldnames = ['device_id', 'ipv4', 'platform', 'os', 'distance', 'logged_in']
-        f = open(dout, 'w')
-        dw = csv.DictWriter(f, fieldnames=fieldnames)
-        dw.writeheader()
-        for d in sorted(devices):
-            dist = 100
-            if devices[d]['remote_device_id'] in distances:
-                dist = distances[devices[d]['remote_device_id']]
-
-            logged_in = False
-            if 'logged_in' in devices[d] and devices[d]['logged_in']:
-                logged_in = True
-
-            dd = {'device_id': devices[d]['remote_device_id'], 'ipv4': devices[d]['ipv4'], \
-                  'platform': devices[d]['platform'], 'os': devices[d]['os'], \
-                  'distance': dist, 'logged_in': logged_in}
-            dw.writerow(dd)
+        with open(dout, 'w') as f:
+            dw = csv.DictWriter(f, fieldnames=DEV_FIELDS)
+            dw.writeheader()
+            for d in sorted(devices):
+                dist = 100
+                if d in distances:
+                    dist = distances[d]
+
+                logged_in = False
+                if devices[d].get('logged_in'):
+                    logged_in = True
+
+                dd = {'device_id': devices[d]['remote_device_id'], 'ipv4': devices[d]['ipv4'], \
+                      'platform': devices[d]['platform'], 'os': devices[d]['os'], \
+                      'distance': dist, 'logged_in': logged_in}
+                dw.writerow(dd)
+
+
+def rebuild_files(jsonf, outf=None, ngout=None, dout=None):
+    """ Rebuild the neighbor and NetGrph CSV files from a streamed JSONL file,
+        using final distances from the device file if it exists """
+
+    distances = dict()
+    if dout and os.path.exists(dout):
+        with open(dout, 'r') as f:
+            for d in csv.DictReader(f):
+                distances[canonical(d['device_id'])] = int(d['distance'])
+
+    neighbors = list()
+    with open(jsonf, 'r') as f:
+        for l in f:
+            try:
+                n = json.loads(l)
+            except ValueError:
+                # Partial last line from an interrupted crawl
+                logger.warning('Skipping truncated line in %s', jsonf)
+                continue
+            lkey = canonical(n['local_device_id'])
+            if lkey in distances:
+                n['distance'] = distances[lkey]
+            neighbors.append(n)
+
+    logger.info('Rebuilt %s neighbors from %s', str(len(neighbors)), jsonf)
+
+    output_files(outf, ngout, None, neighbors, dict(), distances)
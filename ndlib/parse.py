@@ -1,180 +1,274 @@
 'Parser Routines'
 import re
+import sys
 import logging
+from . import timing
+from .log import REPEAT
+from .record import Neighbor, canonical, normalize_int
 
 logger = logging.getLogger(__name__)
 
 config = dict()
 
+# Name and interface character classes shared by the record patterns
+NAME = r'([A-Za-z0-9\.\-\_]+)'
+INT = r'([A-Za-z0-9\.\-\_\/]+)'
+
+# Record patterns, only tried on lines whose first character can match
+PLATFORM_RE = re.compile(r'Platform\:\s([A-Za-z0-9\.\-\_]+)\s*([A-Za-z0-9\.\-\_]*)')
+CDP_DEVID_RE = re.compile(r'Device\sID\:\s*' + NAME)
+CDP_INTS_RE = re.compile(r'Interface\:\s' + INT + r'.*\:\s' + INT + r'$')
+CDP_IP_RE = re.compile(r'\s+(?:IPv4\sAddress|IP\saddress)\:\s(\d+\.\d+\.\d+\.\d+)')
+LLDP_DEVID_RE = re.compile(r'Chassis\sid\:\s*' + NAME)
+LLDP_SYSNAME_RE = re.compile(r'System\sName\:\s*' + NAME)
+LLDP_LINT_RE = re.compile(r'Local\sPort\sid\:\s' + INT + r'$')
+LLDP_INTF_RE = re.compile(r'Local\sIntf\:\s' + INT + r'$')
+LLDP_RINT_RE = re.compile(r'Port\sid\:\s' + INT + r'$')
+LLDP_IPV4_RE = re.compile(r'\s+IP\:\s(\d+\.\d+\.\d+\.\d+)')
+LLDP_MGMT_RE = re.compile(r'Management\sAddress\:\s(\d+\.\d+\.\d+\.\d+)')
+LLDP_DESC_RE = re.compile(r'Port\sDescription\:\s(.*)')
+LLDP_SUM_INT_RE = re.compile(r'\w+\d+\/\d+')
+
+# Compiled ignore_regex, keyed by the pattern from config
+ignore_cache = dict()
+
+def ignore_regex():
+    'Return the compiled ignore_regex from config'
+
+    pattern = config['main']['ignore_regex']
+    if pattern not in ignore_cache:
+        ignore_cache[pattern] = re.compile(pattern)
+    return ignore_cache[pattern]
+
+def add_nei(nd, current, ignore, level=logging.INFO):
+    'Append a finished neighbor entry with full interface names unless it matches ignore_regex'
+
+    if not ignore.search(current.remote_device_id):
+        current.local_int = normalize_int(current.local_int)
+        current.remote_int = normalize_int(current.remote_int)
+        nd.append(current)
+    else:
+        logger.log(level, 'Regex Ignore on %s neighbor from %s', \
+                   current.remote_device_id, current.local_device_id, extra=REPEAT)
+
+def set_platform(current, platform):
+    'Set platform from a Platform: match, skipping the cisco vendor prefix'
+
+    if platform.group(1) == 'cisco':
+        current.platform = sys.intern(platform.group(2))
+    else:
+        current.platform = sys.intern(platform.group(1))
+
+def set_os(current, l):
+    'Set OS type from version strings anywhere in the record'
+
+    if 'Cisco Nexus' in l:
+        current.os = 'cisco_nxos'
+    if 'Cisco IOS' in l:
+        current.os = 'cisco_ios'
+
+
+def merge_key(n):
+    """ Key for one link as seen from the local device. Interface names are
+        already normalized, remote names are compared without the domain
+        since LLDP often reports the bare hostname. """
+
+    return (canonical(n.remote_device_id).split('.')[0], n.local_int, n.remote_int)
+
 def merge_nd(nd_cdp, nd_lldp):
     """ Merge CDP and LLDP data into one structure """
 
     neis = dict()
-    nd = list()
 
     for n in nd_lldp:
-        neis[(n['local_device_id'], n['remote_device_id'], n['local_int'], n['remote_int'])] = n
+        neis[merge_key(n)] = n
 
     for n in nd_cdp:
 
         # Always prefer CDP, but grab description from LLDP if available
-        if (n['local_device_id'], n['remote_device_id'], n['local_int'], n['remote_int']) in n:
-            if 'description' in neis[(n['local_device_id'], n['remote_device_id'], n['local_int'], n['remote_int'])]:
-                n['description'] = neis[(n['local_device_id'], n['remote_device_id'], n['local_int'], n['remote_int'])]['description']
-        neis[(n['local_device_id'], n['remote_device_id'], n['local_int'], n['remote_int'])] = n
+        key = merge_key(n)
+        if key in neis and neis[key].description and not n.description:
+            n.description = neis[key].description
+        neis[key] = n
 
+    return list(neis.values())
 
-    for n in neis:
-        nd.append(neis[n])
+def parse_nd(device, cdp, lldp, lldp_sum):
+    """ Parse raw CDP/LLDP command output from a device into merged neighbors """
 
-    return nd
+    dname = device['remote_device_id']
+
+    with timing.phase(dname, 'parse'):
+        return _parse_nd(device, dname, cdp, lldp, lldp_sum)
+
+def _parse_nd(device, dname, cdp, lldp, lldp_sum):
+    nd_cdp = list()
+    nd_lldp = list()
+
+    if device['os'] == 'cisco_nxos':
+        nd_cdp = parse_cdp(cdp, device)
+        nd_lldp = parse_lldp(lldp, lldp_sum, device)
+    elif device['os'] == 'cisco_ios':
+        nd_cdp = parse_cdp(cdp, device)
+        nd_lldp = parse_lldp(lldp, lldp_sum, device)
+    else:
+        logger.warning('Unknown OS Type to Parse on %s: %s', dname, device['os'])
+
+    for n in nd_cdp:
+        logger.debug('Found Neighbor %s on %s', n, dname, extra=REPEAT)
+
+    return merge_nd(nd_cdp, nd_lldp)
 
 def parse_cdp(cdp, device):
-    'Return nd neighbors for IOS/NXOS CDP output'
+    """ Return nd neighbors for IOS/NXOS CDP output
+
+        Single pass, each line is dispatched on its first character to the one
+        record pattern that could match it """
 
-    current = dict()
+    current = None
     dname = device['remote_device_id']
     nd = list()
+    ignore = ignore_regex()
 
     for l in cdp:
         l = l.rstrip()
-        devid = re.search(r'^Device\sID\:\s*([A-Za-z0-9\.\-\_]+)', l)
-        platform = re.search(r'^Platform\:\s([A-Za-z0-9\.\-\_]+)\s*([A-Za-z0-9\.\-\_]*)', l)
-        ints = re.search(r'^Interface\:\s([A-Za-z0-9\.\-\_\/]+).*\:\s([A-Za-z0-9\.\-\_\/]+)$', l)
-        ipv4 = re.search(r'^\s+IPv4\sAddress\:\s(\d+\.\d+\.\d+\.\d+)', l)
-        ip = re.search(r'^\s+IP\saddress\:\s(\d+\.\d+\.\d+\.\d+)', l)
-        nxos = re.search(r'Cisco Nexus', l)
-        ios = re.search(r'Cisco IOS', l)
-        if devid:
-            if current:
-                if not re.search(config['main']['ignore_regex'], current['remote_device_id']):
-                    nd.append(current.copy())
-                else:
-                    logger.info('Regex Ignore on %s neighbor from %s', \
-                                    current['remote_device_id'], current['local_device_id'])
-            current = dict()
-            rname = devid.group(1)
-            current['local_device_id'] = dname
-            current['remote_device_id'] = rname
-            current['platform'] = 'Unknown'
-            current['local_int'] = 'Unknown'
-            current['remote_int'] = 'Unknown'
-            current['ipv4'] = 'Unknown'
-            current['os'] = 'Unknown'
-            current['description'] = ''
-        if ints:
-            #print(l, ints.group(1), ints.group(2))
-            current['local_int'] = ints.group(1)
-            current['remote_int'] = ints.group(2)
-        if ipv4:
-            current['ipv4'] = ipv4.group(1)
-        if ip:
-            current['ipv4'] = ip.group(1)
-        if platform:
-            if platform.group(1) == 'cisco':
-                current['platform'] = platform.group(2)
-            else:
-                current['platform'] = platform.group(1)
-        if nxos:
-            current['os'] = 'cisco_nxos'
-        if ios:
-            current['os'] = 'cisco_ios'
+        if not l:
+            continue
+        c = l[0]
+
+        if c == 'D':
+            devid = CDP_DEVID_RE.match(l)
+            if devid:
+                if current:
+                    add_nei(nd, current, ignore)
+                current = Neighbor(dname, devid.group(1))
+
+        if current is None:
+            continue
+
+        if c == 'I':
+            ints = CDP_INTS_RE.match(l)
+            if ints:
+                current.local_int = ints.group(1)
+                current.remote_int = ints.group(2)
+        elif c == 'P':
+            platform = PLATFORM_RE.match(l)
+            if platform:
+                set_platform(current, platform)
+        elif c.isspace():
+            ip = CDP_IP_RE.match(l)
+            if ip:
+                current.ipv4 = ip.group(1)
+
+        set_os(current, l)
 
     if current:
-        if not re.search(config['main']['ignore_regex'], current['remote_device_id']):
-            nd.append(current.copy())
-        else:
-            logger.warning('Regex Ignore on %s neighbor from %s', \
-                            current['remote_device_id'], current['local_device_id'])
+        add_nei(nd, current, ignore, logging.WARNING)
     return nd
 
 
 def parse_lldp(lldp_det, lldp_sum, device):
-    'Return nd neighbors for IOS/NXOS LLDP output'
+    """ Return nd neighbors for IOS/NXOS LLDP output
+
+        Single pass, each line is dispatched on its first character to the one
+        record pattern that could match it """
 
-    current = dict()
+    current = None
     dname = device['remote_device_id']
     nd = list()
     dmap = dict()
+    ignore = ignore_regex()
+    ios = device['os'] == 'cisco_ios'
 
-    # Get local ports from summary, store in dmap
+    # IOS local intf line, comes before the chassis id of its neighbor
+    intf = None
+
+    # Get local ports from summary by remote port, with the (truncated)
+    # device id to tell apart neighbors on the same remote port name
     for l in lldp_sum:
-        l = l[20:]
-        ln = l.split()
-        if len(ln) > 3 and re.search(r'\w+\d+\/\d+', ln[0]):
-            dmap[ln[3]] = ln[0]
-        elif len(ln) == 3 and re.search(r'\w+\d+\/\d+', ln[0]):
-            dmap[ln[2]] = ln[0]
+        ln = l[20:].split()
+        if len(ln) > 3 and LLDP_SUM_INT_RE.search(ln[0]):
+            dmap.setdefault(normalize_int(ln[3]), list()).append((l[:20].strip(), ln[0]))
+        elif len(ln) == 3 and LLDP_SUM_INT_RE.search(ln[0]):
+            dmap.setdefault(normalize_int(ln[2]), list()).append((l[:20].strip(), ln[0]))
 
     for l in lldp_det:
         l = l.rstrip()
-        devid = re.search(r'^Chassis\sid\:\s*([A-Za-z0-9\.\-\_]+)', l)
-        sysname = re.search(r'^System\sName\:\s*([A-Za-z0-9\.\-\_]+)', l)
-        platform = re.search(r'^Platform\:\s([A-Za-z0-9\.\-\_]+)\s*([A-Za-z0-9\.\-\_]*)', l)
-        l_int = re.search(r'^Local\sPort\sid\:\s([A-Za-z0-9\.\-\_\/]+)$', l)
-        r_int = re.search(r'^Port\sid\:\s([A-Za-z0-9\.\-\_\/]+)$', l)
-        ipv4 = re.search(r'^\s+IP\:\s(\d+\.\d+\.\d+\.\d+)', l)
-        ip = re.search(r'^Management\sAddress\:\s(\d+\.\d+\.\d+\.\d+)', l)
-        desc = re.search(r'Port\sDescription\:\s(.*)', l)
-        nxos = re.search(r'Cisco Nexus', l)
-        ios = re.search(r'Cisco IOS', l)
-        if devid:
-            if current:
-                if not re.search(config['main']['ignore_regex'], current['remote_device_id']):
-                    nd.append(current.copy())
-                else:
-                    logger.info('Regex Ignore on %s neighbor from %s', \
-                                    current['remote_device_id'], current['local_device_id'])
-            current = dict()
-            rname = devid.group(1)
-            current['local_device_id'] = dname
-            current['remote_device_id'] = rname
-            current['platform'] = 'Unknown'
-            current['local_int'] = 'Unknown'
-            current['remote_int'] = 'Unknown'
-            current['ipv4'] = 'Unknown'
-            current['os'] = 'Unknown'
-            current['description'] = ''
-
-
-        if sysname:
-            if not re.search('advertised', sysname.group(1)):
-                current['remote_device_id'] = sysname.group(1)
-        if r_int:
-            current['remote_int'] = r_int.group(1)
-
-            # Try to map interface via summary if Unknown (IOS)
-            if device['os'] == 'cisco_ios':
-                if current['remote_int'] in dmap:
-                    logger.debug('Mapping %s local interface %s to chassis id %s', \
-                                dname, dmap[current['remote_int']], current['remote_int'])
-                    current['local_int'] = dmap[current['remote_int']]
-                elif current['remote_device_id'] in dmap:
-                    current['local_int'] = dmap[current['remote_device_id']]
-                else:
-                    logger.info('No LLDP mapping for %s on %s', current['remote_int'], current['local_device_id'])
-        if l_int:
-            current['local_int'] = l_int.group(1)
-        if ipv4:
-            current['ipv4'] = ipv4.group(1)
-        if ip:
-            current['ipv4'] = ip.group(1)
-        if platform:
-            if platform.group(1) == 'cisco':
-                current['platform'] = platform.group(2)
+        if not l:
+            continue
+        c = l[0]
+
+        if c == 'C':
+            devid = LLDP_DEVID_RE.match(l)
+            if devid:
+                if current:
+                    if ios:
+                        map_local_int(current, dmap)
+                    add_nei(nd, current, ignore)
+                current = Neighbor(dname, devid.group(1))
+                if intf:
+                    current.local_int = intf
+                    intf = None
+        elif c == 'L':
+            local = LLDP_INTF_RE.match(l)
+            if local:
+                intf = local.group(1)
+                continue
+
+        if current is None:
+            continue
+
+        if c == 'S':
+            sysname = LLDP_SYSNAME_RE.match(l)
+            if sysname and 'advertised' not in sysname.group(1):
+                current.remote_device_id = sys.intern(sysname.group(1))
+        elif c == 'P':
+            r_int = LLDP_RINT_RE.match(l)
+            if r_int:
+                current.remote_int = r_int.group(1)
             else:
-                current['platform'] = platform.group(1)
-        if desc:
-            current['description'] = desc.group(1).strip()
-        if nxos:
-            current['os'] = 'cisco_nxos'
-        if ios:
-            current['os'] = 'cisco_ios'
+                platform = PLATFORM_RE.match(l)
+                if platform:
+                    set_platform(current, platform)
+        elif c == 'L':
+            l_int = LLDP_LINT_RE.match(l)
+            if l_int:
+                current.local_int = l_int.group(1)
+        elif c == 'M':
+            ip = LLDP_MGMT_RE.match(l)
+            if ip:
+                current.ipv4 = ip.group(1)
+        elif c.isspace():
+            ipv4 = LLDP_IPV4_RE.match(l)
+            if ipv4:
+                current.ipv4 = ipv4.group(1)
+
+        if 'Description:' in l:
+            desc = LLDP_DESC_RE.search(l)
+            if desc:
+                current.description = desc.group(1).strip()
+
+        set_os(current, l)
 
     if current:
-        if not re.search(config['main']['ignore_regex'], current['remote_device_id']):
-            nd.append(current.copy())
-        else:
-            logger.warning('Regex Ignore on %s neighbor from %s', \
-                            current['remote_device_id'], current['local_device_id'])
+        if ios:
+            map_local_int(current, dmap)
+        add_nei(nd, current, ignore, logging.WARNING)
     return nd
+
+
+def map_local_int(current, dmap):
+    'Fill in the local port of an IOS LLDP neighbor from the summary if the detail had none'
+
+    if current.local_int != 'Unknown':
+        return
+
+    entries = dmap.get(normalize_int(current.remote_int), list())
+    if len(entries) > 1:
+        entries = [e for e in entries if e[0] and current.remote_device_id.startswith(e[0])]
+    if len(entries) == 1:
+        logger.debug('Mapping %s local interface %s to %s', current.local_device_id, \
+                     entries[0][1], current.remote_device_id)
+        current.local_int = entries[0][1]
+    else:
+        logger.info('No LLDP mapping for %s on %s', current.remote_int, current.local_device_id)
@@ -0,0 +1,68 @@
+'Parse Worker Processes'
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from . import log
+from . import parse
+from . import timing
+from .plan import CDP_DETAIL, LLDP_DETAIL, LLDP_SUMMARY
+from .record import pack, unpack
+
+logger = logging.getLogger(__name__)
+
+
+def init_worker(main_config):
+    'Set parser config in parse worker processes'
+
+    parse.config = {'main': main_config}
+    timing.enabled = False
+    log.unqueue()
+
+
+def parse_job(device, cdp, lldp, lldp_sum):
+    'Parse one device in a worker process, neighbors go back as tuples'
+
+    nd = parse.parse_nd(unpack(device), cdp, lldp, lldp_sum)
+    return [pack(n) for n in nd]
+
+
+class ParsePool:
+    """ CDP/LLDP parsing on worker processes, so the threads or event loop
+        doing SSH I/O never hold the GIL to parse a large device. Raw output
+        is sent to the pool and neighbors come back as tuples.
+
+        The workers are started when the pool is created, which must be
+        before the crawl starts any threads. """
+
+    def __init__(self, workers, main_config):
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, \
+                                            initargs=(dict(main_config),))
+
+        # Fork every worker now, while the crawl is still single threaded
+        self.executor.submit(int).result()
+        logger.info('Started %s parse workers', str(workers))
+
+    def submit(self, device, outputs):
+        'Queue a device for parsing, returns a concurrent.futures.Future'
+
+        return self.executor.submit(parse_job, pack(device), outputs[CDP_DETAIL], \
+                                    outputs[LLDP_DETAIL], outputs[LLDP_SUMMARY])
+
+    def parse(self, device, outputs):
+        'Parse a device on the pool and wait for the neighbors'
+
+        with timing.phase(device['remote_device_id'], 'parse'):
+            packed = self.submit(device, outputs).result()
+        return [unpack(t) for t in packed]
+
+    async def aparse(self, device, outputs):
+        'Parse a device on the pool without blocking the event loop'
+
+        with timing.phase(device['remote_device_id'], 'parse'):
+            packed = await asyncio.wrap_future(self.submit(device, outputs))
+        return [unpack(t) for t in packed]
+
+    def close(self):
+        'Stop the worker processes'
+        self.executor.shutdown()
@@ -0,0 +1,205 @@
+'Per Platform Command Plans'
+import re
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+CDP_DETAIL = 'show cdp neighbor detail'
+LLDP_DETAIL = 'show lldp neighbor detail'
+LLDP_SUMMARY = 'show lldp neighbor'
+
+# Commands run per device before command plans
+FULL_PLAN = 3
+
+# Lines the parser uses, for the filtered forms of the detail commands
+CDP_FILTER = 'Device ID|Interface|Platform|IP address|IPv4 Address|Cisco IOS|Cisco Nexus'
+LLDP_FILTER = 'Local Intf|Chassis id|Port id|Port Description|System Name|Management Address|IP:|Platform|Cisco IOS|Cisco Nexus'
+
+# Command not supported on the platform, cached on first sight
+INVALID_RE = re.compile(r'%\s*Invalid (input|command)|Invalid command at|Syntax error')
+
+# Feature turned off in the device config
+DISABLED_RE = re.compile(r'%\s*(CDP|LLDP) is not enabled|(CDP|LLDP) is not enabled|Feature not enabled')
+
+# Devices of a platform that must report a feature disabled, with none
+# reporting it enabled, before the rest of the platform skips it
+DISABLED_LIMIT = 3
+
+
+class CommandPlan:
+    """ Picks the commands to run on a device by OS and platform and learns
+        per platform capabilities during the run.
+
+        NX-OS never needs the LLDP summary since its detail output has the
+        local port. IOS only needs it when the LLDP detail has neighbors to
+        map. Platforms where a command is invalid, or where the feature is
+        off on several devices and on none, skip it for the rest of the run.
+        With filtered set, detail commands are narrowed with | include to
+        the lines the parser reads. A platform that rejects the filtered
+        form gets the plain command and keeps it for the rest of the run. """
+
+    def __init__(self, filtered=False):
+        self.filtered = filtered
+        self.lock = threading.Lock()
+
+        # (os, platform) feature pairs known unsupported, enabled, and
+        # disabled counts while still unsure
+        self.unsupported = set()
+        self.enabled = set()
+        self.disabled = dict()
+
+        # (os, platform) feature pairs that rejected the filtered command
+        self.unfiltered = set()
+
+        # (os, platform) pairs that have needed the LLDP summary
+        self.summarized = set()
+
+        self.commands = 0
+        self.saved = 0
+
+    def key(self, device):
+        'Capability cache key for a device, None when the platform is unknown'
+
+        if device['platform'] == 'Unknown':
+            return None
+        return (device['os'], device['platform'])
+
+    def command(self, cmd, device=None, feature=None):
+        """ Filtered form of a detail command if enabled and not rejected by
+            the device's platform. NX-OS needs the regex quoted, IOS takes
+            the rest of the line as is """
+
+        if not self.filtered or cmd not in (CDP_DETAIL, LLDP_DETAIL):
+            return cmd
+        if device is not None and ((device['os'], device['platform']), feature) in self.unfiltered:
+            return cmd
+
+        pattern = CDP_FILTER if cmd == CDP_DETAIL else LLDP_FILTER
+        if device is not None and device['os'] == 'cisco_nxos':
+            pattern = '"' + pattern + '"'
+        return cmd + ' | include ' + pattern
+
+    def detail(self, device, feature, cmd):
+        """ Generator running a detail command, falling back to the plain
+            command when the filtered one is rejected. Returns the output and
+            the number of commands run """
+
+        sent = self.command(cmd, device, feature)
+        out = yield sent
+        if sent == cmd or not INVALID_RE.search('\n'.join(out[:3])):
+            return out, 1
+
+        with self.lock:
+            pair = ((device['os'], device['platform']), feature)
+            if pair not in self.unfiltered:
+                self.unfiltered.add(pair)
+                logger.warning('Filtered %s command rejected on %s, running it unfiltered', \
+                               feature.upper(), device['platform'])
+        out = yield cmd
+        return out, 2
+
+    def steps(self, device):
+        """ Generator yielding commands to run and receiving their output,
+            returns the outputs keyed by unfiltered command """
+
+        key = self.key(device)
+        outputs = {CDP_DETAIL: list(), LLDP_DETAIL: list(), LLDP_SUMMARY: list()}
+        run = 0
+
+        if (key, 'cdp') not in self.unsupported:
+            out, sent = yield from self.detail(device, 'cdp', CDP_DETAIL)
+            outputs[CDP_DETAIL] = self.check(key, 'cdp', out)
+            run += sent
+
+        if (key, 'lldp') not in self.unsupported:
+            out, sent = yield from self.detail(device, 'lldp', LLDP_DETAIL)
+            outputs[LLDP_DETAIL] = self.check(key, 'lldp', out)
+            run += sent
+
+            # The summary only maps local ports for IOS LLDP neighbors
+            if device['os'] == 'cisco_ios' and any('Chassis id' in l for l in outputs[LLDP_DETAIL]):
+                outputs[LLDP_SUMMARY] = yield LLDP_SUMMARY
+                run += 1
+                if key:
+                    self.summarized.add(key)
+
+        with self.lock:
+            self.commands += run
+            self.saved += max(FULL_PLAN - run, 0)
+        return outputs
+
+    def planned(self, device):
+        """ Commands the plan would run on device as far as this run has
+            learned, for devices skipped without running it. The IOS LLDP
+            summary counts once the platform has needed it """
+
+        key = self.key(device)
+        run = 0
+        for feature in ('cdp', 'lldp'):
+            if (key, feature) not in self.unsupported:
+                run += 1
+        if device['os'] == 'cisco_ios' and (key, 'lldp') not in self.unsupported and key in self.summarized:
+            run += 1
+        return run
+
+    def run(self, device, send):
+        'Run the plan for a device with send(cmd) returning output lines'
+
+        steps = self.steps(device)
+        try:
+            cmd = next(steps)
+            while True:
+                cmd = steps.send(send(cmd))
+        except StopIteration as stop:
+            return stop.value
+
+    async def arun(self, device, send):
+        'Run the plan for a device with await send(cmd) returning output lines'
+
+        steps = self.steps(device)
+        try:
+            cmd = next(steps)
+            while True:
+                cmd = steps.send(await send(cmd))
+        except StopIteration as stop:
+            return stop.value
+
+    def check(self, key, feature, out):
+        """ Learn from a command's output, returns the output or an empty list
+            if the command is invalid or the feature is disabled """
+
+        head = '\n'.join(out[:3])
+        if INVALID_RE.search(head):
+            if key:
+                with self.lock:
+                    if (key, feature) not in self.unsupported:
+                        self.unsupported.add((key, feature))
+                        logger.warning('%s commands not supported on %s, skipping for this run', \
+                                       feature.upper(), key[1])
+            return list()
+
+        if DISABLED_RE.search(head):
+            if key:
+                with self.lock:
+                    count = self.disabled.get((key, feature), 0) + 1
+                    self.disabled[(key, feature)] = count
+                    if count >= DISABLED_LIMIT and (key, feature) not in self.enabled and \
+                       (key, feature) not in self.unsupported:
+                        self.unsupported.add((key, feature))
+                        logger.warning('%s not enabled on %s, skipping for this run', \
+                                       feature.upper(), key[1])
+            return list()
+
+        if key:
+            self.enabled.add((key, feature))
+        return out
+
+    def report(self):
+        'Log commands run and round trips saved'
+
+        skipped = sorted('%s on %s' % (f.upper(), k[1]) for k, f in self.unsupported)
+        logger.info('Command plan: %s commands run, %s round trips saved', \
+                    str(self.commands), str(self.saved))
+        if skipped:
+            logger.info('Skipped for this run: %s', ', '.join(skipped))
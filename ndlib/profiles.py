@@ -0,0 +1,194 @@
+'Learned Timing Profiles'
+import os
+import json
+import fcntl
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Session delay factor until a platform has a profile
+DELAY_FACTOR = 0.2
+
+# Lowest delay factor and read timeout for tuned sessions, and the read
+# timeout a command falls back to after timing out
+MIN_DELAY_FACTOR = 0.05
+MIN_READ_TIMEOUT = 5.0
+FALLBACK_TIMEOUT = 60.0
+
+# Samples needed before tuning, and samples kept per profile
+MIN_SAMPLES = 5
+WINDOW = 50
+
+
+class ReadTimedOut(Exception):
+    'A command did not return to the prompt within its read timeout'
+
+
+class Profile:
+    'Recent command latencies for one os and platform'
+
+    __slots__ = ('samples', 'timeouts')
+
+    def __init__(self, samples=(), timeouts=0):
+        self.samples = deque(samples, maxlen=WINDOW)
+        self.timeouts = timeouts
+
+    def tuned(self):
+        return len(self.samples) >= MIN_SAMPLES
+
+    def delay_factor(self):
+        """ Netmiko's session setup sleeps are multiples of a second times the
+            delay factor, sized to cover four median command round trips. Only
+            ever lowered from the default, slow platforms get longer read
+            timeouts instead """
+
+        median = sorted(self.samples)[len(self.samples) // 2]
+        return round(min(max(median * 4, MIN_DELAY_FACTOR), DELAY_FACTOR), 2)
+
+    def read_timeout(self):
+        'Twice the slowest recent command, so everything seen lately finishes in half the time'
+        return round(min(max(max(self.samples) * 2 + 1, MIN_READ_TIMEOUT), FALLBACK_TIMEOUT), 1)
+
+
+class SessionTiming:
+    'Delay factor and read timeout for one session, with latencies reported back to the profiles'
+
+    __slots__ = ('profiles', 'keys', 'delay_factor', 'read_timeout')
+
+    def __init__(self, profiles, keys, delay_factor, read_timeout):
+        self.profiles = profiles
+        self.keys = keys
+        self.delay_factor = delay_factor
+        self.read_timeout = read_timeout
+
+    def command(self, seconds):
+        'Record how long a command took to return to the prompt'
+        self.profiles.record(self.keys, seconds)
+
+    def fallback(self):
+        """ Called when a command timed out. Moves the rest of the session to
+            FALLBACK_TIMEOUT and returns True, or False if it was already there
+            and the timeout is real """
+
+        if self.read_timeout is not None and self.read_timeout >= FALLBACK_TIMEOUT:
+            return False
+        self.profiles.timed_out(self.keys, self.read_timeout)
+        self.read_timeout = FALLBACK_TIMEOUT
+        return True
+
+
+class TimingProfiles:
+    """ Command latencies learned per os and platform, and per os for devices
+        whose platform is unknown. Once a profile has MIN_SAMPLES, new sessions
+        get a delay factor and read timeout sized from it instead of the fixed
+        defaults: fast switches spend less time in netmiko's session setup
+        sleeps, and read timeouts follow what each platform actually needs.
+
+        A command that runs over a tuned read timeout is retried with
+        FALLBACK_TIMEOUT and its latency recorded, which raises the profile's
+        timeout for later sessions. Profiles are kept in profile_file across
+        runs, merged with what other crawls and workers saved meanwhile. """
+
+    def __init__(self, profile_file=None):
+        self.profile_file = profile_file
+        self.lock = threading.Lock()
+        self.profiles = dict()
+        self.fallbacks = 0
+
+        # Samples and timeouts recorded since the last save
+        self.added = dict()
+        self.added_timeouts = dict()
+
+        if profile_file and os.path.exists(profile_file):
+            with open(profile_file, 'r') as f:
+                saved = json.load(f)
+            for key, p in saved.items():
+                self.profiles[key] = Profile(p['samples'], p.get('timeouts', 0))
+            logger.info('Loaded %s timing profiles from %s', str(len(self.profiles)), profile_file)
+
+    def keys(self, device):
+        'Profile keys for a device, most specific first'
+
+        keys = [device['os'] + '|*']
+        if device['platform'] != 'Unknown':
+            keys.insert(0, device['os'] + '|' + device['platform'])
+        return keys
+
+    def session(self, device):
+        'Timing for a new session on device, the defaults until a profile is tuned'
+
+        keys = self.keys(device)
+        with self.lock:
+            for key in keys:
+                p = self.profiles.get(key)
+                if p and p.tuned():
+                    return SessionTiming(self, keys, p.delay_factor(), p.read_timeout())
+        return SessionTiming(self, keys, DELAY_FACTOR, None)
+
+    def record(self, keys, seconds):
+        'Add a command latency to every profile the device belongs to'
+
+        with self.lock:
+            for key in keys:
+                if key not in self.profiles:
+                    self.profiles[key] = Profile()
+                self.profiles[key].samples.append(seconds)
+                self.added.setdefault(key, deque(maxlen=WINDOW)).append(seconds)
+
+    def timed_out(self, keys, read_timeout):
+        'Count a command that ran over its read timeout'
+
+        logger.info('Command ran over %ss read timeout on %s, falling back to %ss', \
+                    str(read_timeout), keys[0], str(FALLBACK_TIMEOUT))
+        with self.lock:
+            self.fallbacks += 1
+            for key in keys:
+                if key in self.profiles:
+                    self.profiles[key].timeouts += 1
+                    self.added_timeouts[key] = self.added_timeouts.get(key, 0) + 1
+
+    def save(self):
+        """ Add this run's samples to profile_file. The file is read again and
+            replaced under a lock file, so crawls and worker processes sharing
+            it don't drop each other's samples """
+
+        if not self.profile_file:
+            return
+
+        with open(self.profile_file + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            saved = dict()
+            if os.path.exists(self.profile_file):
+                with open(self.profile_file, 'r') as f:
+                    saved = json.load(f)
+            with self.lock:
+                for key, samples in self.added.items():
+                    p = saved.setdefault(key, {'samples': list(), 'timeouts': 0})
+                    p['samples'] = (p['samples'] + [round(s, 4) for s in samples])[-WINDOW:]
+                for key, n in self.added_timeouts.items():
+                    p = saved.setdefault(key, {'samples': list(), 'timeouts': 0})
+                    p['timeouts'] = p.get('timeouts', 0) + n
+                self.added = dict()
+                self.added_timeouts = dict()
+
+            tmp = '%s.%s.tmp' % (self.profile_file, str(os.getpid()))
+            with open(tmp, 'w') as f:
+                json.dump(saved, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.profile_file)
+
+    def report(self):
+        'Log the tuned settings per profile'
+
+        with self.lock:
+            for key in sorted(self.profiles):
+                p = self.profiles[key]
+                if p.tuned():
+                    logger.info('Timing profile %s: %s samples, delay factor %s, read timeout %ss, %s timeouts', \
+                                key, str(len(p.samples)), str(p.delay_factor()), str(p.read_timeout()), \
+                                str(p.timeouts))
+        if self.fallbacks:
+            logger.warning('Timing profiles: %s commands fell back to the %ss read timeout', \
+                           str(self.fallbacks), str(FALLBACK_TIMEOUT))
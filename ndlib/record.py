@@ -0,0 +1,117 @@
+'Neighbor Records'
+import re
+import sys
+from functools import lru_cache
+
+FIELDS = ('local_device_id', 'remote_device_id', 'platform', 'local_int', 'remote_int', \
+          'ipv4', 'os', 'description', 'distance', 'logged_in')
+
+
+# Full interface type names, IOS, IOS-XE and NX-OS
+INT_FULL = ('Ethernet', 'FastEthernet', 'GigabitEthernet', 'TwoGigabitEthernet', \
+            'FiveGigabitEthernet', 'TenGigabitEthernet', 'TwentyFiveGigE', 'FortyGigabitEthernet', \
+            'HundredGigE', 'AppGigabitEthernet', 'Port-channel', 'Vlan', 'Loopback', 'mgmt')
+
+# Cisco abbreviations that are not a unique prefix of one full name. Matched
+# case sensitively, so lower case names from servers (eth0, ens192) are left alone
+INT_ABBREV = {
+    'Gi': 'GigabitEthernet', 'GigE': 'GigabitEthernet',
+    'Tw': 'TwoGigabitEthernet', 'Te': 'TenGigabitEthernet', 'TenGigE': 'TenGigabitEthernet',
+    'Twe': 'TwentyFiveGigE', 'Tf': 'TwentyFiveGigE', 'FortyGigE': 'FortyGigabitEthernet',
+    'Fo': 'FortyGigabitEthernet', 'Fi': 'FiveGigabitEthernet', 'Fa': 'FastEthernet',
+    'HundredGigabitEthernet': 'HundredGigE', 'Po': 'Port-channel',
+}
+
+# Type letters followed by the slot/port numbering
+INT_RE = re.compile(r'([A-Za-z][A-Za-z\-]+)(\d[\d/\.:]*)$')
+
+
+def canonical(name):
+    'Canonical device registry key for a device name'
+    return name.strip().lower()
+
+
+@lru_cache(maxsize=8192)
+def normalize_int(name):
+    """ Full form of a Cisco interface name, eg Eth1/1 to Ethernet1/1 and
+        Gi1/0/1 to GigabitEthernet1/0/1. Prefixes must match the Cisco case,
+        names of unknown or ambiguous types (eth0 on a Linux server) are left
+        as is. """
+
+    m = INT_RE.match(name.strip())
+    if not m:
+        return name
+
+    prefix = m.group(1)
+    full = INT_ABBREV.get(prefix)
+    if not full:
+        matches = [f for f in INT_FULL if f.startswith(prefix)]
+        if len(matches) != 1:
+            return name
+        full = matches[0]
+    return sys.intern(full + m.group(2))
+
+
+class Neighbor:
+    """ Compact neighbor entry, also used as the device registry entry for the
+        remote device. Slots instead of a per-entry dict, with device names,
+        platform and os interned since they repeat across many entries.
+
+        Supports item access so it can stand in for the dicts it replaced in
+        csv writers and JSON output. """
+
+    __slots__ = FIELDS
+
+    def __init__(self, local_device_id, remote_device_id, platform='Unknown', \
+                 local_int='Unknown', remote_int='Unknown', ipv4='Unknown', \
+                 os='Unknown', description='', distance=None, logged_in=False):
+        self.local_device_id = sys.intern(local_device_id)
+        self.remote_device_id = sys.intern(remote_device_id)
+        self.platform = sys.intern(platform)
+        self.local_int = local_int
+        self.remote_int = remote_int
+        self.ipv4 = ipv4
+        self.os = sys.intern(os)
+        self.description = description
+        self.distance = distance
+        self.logged_in = logged_in
+
+    @classmethod
+    def from_dict(cls, d):
+        'Build a record from a neighbor dict, eg a CSV row'
+
+        return cls(d['local_device_id'], d['remote_device_id'], d['platform'], \
+                   d['local_int'], d['remote_int'], d['ipv4'], d['os'], d['description'])
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in FIELDS
+
+    def get(self, key, default=None):
+        'dict.get() equivalent'
+        return getattr(self, key, default)
+
+    def keys(self):
+        'Field names, allows dict(record)'
+        return FIELDS
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+def pack(n):
+    'Neighbor record as a plain tuple for the wire or a worker process'
+    return tuple(getattr(n, f) for f in FIELDS)
+
+
+def unpack(t):
+    'Rebuild a Neighbor record, interning names again'
+    return Neighbor(*t)
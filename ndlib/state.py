@@ -0,0 +1,188 @@
+'Crawl State Tracking'
+import logging
+from .record import Neighbor, canonical
+from .graph import Topology
+from .frontier import Frontier, Priority
+from .log import REPEAT
+
+logger = logging.getLogger(__name__)
+
+# Only scrape IOS/NXOS for now
+CRAWL_OS = frozenset(['cisco_nxos', 'cisco_ios'])
+
+
+class CrawlState:
+    """ Indexed crawl bookkeeping. Every membership test is a hashed lookup
+        and neighbors are only ever appended, so merging a device's results
+        costs the same at 100 devices or 100k devices.
+
+        Devices move from the frontier (enqueued) to inflight while a worker
+        scrapes them and are visited from the moment they are first seen.
+        The frontier is ordered by the Priority policy, and max_crawl is
+        spent as devices are popped, so when the budget runs out the devices
+        left behind are the lowest priority ones found so far.
+
+        Distances during the crawl are provisional, parent plus one, and only
+        used for streamed rows. finish() replaces them with a BFS over the
+        topology graph once every device is in. """
+
+    def __init__(self, max_crawl=10000, priority=None):
+        self.max_crawl = max_crawl
+        self.priority = priority or Priority()
+
+        # Devices handed to workers and results merged
+        self.crawl_count = 0
+        self.completed = 0
+
+        # Devices seen, waiting for a worker and being scraped
+        self.visited = set()
+        self.enqueued = set()
+        self.inflight = set()
+        self.frontier = Frontier()
+
+        # Times each device was seen as a neighbor
+        self.seen = dict()
+
+        # Device registry keyed by canonical name
+        self.devices = dict()
+
+        # One Neighbor Entry per physical link, append only
+        self.neighbors = list()
+
+        # Distance tracking keyed by canonical name
+        self.distances = dict()
+
+        # Deduplicated adjacency for distances and queries
+        self.graph = Topology()
+        self.seeds = list()
+
+    def pending(self):
+        'Devices waiting on or being scraped by a worker, queued devices over max_crawl do not count'
+
+        if self.crawl_count >= self.max_crawl:
+            return len(self.inflight)
+        return len(self.enqueued) + len(self.inflight)
+
+    def ready(self):
+        'True if a device can be popped off the frontier within max_crawl'
+        return bool(self.frontier) and self.crawl_count < self.max_crawl
+
+    def total(self):
+        'Devices completed, in flight and queued within max_crawl, for progress bars'
+        return self.completed + len(self.inflight) + \
+            min(len(self.enqueued), max(self.max_crawl - self.crawl_count, 0))
+
+    def score(self, key):
+        'Frontier score of a known device'
+        return self.priority.score(self.devices[key], self.distances.get(key, 100), self.seen.get(key, 1))
+
+    def add_seed(self, s, seed_os):
+        'Add a seed device entry at distance zero and queue it'
+
+        key = canonical(s)
+        self.devices[key] = Neighbor('', s, ipv4=s, os=seed_os, logged_in=True)
+        self.distances[key] = 0
+        self.seeds.append(s)
+        self.graph.add_device(s)
+
+        if key not in self.visited:
+            self.push(key)
+
+    def push(self, key):
+        'Queue a device for scraping, devices past max_crawl stay queued for a resume'
+
+        self.visited.add(key)
+        self.enqueued.add(key)
+        self.frontier.push(key, self.score(key))
+
+    def pop(self):
+        'Take the best device off the frontier and mark it in flight'
+
+        key = self.frontier.pop()
+        self.enqueued.discard(key)
+        self.inflight.add(key)
+        self.crawl_count += 1
+        return key
+
+    def requeue(self, key):
+        'Put an in flight device back in the frontier, eg after losing its worker or a rate limit'
+
+        self.inflight.discard(key)
+        self.crawl_count -= 1
+        self.enqueued.add(key)
+        self.frontier.push(key, self.score(key))
+
+    def retry(self, key):
+        'Put a completed device back in the frontier, eg after it timed out'
+
+        self.completed -= 1
+        self.crawl_count -= 1
+        self.enqueued.add(key)
+        self.frontier.push(key, self.score(key))
+
+    def complete(self, key, nd):
+        """ Merge one device's neighbor data into the state. Returns the newly
+            found neighbors that were queued for scraping, and the records for
+            links not already reported from the other end """
+
+        self.inflight.discard(key)
+        self.completed += 1
+        new = list()
+        links = list()
+
+        # Keep one record per physical link
+        for n in nd:
+            lkey = canonical(n.local_device_id)
+            rkey = canonical(n.remote_device_id)
+            n.distance = self.distances.get(lkey, 100)
+            if self.graph.add(n):
+                self.neighbors.append(n)
+                links.append(n)
+
+            # Save device to devices
+            if rkey not in self.devices:
+                self.devices[rkey] = n
+            # Update unknown devices, restore logged_in variable
+            elif self.devices[rkey].platform == 'Unknown':
+                n.logged_in = self.devices[rkey].logged_in
+                self.devices[rkey] = n
+
+            # Local device always was logged in to
+            self.devices[lkey].logged_in = True
+            logger.info('Processing Out_q entry %s on %s', n.remote_device_id, n.local_device_id, \
+                        extra=REPEAT)
+
+            self.seen[rkey] = self.seen.get(rkey, 0) + 1
+
+            # New Neighbor that has not been scraped
+            if rkey not in self.visited:
+                if n.os in CRAWL_OS:
+                    self.distances[rkey] = self.distances.get(lkey, 100) + 1
+                    self.push(rkey)
+                    logger.info('Queueing %s', rkey)
+                    new.append(rkey)
+                else:
+                    self.visited.add(rkey)
+
+            # Still queued, seen again or closer, move it up the frontier
+            elif rkey in self.enqueued:
+                self.distances[rkey] = min(self.distances[rkey], self.distances.get(lkey, 100) + 1)
+                self.frontier.push(rkey, self.score(rkey))
+            else:
+                logger.debug('Already visited %s', rkey, extra=REPEAT)
+
+        return new, links
+
+    def finish(self):
+        'Compute final distances from the seeds and apply them to every neighbor'
+
+        if self.enqueued:
+            logger.warning('Max Devices allowed already crawled (%s), %s devices not crawled', \
+                           str(self.max_crawl), str(len(self.enqueued)))
+
+        self.distances = self.graph.distances(self.seeds)
+        for n in self.neighbors:
+            n.distance = self.distances.get(canonical(n.local_device_id), 100)
+        logger.info('Topology: %s devices, %s links', str(len(self.graph)), \
+                    str(len(self.graph.links)))
+        return self.graph
@@ -0,0 +1,212 @@
+'Adaptive Concurrency and Rate Limits'
+import csv
+import logging
+import threading
+from time import monotonic
+from collections import deque
+from .connect import is_ipv4
+
+logger = logging.getLogger(__name__)
+
+# Frontier entries examined per dispatch pass when rate limits hold some back
+SCAN = 256
+
+
+class TokenBucket:
+    'Allows rate events per second with bursts of up to burst'
+
+    __slots__ = ('rate', 'burst', 'tokens', 'stamp')
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.tokens = self.burst
+        self.stamp = monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def ready(self, now):
+        'True if a token is available'
+
+        self.refill(now)
+        return self.tokens >= 1
+
+    def wait(self, now):
+        'Seconds until a token is available'
+
+        self.refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class Throttle:
+    """ AIMD controller for the number of SSH sessions in flight. Starts low
+        and doubles per round of successful connects (slow start), then grows
+        by one per round. The limit is halved when connect failures pass
+        fail_ratio of the recent window, or when short term connect latency
+        rises above latency_factor times the long term average, at most once
+        per cooldown. The ceiling is thread_count or session_count.
+
+        Optional token buckets cap new sessions per second to each /24 and to
+        each platform regardless of the concurrency limit. """
+
+    def __init__(self, ceiling, adaptive=True, start=4, floor=1, subnet_rate=None, \
+                 platform_rate=None, window=20, fail_ratio=0.2, latency_factor=3.0, \
+                 history_file=None):
+        self.ceiling = ceiling
+        self.floor = floor
+        self.adaptive = adaptive
+        self.window = window
+        self.fail_ratio = fail_ratio
+        self.latency_factor = latency_factor
+        self.lock = threading.Lock()
+
+        self.limit = float(ceiling)
+        if adaptive:
+            self.limit = float(max(floor, min(start, ceiling)))
+        self.ssthresh = ceiling
+
+        # Recent connect outcomes and latency averages
+        self.results = deque(maxlen=window)
+        self.short = None
+        self.long = None
+        self.cooldown = 0.0
+
+        self.subnet_rate = subnet_rate
+        self.platform_rate = platform_rate
+        self.subnets = dict()
+        self.platforms = dict()
+        self.held = set()
+        self.next_token = None
+
+        # (seconds into the crawl, limit) on every change
+        self.started = monotonic()
+        self.history = [(0.0, int(self.limit))]
+        self.history_file = history_file
+        self.decreases = 0
+
+    def buckets(self, device):
+        'Rate limit buckets that apply to a device'
+
+        result = list()
+        if self.subnet_rate and is_ipv4(device['ipv4']):
+            net = device['ipv4'].rsplit('.', 1)[0]
+            if net not in self.subnets:
+                self.subnets[net] = TokenBucket(self.subnet_rate)
+            result.append(self.subnets[net])
+        if self.platform_rate:
+            platform = device['platform']
+            if platform not in self.platforms:
+                self.platforms[platform] = TokenBucket(self.platform_rate)
+            result.append(self.platforms[platform])
+        return result
+
+    def ready(self, cs):
+        """ Pop the devices that may start now from the frontier, within the
+            concurrency limit and rate limits. Devices held back by a rate
+            limit go back in the frontier at their priority. """
+
+        now = monotonic()
+        keys = list()
+        held = list()
+        self.next_token = None
+
+        while cs.ready() and len(cs.inflight) - len(held) < int(self.limit) and len(held) < SCAN:
+            key = cs.pop()
+            buckets = self.buckets(cs.devices[key])
+            if all(b.ready(now) for b in buckets):
+                for b in buckets:
+                    b.tokens -= 1
+                keys.append(key)
+            else:
+                held.append(key)
+                wait = max(b.wait(now) for b in buckets)
+                if self.next_token is None or wait < self.next_token:
+                    self.next_token = wait
+
+        for key in held:
+            cs.requeue(key)
+        self.held.update(held)
+        return keys
+
+    def wait(self):
+        'Seconds to wait for results before dispatching again, None to block'
+
+        if self.next_token is None:
+            return None
+        return max(0.01, self.next_token)
+
+    def success(self, latency):
+        'Record a successful connect and its latency'
+
+        with self.lock:
+            self.results.append(True)
+            if self.short is None:
+                self.short = self.long = latency
+            self.short = 0.8 * self.short + 0.2 * latency
+            self.long = 0.98 * self.long + 0.02 * latency
+
+            if not self.adaptive:
+                return
+            if len(self.results) >= self.window // 2 and \
+               self.short > self.latency_factor * self.long:
+                self.decrease('connect latency %.2fs vs %.2fs average' % (self.short, self.long))
+            elif self.limit < self.ssthresh:
+                self.limit = min(self.ceiling, self.limit + 1)
+            else:
+                self.limit = min(self.ceiling, self.limit + 1 / self.limit)
+            self.record()
+
+    def failure(self):
+        'Record a failed connect or session'
+
+        with self.lock:
+            self.results.append(False)
+            if not self.adaptive:
+                return
+            fails = self.results.count(False)
+            if len(self.results) >= 5 and fails / len(self.results) >= self.fail_ratio:
+                self.decrease('%s of %s recent connects failed' % (str(fails), str(len(self.results))))
+
+    def decrease(self, reason):
+        'Halve the limit, at most once per cooldown, called with lock held'
+
+        now = monotonic()
+        if now < self.cooldown:
+            return
+        self.ssthresh = max(self.floor, self.limit / 2)
+        self.limit = self.ssthresh
+        self.cooldown = now + max(1.0, 2 * (self.short or 0))
+        self.results.clear()
+        self.decreases += 1
+        logger.info('Lowering concurrency to %s: %s', str(int(self.limit)), reason)
+        self.record()
+
+    def record(self):
+        'Track limit changes over time'
+
+        if int(self.limit) != self.history[-1][1]:
+            self.history.append((monotonic() - self.started, int(self.limit)))
+
+    def report(self):
+        'Log the concurrency chosen over the crawl, and write the history as CSV if requested'
+
+        elapsed = monotonic() - self.started
+        weighted = 0.0
+        for i, (t, limit) in enumerate(self.history):
+            end = elapsed
+            if i + 1 < len(self.history):
+                end = self.history[i + 1][0]
+            weighted += limit * (end - t)
+
+        logger.info('Concurrency: peak %s, final %s, average %.1f, %s decreases, %s devices held by rate limits', \
+                    str(max(l for t, l in self.history)), str(int(self.limit)), \
+                    weighted / max(elapsed, 0.001), str(self.decreases), str(len(self.held)))
+
+        if self.history_file:
+            with open(self.history_file, 'w') as f:
+                w = csv.writer(f)
+                w.writerow(['seconds', 'limit'])
+                for t, limit in self.history:
+                    w.writerow(['%.2f' % t, limit])
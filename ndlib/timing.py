@@ -0,0 +1,147 @@
+'Timing Instrumentation'
+import os
+import json
+import logging
+import threading
+from time import monotonic
+from contextlib import nullcontext
+from . import log
+
+logger = logging.getLogger(__name__)
+
+# Instrumentation is off unless enabled from ndcrawl.py
+enabled = False
+
+# Phases also tag log lines with the device and phase, enabled with log_json
+tagged = False
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Per device phase totals: {device: {phase: seconds}}
+records = dict()
+lock = threading.Lock()
+
+NULL = nullcontext()
+
+
+class Phase:
+    'Times one phase on one device with a monotonic clock'
+
+    __slots__ = ('device', 'name', 'start', 'tokens')
+
+    def __init__(self, device, name):
+        self.device = device
+        self.name = name
+        self.tokens = None
+
+    def __enter__(self):
+        if tagged:
+            self.tokens = (log.device.set(self.device), log.phase.set(self.name))
+        self.start = monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        if enabled:
+            record(self.device, self.name, monotonic() - self.start)
+        if self.tokens:
+            log.device.reset(self.tokens[0])
+            log.phase.reset(self.tokens[1])
+
+
+def phase(device, name):
+    'Context manager timing a phase on a device, a shared no-op when disabled'
+
+    if not enabled and not tagged:
+        return NULL
+    return Phase(device, name)
+
+
+def record(device, name, seconds):
+    'Add seconds to a device phase'
+
+    with lock:
+        d = records.setdefault(device, dict())
+        d[name] = d.get(name, 0.0) + seconds
+
+
+def histogram(values):
+    'Cumulative bucket counts for values, keyed by upper bound'
+
+    counts = [0] * len(BUCKETS)
+    for v in values:
+        for i, b in enumerate(BUCKETS):
+            if v <= b:
+                counts[i] += 1
+    return dict(zip(BUCKETS, counts))
+
+
+def summary(top=20):
+    'End of run summary: per phase totals and histograms plus the slowest devices'
+
+    phases = dict()
+    for d in records:
+        for name, secs in records[d].items():
+            phases.setdefault(name, list()).append(secs)
+
+    result = {'devices': len(records), 'phases': dict(), 'slowest': list()}
+    for name, values in sorted(phases.items()):
+        values.sort()
+        result['phases'][name] = {'count': len(values), 'total': round(sum(values), 3), \
+                                  'p50': round(values[len(values) // 2], 3), \
+                                  'p95': round(values[int(len(values) * 0.95)], 3), \
+                                  'max': round(values[-1], 3), \
+                                  'histogram': histogram(values)}
+
+    totals = sorted(((sum(p.values()), d) for d, p in records.items()), reverse=True)
+    for total, d in totals[:top]:
+        result['slowest'].append({'device': d, 'total': round(total, 3)})
+
+    return result
+
+
+def write_files(jsonf, promf=None):
+    """ Write per device timings as JSONL, a summary next to it and
+        optionally a Prometheus textfile """
+
+    with open(jsonf, 'w') as f:
+        for d in records:
+            entry = {'device': d, 'total': round(sum(records[d].values()), 4)}
+            for name, secs in records[d].items():
+                entry[name] = round(secs, 4)
+            f.write(json.dumps(entry) + '\n')
+
+    result = summary()
+    with open(jsonf + '.summary.json', 'w') as f:
+        json.dump(result, f, indent=2)
+
+    for name, p in result['phases'].items():
+        logger.info('Timing %s: %s devices, total %.1fs, p50 %.3fs, p95 %.3fs, max %.3fs', \
+                    name, str(p['count']), p['total'], p['p50'], p['p95'], p['max'])
+    for s in result['slowest'][:5]:
+        logger.info('Slow device %s: %.1fs', s['device'], s['total'])
+
+    if promf:
+        write_prometheus(promf, result)
+
+
+def write_prometheus(promf, result):
+    'Write phase histograms in Prometheus textfile collector format'
+
+    lines = ['# HELP ndcrawl_phase_seconds Time spent per device in each crawl phase', \
+             '# TYPE ndcrawl_phase_seconds histogram']
+    for name, p in result['phases'].items():
+        for b, count in p['histogram'].items():
+            lines.append('ndcrawl_phase_seconds_bucket{phase="%s",le="%s"} %d' % (name, b, count))
+        lines.append('ndcrawl_phase_seconds_bucket{phase="%s",le="+Inf"} %d' % (name, p['count']))
+        lines.append('ndcrawl_phase_seconds_sum{phase="%s"} %s' % (name, p['total']))
+        lines.append('ndcrawl_phase_seconds_count{phase="%s"} %d' % (name, p['count']))
+    lines.append('# HELP ndcrawl_devices Devices with timing records')
+    lines.append('# TYPE ndcrawl_devices gauge')
+    lines.append('ndcrawl_devices %d' % result['devices'])
+
+    # Atomic replace so the collector never reads a partial file
+    tmp = promf + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp, promf)
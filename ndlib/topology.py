@@ -1,245 +1,431 @@
 'Topology Routines'
 import logging
-import csv
 import threading
-from time import sleep
-from queue import Queue
+from time import monotonic
+from queue import Queue, Empty
 from . import execute
 from . import parse
 from . import output
+from . import capture
+from . import incremental
+from . import timing
+from . import log
+from .plan import CommandPlan, CDP_DETAIL, LLDP_DETAIL, LLDP_SUMMARY
+from .state import CrawlState, canonical
+from .frontier import Priority
+from .deadline import DeadlineExceeded
+from .creds import AuthFailed
+from .profiles import ReadTimedOut, DELAY_FACTOR
 #from progressbar import ProgressBar
-from tqdm import tqdm
 
 logger = logging.getLogger(__name__)
 
 config = dict()
 
+# Optional capture.CaptureStore for raw command output
+store = None
+
+# Optional incremental.PreviousRun for incremental recrawls
+previous = None
+
+# Optional output.NeighborStream, neighbor rows are written as devices complete
+stream = None
+
+# Optional db.TopologyDB, checkpoints the crawl for --resume
+db = None
+
+# Optional connect.Preflight, races device id and IPv4 before connecting
+preflight = None
+
+# Optional throttle.Throttle, adaptive concurrency and rate limits
+throttle = None
+
+# Commands per device, learns platform capabilities during the crawl
+plan = CommandPlan()
+
+# Optional parsepool.ParsePool, parses on worker processes instead of the I/O threads
+parse_pool = None
+
+# Optional creds.CredentialSet, tries more than one login per device
+credentials = None
+
+# Optional profiles.TimingProfiles, learned delay factor and read timeouts per platform
+profiles = None
+
+# Optional deadline.Watchdog, per device time budget with session teardown
+watchdog = None
+
+
+class Crawl:
+    """ Frontier, merge and report bookkeeping shared by the crawl engines,
+        using the optional parts set on this module. An engine starts the
+        devices from dispatch(), waits up to wait() seconds for a result and
+        hands each one to merge() while running() is True, then calls finish()
+        for the output files and report() for the crawl summaries. """
+
+    def __init__(self, seeds, slots):
+        self.start = monotonic()
+
+        # Devices in flight at once when there is no throttle
+        self.slots = slots
+
+        # Indexed crawl bookkeeping
+        self.cs = CrawlState(max_crawl=int(config['main']['max_crawl']), \
+                             priority=Priority.from_config(config['main']))
+
+        # Queue up seed devices
+        if db:
+            db.begin(self.cs, seeds, config['main']['seed_os'])
+        else:
+            for s in seeds:
+                self.cs.add_seed(s, config['main']['seed_os'])
+
+        # Progress bar on warning level or above, total grows as devices are found
+        self.pbar = None
+        if not config['main']['quiet']:
+            if int(config['main']['log_level']) >= logging.WARNING:
+                from tqdm import tqdm
+                self.pbar = tqdm(total=self.cs.total(), initial=self.cs.completed, unit='dev')
+                self.pbar.set_description('Crawling')
+
+    def running(self):
+        'True while devices are queued, in flight or waiting on a retry'
+        return self.retry() or self.cs.pending()
+
+    def dispatch(self):
+        'Keys of the devices to start now, within the throttle or the free slots'
+
+        cs = self.cs
+        if throttle:
+            keys = throttle.ready(cs)
+        else:
+            keys = list()
+            while cs.ready() and len(cs.inflight) < self.slots:
+                keys.append(cs.pop())
+        for key in keys:
+            logger.info('Processing %s', key)
+        return keys
+
+    def wait(self):
+        'Seconds to wait on results, until a throttled device or a round of retries is due'
+
+        waits = [w for w in (throttle.wait() if throttle else None, \
+                             watchdog.retry_wait() if watchdog else None) if w is not None]
+        return min(waits) if waits else None
+
+    def merge(self, key, nd):
+        'Merge the neighbors of a finished device, new neighbors are queued right away'
+
+        cs = self.cs
+        with timing.phase(cs.devices[key].remote_device_id, 'merge'):
+            new, links = cs.complete(key, nd)
+            if stream:
+                stream.write(links)
+            if db:
+                db.record(cs, key, nd, new, links)
+        if self.pbar:
+            self.pbar.total = cs.total()
+            self.pbar.update(1)
+
+    def retry(self):
+        'Requeue timed out devices whose backoff has passed, returns True while any are waiting'
+
+        if not watchdog:
+            return False
+        cs = self.cs
+        keys = watchdog.retry(lambda key: key not in cs.inflight)
+        for key in keys:
+            cs.retry(key)
+        if keys and db:
+            db.retry(cs, keys)
+        if keys and self.pbar:
+            self.pbar.total = cs.total()
+        return bool(keys) or watchdog.retry_wait() is not None
+
+    def finish(self, outf=None, dout=None, ngout=None):
+        'Write the output files, returns the graph.Topology'
+
+        cs = self.cs
+        if self.pbar:
+            self.pbar.close()
+
+        logger.info('Total neighbors: %s', str(len(cs.neighbors)))
+
+        # Neighbors were already streamed, finalize the device and NetGrph files
+        if stream:
+            stream.close()
+            outf = None
+
+        # Final distances from a BFS over the whole topology
+        graph = cs.finish()
+        if db:
+            db.close(cs)
+
+        output.output_files(outf, ngout, dout, cs.neighbors, cs.devices, cs.distances)
+        return graph
+
+    def report(self):
+        'Save what the crawl learned and log the summaries'
+
+        if previous:
+            previous.save(monotonic() - self.start)
+        if preflight:
+            preflight.report()
+        if throttle:
+            throttle.report()
+        if watchdog:
+            watchdog.report()
+        if credentials:
+            credentials.save()
+            credentials.report()
+        if profiles:
+            profiles.save()
+            profiles.report()
+        plan.report()
+
+
 def crawl(seeds, username, password, outf=None, dout=None, ngout=None):
-    'Crawl CDP/LLDP Neighbors to build a topology'
+    'Crawl CDP/LLDP Neighbors to build a topology, returns the graph.Topology'
 
-    # Queue for devices to scrape next
+    # Queue for devices handed to workers
     q = Queue()
 
-    # Queue for neighbor output from threads
+    # Queue for neighbor output from workers
     out_q = Queue()
 
-    # Visited list for loop detection
-    visited = list()
+    # Start a bounded pool of workers, each pulls devices from q and puts
+    # results on out_q as soon as a device is done
+    thread_count = int(config['main']['thread_count'])
+    workers = list()
+    for i in range(thread_count):
+        worker = threading.Thread(target=crawl_worker, daemon=True, \
+            kwargs={"q": q, "out_q": out_q, "username": username, "password": password})
+        worker.start()
+        workers.append(worker)
+
+    run = Crawl(seeds, thread_count)
+
+    # Hand devices to workers and merge results as each device completes, new
+    # neighbors are queued right away with no waiting on the rest of the BFS level
+    while run.running():
+        for key in run.dispatch():
+            q.put((key, run.cs.devices[key]))
+
+        # Come back to the frontier when a rate limited device may start or
+        # timed out devices are due a retry
+        try:
+            key, nd = out_q.get(timeout=run.wait())
+        except Empty:
+            continue
+        run.merge(key, nd)
+
+    # Stop all workers
+    for worker in workers:
+        q.put(None)
+
+    graph = run.finish(outf, dout, ngout)
+    run.report()
+    return graph
+
+
+def replay(path, outf=None, dout=None, ngout=None, seeds=None):
+    'Rebuild the topology and output files from a capture store without network access'
+
+    meta, entries = capture.load_index(path)
+    if not seeds:
+        seeds = meta['seeds']
+    seed_os = meta.get('seed_os', config['main']['seed_os'])
+
+    # Parse every stored device across all cores
+    import multiprocessing
+    results = dict()
+    jobs = [(path, e) for e in entries]
+    with multiprocessing.Pool(initializer=capture.init_worker, initargs=(dict(config['main']),)) as pool:
+        for key, nd in pool.imap_unordered(capture.parse_entry, jobs, chunksize=32):
+            results[key] = nd
+    logger.info('Parsed %s stored devices from %s', str(len(results)), path)
+
+    # Walk the stored results with the same bookkeeping as a live crawl
+    cs = CrawlState(max_crawl=int(config['main']['max_crawl']), \
+                    priority=Priority.from_config(config['main']))
+    for s in seeds:
+        cs.add_seed(s, seed_os)
 
-    # All Neighbor Entries
-    neighbors = list()
+    while cs.ready():
+        key = cs.pop()
+        if key not in results:
+            logger.info('No stored output for %s', key)
+        cs.complete(key, results.get(key, list()))
 
-    # Device entries for connection details (ipv4, os etc)
-    devices = dict()
+    logger.info('Total neighbors: %s', str(len(cs.neighbors)))
 
-    # Thread tracking
-    qtrack = dict()
+    # Final distances from a BFS over the whole topology
+    graph = cs.finish()
 
-    # Thread previous join attempts
-    joined = list()
+    output.output_files(outf, ngout, dout, cs.neighbors, cs.devices, cs.distances)
 
-    # Distance tracking
-    distances = dict()
+    return graph
 
-    # Counter
-    crawl_count = 0
-    iteration_count = 0
 
-    # Queue up seed devices
-    for s in seeds:
-        q.put(s)
-        devices[s] = dict()
-        devices[s]['remote_device_id'] = s
-        devices[s]['ipv4'] = s
-        devices[s]['os'] = config['main']['seed_os']
-        devices[s]['platform'] = 'Unknown'
-        devices[s]['logged_in'] = True
-        distances[s] = 0
-
-    # Outer Queue, starts inner queue and then adds all unvisited neighbors to queue when
-    # inner queue is empty. Each iteration of outer queue visits all next level neighbors
-    # at once inside inner queue via threads.
-    while not q.empty():
-        iteration_count += 1
-        cqsize = q.qsize()
-        if not config['main']['quiet']:
-            if int(config['main']['log_level']) >= logging.WARNING and iteration_count > 1:
-                pbar = tqdm(total=cqsize, unit='dev')
-                pbar.set_description('Iteration %s' % str(iteration_count))
-
-        # Launch threads on everything in queue to scrape
-        while not q.empty():
-            current = q.get()
-            qsize = q.qsize()
-
-            # Progress bar on warning level or above
-            if not config['main']['quiet']:
-                if int(config['main']['log_level']) >= logging.WARNING and iteration_count > 1:
-                    p_int = (cqsize - qsize)
-                    pbar.update(1)
-                    print('\r', end='')
-
-            if crawl_count > int(config['main']['max_crawl']):
-                logger.warning('Max Devices allowed already crawled')
-
-            # Only scrape unvisited devices
-            elif current not in visited:
-                crawl_count += 1
-
-                visited.append(current)
-                while threading.activeCount() > int(config['main']['thread_count']):
-                    qsize = q.qsize()
-                    logger.debug('Waiting for free thread - Q Size: %s', str(qsize))
-                    sleep(1)
-                # Throttle connections
-                sleep(0.1)
-                logger.info('Processing %s', current)
-
-                # Start thread to scrape devices
-                nd_thread = threading.Thread(target=gather_nd, \
-                    kwargs={"device": devices[current], "username": username, \
-                            "password": password, "out_q": out_q, \
-                            "qtrack": qtrack})
-                nd_thread.start()
-
-        # Join all threads from last iteration and warn if problems joining threads
-        logger.info('Joining all active threads')
-        main_thread = threading.currentThread()
-        wait_timer = 15
-        for some_thread in threading.enumerate():
-            if some_thread != main_thread:
-                tid = str(some_thread.ident)
-                if tid in qtrack:
-                    tid = qtrack[tid]
-                if tid not in joined:
-                    joined.append(tid)
-                    logger.debug('Joining Thread: %s', tid)
-                    some_thread.join(timeout=wait_timer)
-                    wait_timer = 1
-                else:
-                    logger.info('Thread running long time, ignoring: %s: %s', tid, str(some_thread))
-
-        # Process output queue of neighbor data and look for new neighbors to visit
-        logger.info('Processing output queue')
-        while not out_q.empty():
-            nd = out_q.get()
-
-            # Gather distance info
-            for n in nd:
-                if n['local_device_id'] not in distances:
-                    distances[n['local_device_id']] = 100
-                if n['remote_device_id'] in distances:
-                    if distances[n['local_device_id']] > (distances[n['remote_device_id']] + 1):
-                        distances[n['local_device_id']] = distances[n['remote_device_id']] + 1
-                        logger.info('Found new distances on %s: %s', n['local_device_id'], \
-                                    str(distances[n['remote_device_id']] + 1))
-
-            # Save all neighbor data
-            for n in nd:
-                n['distance'] = distances[n['local_device_id']]
-                neighbors.append(n)
-                rname = n['remote_device_id']
-
-                # Save device to devices
-                if rname not in devices:
-                    devices[rname] = n
-                # Update unknown devices, restore logged_in variable
-                elif devices[rname]['platform'] == 'Unknown':
-                    logged_in = False
-                    if 'logged_in' in devices[rname]:
-                        logged_in = devices[rname]['logged_in']
-                    devices[rname] = n
-                    devices[rname]['logged_in'] = logged_in
-
-                # Save logged_in as False initially, update on another pass
-                if 'logged_in' not in devices[n['local_device_id']]:
-                    devices[n['local_device_id']]['logged_in'] = False
-
-                # Local device always was logged in to
-                devices[n['local_device_id']]['logged_in'] = True
-                logger.info('Processing Out_q entry %s on %s', rname, n['local_device_id'])
-
-                # New Neighbor that has not been scraped, only scrape IOS/NXOS for now
-                if rname not in visited:
-                    if n['os'] == 'cisco_nxos':
-                        if rname not in q.queue:
-                            q.put(rname)
-                    elif n['os'] == 'cisco_ios':
-                        if rname not in q.queue:
-                            q.put(rname)
-                    else:
-                        visited.append(rname)
-                else:
-                    logger.debug('Already visited %s', rname)
-
-    # Count Neighbors
-    ncount = 0
-    for n in neighbors:
-        ncount += 1
-    logger.info('Total neighbors: %s', str(ncount))
-
-
-    output.output_files(outf, ngout, dout, neighbors, devices, distances)
-
-
-def gather_nd(**kwargs):
-    'Gather neighbors from device'
-
-    out_q = kwargs['out_q']
-    device = kwargs['device']
-    dname = device['remote_device_id']
-    tid = str(threading.get_ident())
-    kwargs["qtrack"][tid] = dname
+def crawl_worker(q, out_q, username, password):
+    'Scrape devices from q until a None is received, always report back on out_q'
 
-    logger.info('Gathering Neighbors on %s: %s', dname, tid)
+    while True:
+        item = q.get()
+        if item is None:
+            break
 
-    nd = dict()
+        key, device = item
+        nd = list()
 
-    # Try to connect to device id first
-    try:
-        nd = scrape_device(device, dname, kwargs['username'], kwargs['password'])
+        # The watchdog reports a device that runs over with no neighbors
+        deadline = None
+        if watchdog:
+            deadline = watchdog.start(key, lambda key: out_q.put((key, list())))
+        try:
+            nd = gather_nd(device, username, password, deadline)
+        except Exception as e:
+            logger.warning('Failed to gather neighbors on %s: %s', key, str(e))
 
-    except Exception as e:
-        if device['ipv4'] == 'Unknown':
-            logger.warning('Connection to %s failed and IPv4 is Unknown', dname)
+        # Already reported, the closed session or connect timeout freed this worker
+        if deadline and not watchdog.finish(deadline):
+            logger.info('Dropping late result for %s', key)
+            continue
+        out_q.put((key, nd))
 
-        # Try IPv4 Address
-        else:
-            logger.info('Failed to connect to %s, trying %s', dname, device['ipv4'])
-            try:
-                nd = scrape_device(device, device['ipv4'], kwargs['username'], kwargs['password'])
-            except Exception as e:
-                logger.warning('Failed to scrape %s: %s', dname, str(e))
-    if nd:
-        out_q.put(nd)
-        logger.info('Completed Scraping %s: %s', dname, tid)
 
-def scrape_device(device, host, username, password):
-    """ Scrape a device and return the results as list of neighbors """
+def gather_nd(device, username, password, deadline=None):
+    'Gather neighbors from device within the optional deadline.Deadline'
 
     dname = device['remote_device_id']
 
-    ses = execute.get_session(host, device['os'], username, password)
+    log.tag(dname)
+    logger.info('Gathering Neighbors on %s', dname)
+
+    nd = list()
+
+    # Device id first, then IPv4
+    hosts = [dname]
+    if device['ipv4'] != 'Unknown' and device['ipv4'] != dname:
+        hosts.append(device['ipv4'])
+
+    # Race both with a TCP probe and only SSH to the winner
+    if preflight:
+        host = preflight.pick(dname, device['ipv4'])
+        if not host:
+            logger.warning('No reachable address for %s', dname)
+            return nd
+        hosts = [host]
+
+    # Connect latencies, and whether a failure to connect is not the device's fault
+    connects = list()
+    excused = False
+
+    for host in hosts:
+        if deadline and deadline.expired:
+            excused = True
+            break
+        try:
+            nd = scrape_device(device, host, username, password, deadline, connects)
+            break
+        except DeadlineExceeded as e:
+            logger.info('Stopped scraping %s: %s', dname, str(e))
+            excused = True
+            break
+        except AuthFailed as e:
+            logger.warning('Login failed on %s: %s', dname, str(e))
+            excused = True
+            break
+        except Exception as e:
+            logger.info('Failed to scrape %s via %s: %s', dname, host, str(e))
+    else:
+        logger.warning('Failed to scrape %s', dname)
 
-    cdp = execute.send_command(ses, 'show cdp neighbor detail', dname)
+    record_connect(connects, excused)
 
-    lldp = execute.send_command(ses, 'show lldp neighbor detail', dname)
-    lldp_sum = execute.send_command(ses, 'show lldp neighbor', dname)
+    if nd:
+        logger.info('Completed Scraping %s', dname)
 
-    if device['os'] == 'cisco_nxos':
-        nd_cdp = parse.parse_cdp(cdp, device)
-        nd_lldp = parse.parse_lldp(lldp, lldp_sum, device)
-    elif device['os'] == 'cisco_ios':
-        nd_cdp = parse.parse_cdp(cdp, device)
-        nd_lldp = parse.parse_lldp(lldp, lldp_sum, device)
-    else:
-        logger.warning('Unknown OS Type to Parse on %s: %s', dname, device['os'])
+    return nd
 
-    for n in nd_cdp:
-        logger.debug('Found Neighbor %s on %s', n, dname)
-    ses.disconnect()
 
-    nd = parse.merge_nd(nd_cdp, nd_lldp)
+def record_connect(connects, excused):
+    """ Report one outcome per device to the throttle, however many hosts were
+        tried. A device counts as a success if any host connected. """
 
-    return nd
+    if not throttle:
+        return
+    if connects:
+        throttle.success(connects[-1])
+    elif not excused:
+        throttle.failure()
 
+
+def scrape_device(device, host, username, password, deadline=None, connects=None):
+    """ Scrape a device and return the results as list of neighbors, appending
+        the connect latency to the optional connects list """
+
+    dname = device['remote_device_id']
+    tp = profiles.session(device) if profiles else None
+    delay_factor = tp.delay_factor if tp else DELAY_FACTOR
+
+    # Connects are bounded by what is left of the budget, there is no session
+    # for the watchdog to close until they return
+    def connect(username, password):
+        limit = deadline.remaining() if deadline else None
+        return execute.get_session(host, device['os'], username, password, dname, delay_factor, limit)
+
+    connect_start = monotonic()
+    if credentials:
+        ses = credentials.login(device, host, connect)
+    else:
+        ses = connect(username, password)
+    if connects is not None:
+        connects.append(monotonic() - connect_start)
+
+    def send(cmd):
+        if deadline:
+            deadline.check()
+        if not tp:
+            return execute.send_command(ses, cmd, dname)
+
+        # A tuned read timeout that runs short falls back to the long one
+        start = monotonic()
+        try:
+            results = execute.send_command(ses, cmd, dname, tp.read_timeout)
+        except ReadTimedOut:
+            if not tp.fallback():
+                raise
+            execute.clear_session(ses, tp.read_timeout)
+            start = monotonic()
+            results = execute.send_command(ses, cmd, dname, tp.read_timeout)
+        tp.command(monotonic() - start)
+        return results
+
+    # The session is closed on every exit, including errors and the watchdog
+    # closing it first
+    try:
+        # The watchdog closes the session if the device runs over its budget
+        if deadline:
+            deadline.attach(ses)
+
+        # Reuse previous neighbors if the adjacency summary is unchanged
+        if previous:
+            summary = send(incremental.SUMMARY_CMD)
+            nd = previous.check(canonical(dname), summary, plan.planned(device))
+            if nd is not None:
+                return nd
+
+        outputs = plan.run(device, send)
+    finally:
+        try:
+            ses.disconnect()
+        except Exception as e:
+            logger.debug('Disconnect from %s failed: %s', dname, str(e))
+
+    if store:
+        store.save(canonical(dname), device, host, outputs)
+
+    if parse_pool:
+        return parse_pool.parse(device, outputs)
+    return parse.parse_nd(device, outputs[CDP_DETAIL], outputs[LLDP_DETAIL], outputs[LLDP_SUMMARY])
@@ -0,0 +1,240 @@
+'Async engine tests against a fake Cisco CLI served by asyncssh on localhost'
+import os
+import re
+import asyncio
+import pytest
+
+asyncssh = pytest.importorskip('asyncssh')
+
+from ndlib import aio, parse, topology
+from ndlib.plan import CommandPlan
+from ndlib.record import Neighbor
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), 'r') as f:
+        return f.read().splitlines()
+
+
+OUTPUTS = {
+    'show cdp neighbor detail': fixture('ios_cdp_detail.txt'),
+    'show lldp neighbor detail': fixture('ios_lldp_detail.txt'),
+    'show lldp neighbor': fixture('ios_lldp_summary.txt'),
+}
+
+
+class FakeCLI:
+    """ IOS style shell: starts at a > prompt with enable behind a password,
+        wraps echoed input at width columns until terminal width is set, and
+        filters output for | include """
+
+    def __init__(self, width=80, honor_width=True):
+        self.width = width
+        self.honor_width = honor_width
+        self.commands = list()
+
+    async def handle(self, proc):
+        prompt = 'sw1>'
+        proc.stdout.write('\r\n' + prompt)
+        while True:
+            line = await proc.stdin.readline()
+            if not line:
+                break
+            cmd = line.strip()
+            self.commands.append(cmd)
+
+            # Echo the input, wrapped at the terminal width
+            col = len(prompt)
+            echo = ''
+            for c in cmd:
+                if col >= self.width:
+                    echo += '\r\n'
+                    col = 0
+                echo += c
+                col += 1
+            proc.stdout.write(echo + '\r\n')
+
+            if cmd == 'exit':
+                break
+            if cmd == 'enable':
+                proc.stdout.write('Password: ')
+                secret = (await proc.stdin.readline()).strip()
+                self.commands.append('<secret>')
+                prompt = 'sw1#' if secret == 'pw' else prompt
+                proc.stdout.write('\r\n' + prompt)
+                continue
+            if cmd.startswith('terminal width') and self.honor_width:
+                self.width = int(cmd.split()[-1])
+
+            base, _, pattern = cmd.partition(' | include ')
+            if cmd.startswith('terminal') or cmd == '':
+                body = list()
+            elif base in OUTPUTS:
+                body = OUTPUTS[base]
+                if pattern:
+                    body = [l for l in body if re.search(pattern, l)]
+            else:
+                body = ['% Invalid input detected at \'^\' marker.']
+            proc.stdout.write(''.join(l + '\r\n' for l in body) + prompt)
+        proc.exit(0)
+
+
+def scrape(cli, filtered):
+    'Run aio.scrape_device against cli on a localhost asyncssh server'
+
+    class Server(asyncssh.SSHServer):
+        def begin_auth(self, username):
+            return True
+
+        def password_auth_supported(self):
+            return True
+
+        def validate_password(self, username, password):
+            return password == 'pw'
+
+    async def run():
+        key = asyncssh.generate_private_key('ssh-ed25519')
+        server = await asyncssh.create_server(Server, '127.0.0.1', 0, server_host_keys=[key], \
+                                              process_factory=cli.handle, line_editor=False)
+        port = server.sockets[0].getsockname()[1]
+        real_connect = asyncssh.connect
+
+        def connect(host, **kw):
+            return real_connect('127.0.0.1', port, **kw)
+
+        asyncssh.connect = connect
+        try:
+            device = Neighbor('sw1.example.com', 'sw1.example.com', platform='WS-C3850-48P', os='cisco_ios')
+            return await aio.scrape_device(device, 'sw1.example.com', 'u', 'pw')
+        finally:
+            asyncssh.connect = real_connect
+            server.close()
+
+    topology.plan = CommandPlan(filtered=filtered)
+    parse.config = {'main': {'ignore_regex': '(oobsw|lab)'}}
+    return asyncio.run(run())
+
+
+def expected():
+    device = Neighbor('sw1.example.com', 'sw1.example.com', os='cisco_ios')
+    nd = parse.parse_nd(device, OUTPUTS['show cdp neighbor detail'], OUTPUTS['show lldp neighbor detail'], \
+                        OUTPUTS['show lldp neighbor'])
+    return sorted((n['remote_device_id'], n['local_int'], n['remote_int']) for n in nd)
+
+
+def links(nd):
+    return sorted((n['remote_device_id'], n['local_int'], n['remote_int']) for n in nd)
+
+
+@pytest.mark.parametrize('filtered', [False, True])
+def test_enable_and_terminal_width(filtered):
+    cli = FakeCLI()
+    nd = scrape(cli, filtered)
+
+    assert links(nd) == expected()
+    sent = [c for c in cli.commands if c]
+    assert sent[:4] == ['enable', '<secret>', 'terminal length 0', 'terminal width 511']
+
+
+def test_wrapped_echo_without_terminal_width():
+    'Long filtered commands still parse when the device ignores terminal width'
+
+    cli = FakeCLI(width=40, honor_width=False)
+    nd = scrape(cli, True)
+    assert links(nd) == expected()
+
+
+def test_strip_echo():
+    lines = ['sw1#show cdp neighbor detail | inc', 'lude Device ID', 'Device ID: core1']
+    assert aio.strip_echo(lines, 'show cdp neighbor detail | include Device ID', 'sw1#') == ['Device ID: core1']
+    assert aio.strip_echo(['', 'sw1#'], 'show version', 'sw1#') is None
+
+
+MAIN = {'max_crawl': '10000', 'seed_os': 'cisco_nxos', 'quiet': '1', 'log_level': '30', \
+        'thread_count': '8', 'session_count': '20', 'ignore_regex': '(oobsw|lab)'}
+
+
+def crawl_rows(monkeypatch, tmp_path, engine, network, watchdog=None):
+    'Crawl network with one engine, returns the neighbor and device file rows'
+
+    import csv
+    from benchmarks import fakenet
+    from ndlib import execute
+
+    config = {'main': dict(MAIN)}
+    for name, value in (('config', config), ('plan', CommandPlan()), ('watchdog', watchdog)):
+        monkeypatch.setattr(topology, name, value)
+    parse.config = config
+
+    nei, dev = str(tmp_path / (engine + '_nei.csv')), str(tmp_path / (engine + '_dev.csv'))
+    if engine == 'thread':
+        monkeypatch.setattr(execute, 'get_session', network.get_session)
+        topology.crawl(['sw0.example.com'], 'u', 'pw', outf=nei, dout=dev)
+    else:
+        network.start()
+        try:
+            aio.crawl(['sw0.example.com'], 'u', 'pw', outf=nei, dout=dev)
+        finally:
+            network.stop()
+
+    with open(nei) as f:
+        links = {frozenset(((r['local_device_id'], r['local_int']), (r['remote_device_id'], r['remote_int']))) \
+                 for r in csv.DictReader(f)}
+    with open(dev) as f:
+        devices = sorted(tuple(sorted(r.items())) for r in csv.DictReader(f))
+    return links, devices
+
+
+def test_crawl_matches_thread_engine(monkeypatch, tmp_path):
+    'Frontier, merge and output files of the async engine match the thread engine'
+
+    from benchmarks import corpus, fakenet
+
+    outputs, ips = corpus.network(60)
+    threaded = crawl_rows(monkeypatch, tmp_path, 'thread', fakenet.Network(outputs, ips))
+    net = fakenet.Network(outputs, ips)
+    assert crawl_rows(monkeypatch, tmp_path, 'async', net) == threaded
+    assert len(threaded[1]) == 60 and net.sessions == 60
+
+
+def test_crawl_retries_timed_out_device(monkeypatch, tmp_path):
+    'A device that hangs once is given up on, retried and its links still found'
+
+    from benchmarks import corpus, fakenet
+    from ndlib.deadline import Watchdog
+
+    outputs, ips = corpus.network(30)
+    threaded = crawl_rows(monkeypatch, tmp_path, 'thread', fakenet.Network(outputs, ips))
+    watchdog = Watchdog(0.5, retries=1, backoff=0)
+    net = fakenet.Network(outputs, ips, hang=['sw0.example.com'])
+    try:
+        assert crawl_rows(monkeypatch, tmp_path, 'async', net, watchdog) == threaded
+    finally:
+        watchdog.stop()
+    assert watchdog.recovered == {'sw0.example.com'}
+    assert net.sessions == 31
+
+
+@pytest.mark.parametrize('reachable, results', [
+    (('10.0.0.1',), [True]),
+    ((), [False]),
+])
+def test_throttle_counts_one_outcome_per_device(monkeypatch, reachable, results):
+    'Trying the device id then the IPv4 address is one connect outcome'
+
+    from ndlib.throttle import Throttle
+
+    async def scrape_device(device, host, username, password, connects=None):
+        if host not in reachable:
+            raise OSError('Connection refused')
+        connects.append(0.1)
+        return list()
+
+    monkeypatch.setattr(aio, 'scrape_device', scrape_device)
+    monkeypatch.setattr(topology, 'throttle', Throttle(8, adaptive=False))
+    device = Neighbor('sw1.example.com', 'sw1.example.com', ipv4='10.0.0.1', os='cisco_ios')
+
+    asyncio.run(aio.gather_nd(device, 'u', 'pw'))
+    assert list(topology.throttle.results) == results
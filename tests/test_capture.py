@@ -0,0 +1,23 @@
+'Capture store tests'
+from ndlib import capture
+from ndlib.record import Neighbor
+
+
+def crawl(path, seeds, keys):
+    store = capture.CaptureStore(path, seeds, 'cisco_ios')
+    for key in keys:
+        device = Neighbor(key, key, os='cisco_ios')
+        store.save(key, device, key, {'show cdp neighbor detail': ['Device ID: ' + key]})
+    store.close()
+
+
+def test_second_crawl_keeps_earlier_devices(tmp_path):
+    crawl(str(tmp_path), ['core1'], ['core1', 'sw1', 'sw2'])
+    crawl(str(tmp_path), ['core2'], ['core2', 'sw1'])
+
+    meta, entries = capture.load_index(str(tmp_path))
+    assert meta['seeds'] == ['core2']
+    assert [e['key'] for e in entries] == ['core1', 'sw1', 'sw2', 'core2']
+
+    record = capture.load_device(str(tmp_path), entries[2])
+    assert record['outputs']['show cdp neighbor detail'] == ['Device ID: sw2']
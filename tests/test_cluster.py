@@ -0,0 +1,88 @@
+'Coordinator tests with in-process workers on pipes'
+import threading
+from multiprocessing import Pipe
+from ndlib import cluster, topology
+
+MAIN = {'max_crawl': '100', 'seed_os': 'cisco_ios', 'quiet': '1', 'log_level': '30', \
+        'ignore_regex': '(oobsw|lab)', 'password': 'secret', 'cluster_key': 'key', 'thread_count': '50'}
+
+
+def test_worker_config_leaves_out_secrets():
+    main = cluster.worker_config(MAIN)
+    assert main['ignore_regex'] == MAIN['ignore_regex']
+    assert 'password' not in main and 'cluster_key' not in main
+
+
+def serve(conn, done):
+    'Worker that reports every device it is handed with no neighbors'
+
+    while True:
+        msg = conn.recv()
+        if msg[0] == 'stop':
+            return
+        for key, _ in msg[1]:
+            done.append(key)
+            conn.send(('result', key, list()))
+
+
+def test_lost_worker_devices_are_requeued(monkeypatch):
+    'A worker that is gone by the time it is handed work loses its batch to the others'
+
+    lost, lost_end = Pipe()
+    lost_end.close()
+    good, good_end = Pipe()
+    done = list()
+    threading.Thread(target=serve, args=(good_end, done), daemon=True).start()
+
+    def accept(listener, conns, main_config):
+        conns.put((lost, 'lost', 2))
+        conns.put((good, 'good', 2))
+
+    monkeypatch.setattr(cluster, 'accept', accept)
+    monkeypatch.setattr(topology, 'config', {'main': MAIN})
+    seeds = ['sw%s' % str(i) for i in range(5)]
+    cluster.crawl(seeds, 'u', 'pw', listen=('127.0.0.1', 0))
+    assert sorted(done) == seeds
+
+
+def test_local_worker_processes(monkeypatch, tmp_path):
+    'Two forked workers crawl a fake network to the same files as the thread engine'
+
+    import csv
+    from benchmarks import corpus, fakenet
+    from ndlib import execute, parse, profiles
+    from ndlib.plan import CommandPlan, LLDP_SUMMARY
+
+    outputs, ips = corpus.network(60)
+    main = dict(MAIN, max_crawl='10000', seed_os='cisco_nxos', thread_count='4')
+    monkeypatch.setattr(topology, 'config', {'main': main})
+    monkeypatch.setattr(topology, 'plan', CommandPlan())
+    monkeypatch.setattr(parse, 'config', topology.config)
+    monkeypatch.setattr(execute, 'get_session', fakenet.Network(outputs, ips).get_session)
+
+    def links(path):
+        'Links in either orientation, the end a link is reported from depends on crawl order'
+        with open(path) as f:
+            return {frozenset(((r['local_device_id'], r['local_int']), (r['remote_device_id'], r['remote_int']))) \
+                    for r in csv.DictReader(f)}
+
+    def rows(path):
+        with open(path) as f:
+            return sorted(tuple(sorted(r.items())) for r in csv.DictReader(f))
+
+    nei, dev = str(tmp_path / 'nei.csv'), str(tmp_path / 'dev.csv')
+    topology.crawl(['sw0.example.com'], 'u', 'pw', outf=nei, dout=dev)
+    expected = links(nei), rows(dev)
+
+    # Each worker saves the profiles it learned, none may drop the other's.
+    # Every command is kept, IOS devices run three and NX-OS two
+    profile_file = str(tmp_path / 'profiles.json')
+    monkeypatch.setattr(profiles, 'WINDOW', 1000)
+    monkeypatch.setattr(topology, 'profiles', profiles.TimingProfiles(profile_file))
+    cluster.crawl(['sw0.example.com'], 'u', 'pw', outf=nei, dout=dev, workers=2)
+    assert (links(nei), rows(dev)) == expected
+
+    saved = profiles.TimingProfiles(profile_file).profiles
+    ios = sum(1 for out in outputs.values() if out[LLDP_SUMMARY])
+    assert len(saved['cisco_ios|*'].samples) == 3 * ios
+    assert len(saved['cisco_nxos|*'].samples) == 2 * (len(outputs) - ios)
@@ -0,0 +1,51 @@
+'Connection preflight tests'
+import socket
+import asyncio
+import pytest
+from ndlib.connect import Preflight
+
+
+def pick(preflight, engine, dname, ipv4):
+    if engine == 'async':
+        return asyncio.run(preflight.apick(dname, ipv4))
+    return preflight.pick(dname, ipv4)
+
+
+@pytest.fixture
+def port():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(('127.0.0.1', 0))
+    s.listen(8)
+    yield s.getsockname()[1]
+    s.close()
+
+
+@pytest.mark.parametrize('engine', ['thread', 'async'])
+def test_same_address_probed_once(port, engine):
+    preflight = Preflight(port=port, timeout=1)
+    preflight.dns['sw1.example.com'] = '127.0.0.1'
+
+    assert pick(preflight, engine, 'sw1.example.com', '127.0.0.1') == 'sw1.example.com'
+    assert preflight.probes == 1
+    assert not preflight.unreachable
+
+
+@pytest.mark.parametrize('engine', ['thread', 'async'])
+def test_unreachable_cached(engine):
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(('127.0.0.1', 0))
+    closed = s.getsockname()[1]
+    s.close()
+
+    preflight = Preflight(port=closed, timeout=1)
+    preflight.dns['sw1.example.com'] = '127.0.0.1'
+    preflight.dns['sw2.example.com'] = None
+
+    assert pick(preflight, engine, 'sw1.example.com', '127.0.0.1') is None
+    assert preflight.probes == 1
+    assert preflight.unreachable == {'sw1.example.com', '127.0.0.1'}
+
+    assert pick(preflight, engine, 'sw1.example.com', '127.0.0.1') is None
+    assert pick(preflight, engine, 'sw2.example.com', '127.0.0.1') is None
+    assert preflight.probes == 1
+    assert preflight.avoided == 4
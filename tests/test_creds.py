@@ -0,0 +1,68 @@
+'Credential set tests'
+import json
+import pytest
+from multiprocessing import Process
+from ndlib.creds import CredentialSet, AuthFailed
+from ndlib.record import Neighbor
+
+CREDS = [('default', 'u', 'a'), ('core', 'core', 'b'), ('local', 'local', 'c')]
+
+
+def devices():
+    'Devices on shared subnets and name patterns, each with its own working login'
+
+    devs = list()
+    for i in range(30):
+        dev = Neighbor('sw%s.example.com' % str(i), 'sw%s.example.com' % str(i), \
+                       ipv4='10.0.0.' + str(i + 1), platform='WS-C3850-48P', os='cisco_ios')
+        devs.append((dev, CREDS[i % 3][1]))
+    return devs
+
+
+def crawl(creds):
+    for dev, user in devices():
+        def connect(username, password):
+            if username != user:
+                raise AuthFailed('Authentication failed')
+            return username
+        assert creds.login(dev, dev['ipv4'], connect) == user
+
+
+def test_no_credentials_raises_auth_failed():
+    dev, _ = devices()[0]
+    with pytest.raises(AuthFailed):
+        CredentialSet([]).login(dev, dev['ipv4'], lambda u, p: u)
+
+
+def test_device_credential_used_on_next_run(tmp_path):
+    learn_file = str(tmp_path / 'creds.json')
+    first = CredentialSet(CREDS, learn_file)
+    crawl(first)
+    first.save()
+    assert first.failures > 0
+
+    second = CredentialSet(CREDS, learn_file)
+    crawl(second)
+    assert second.failures == 0
+    assert second.avoided > 0
+
+
+def save_logins(learn_file):
+    creds = CredentialSet(CREDS, learn_file)
+    for dev, _ in devices():
+        for _ in range(20):
+            creds.login(dev, dev['ipv4'], lambda u, p: u)
+            creds.save()
+
+
+def test_concurrent_saves_keep_every_login(tmp_path):
+    learn_file = str(tmp_path / 'creds.json')
+    procs = [Process(target=save_logins, args=(learn_file,)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+    with open(learn_file, 'r') as f:
+        saved = json.load(f)
+    assert saved['platform']['WS-C3850-48P']['default'] == 4 * 20 * 30
@@ -0,0 +1,36 @@
+'Daemon recrawl loop tests'
+import sys
+import atexit
+import logging
+from ndlib import log
+from ndlib.daemon import Daemon
+
+
+def test_crawl_exit_keeps_daemon_running(tmp_path):
+    'A crawl that calls sys.exit is a failed recrawl, not the end of the daemon'
+
+    errors = list()
+
+    def crawl():
+        errors.append(daemon.api.last_error)
+        if len(errors) == 1:
+            sys.exit(1)
+        daemon.stop()
+
+    daemon = Daemon(crawl, str(tmp_path / 'nei.csv'), str(tmp_path / 'dev.csv'), ('127.0.0.1', 0), 0.01)
+    daemon.run()
+    assert errors == [None, '1']
+
+
+def test_unqueue_writes_to_listener_handlers(monkeypatch):
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    try:
+        listener = log.init_logging(logging.WARNING, None, False, queued=True)
+        monkeypatch.setattr(log, 'listener', listener)
+        log.unqueue()
+        assert root.handlers[len(handlers):] == list(listener.handlers)
+        atexit.unregister(listener.stop)
+        listener.stop()
+    finally:
+        root.handlers[:] = handlers
@@ -0,0 +1,106 @@
+'Watchdog and timed out device retry tests'
+import time
+import threading
+from queue import Queue
+import pytest
+from ndlib import topology
+from ndlib.deadline import Watchdog, DeadlineExceeded
+from ndlib.state import CrawlState
+from ndlib.db import TopologyDB
+
+
+def test_retry_undoes_completion():
+    cs = CrawlState()
+    cs.add_seed('sw1', 'cisco_ios')
+    key = cs.pop()
+    cs.complete(key, list())
+    assert (cs.crawl_count, cs.completed, cs.total()) == (1, 1, 1)
+
+    cs.retry(key)
+    assert (cs.crawl_count, cs.completed, cs.total()) == (0, 0, 1)
+    assert cs.pop() == key
+    cs.complete(key, list())
+    assert (cs.crawl_count, cs.completed, cs.total()) == (1, 1, 1)
+
+
+def test_retry_survives_resume(tmp_path):
+    path = str(tmp_path / 'crawl.db')
+    cs = CrawlState()
+    db = TopologyDB(path)
+    db.begin(cs, ['sw1'], 'cisco_ios')
+    key = cs.pop()
+    new, links = cs.complete(key, list())
+    db.record(cs, key, list(), new, links)
+    cs.retry(key)
+    db.retry(cs, [key])
+    db.conn.close()
+
+    resumed = CrawlState()
+    TopologyDB(path, resume=True).begin(resumed, ['sw1'], 'cisco_ios')
+    assert resumed.ready() and resumed.completed == 0
+    assert resumed.pop() == key
+
+
+def test_connect_bounded_by_remaining_budget():
+    wd = Watchdog(0.2)
+    expired = threading.Event()
+    d = wd.start('sw1', lambda key: expired.set())
+    assert 0 < d.remaining() <= 0.2
+    assert expired.wait(2)
+    with pytest.raises(DeadlineExceeded):
+        d.remaining()
+    assert not wd.finish(d)
+    wd.stop()
+
+
+def test_stop_ends_watchdog_thread():
+    wd = Watchdog(60)
+    wd.start('sw1')
+    wd.stop()
+    wd.thread.join(2)
+    assert not wd.thread.is_alive()
+
+
+def test_expired_device_keeps_worker(monkeypatch):
+    'A device over budget is reported right away and its worker moves on, no extra threads'
+
+    def gather_nd(device, username, password, deadline=None):
+        if device == 'slow':
+            time.sleep(0.5)
+        return ['n']
+
+    monkeypatch.setattr(topology, 'gather_nd', gather_nd)
+    monkeypatch.setattr(topology, 'watchdog', Watchdog(0.1))
+    q, out_q = Queue(), Queue()
+    before = threading.active_count()
+    worker = threading.Thread(target=topology.crawl_worker, args=(q, out_q, 'u', 'pw'))
+    worker.start()
+
+    q.put(('slow', 'slow'))
+    q.put(('fast', 'fast'))
+    assert out_q.get(timeout=2) == ('slow', list())
+    assert threading.active_count() <= before + 2
+    assert out_q.get(timeout=2) == ('fast', ['n'])
+
+    q.put(None)
+    worker.join(2)
+    topology.watchdog.stop()
+
+
+def test_retry_round_waits_for_merge_and_backoff():
+    'A round starts once its devices are merged, and later timeouts go in the next round'
+
+    wd = Watchdog(60, retries=1, backoff=0.2)
+    inflight = {'sw1'}
+    merged = lambda key: key not in inflight
+
+    wd.expire('sw1')
+    assert wd.retry(merged) == [] and wd.retry_wait() is None
+    inflight.clear()
+    assert wd.retry(merged) == []
+    assert 0 < wd.retry_wait() <= 0.2
+
+    wd.expire('sw2')
+    time.sleep(0.25)
+    assert wd.retry(merged) == ['sw1']
+    assert 0.2 < wd.retry_wait() <= 0.4
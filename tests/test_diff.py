@@ -0,0 +1,50 @@
+'Snapshot diff tests on synthetic crawls'
+import io
+import json
+import pytest
+from benchmarks import corpus
+from ndlib import diff
+
+
+@pytest.fixture(scope='module')
+def snap(tmp_path_factory):
+    prefix = str(tmp_path_factory.mktemp('snap') / 'snap')
+    corpus.snapshots(prefix, 20000, changes=1000)
+    return prefix
+
+
+def run(prefix, stream=False):
+    out = io.StringIO()
+    counts = diff.diff(prefix + '_old_nei.csv', prefix + '_new_nei.csv', out, \
+                       prefix + '_old_dev.csv', prefix + '_new_dev.csv', stream=stream)
+    return counts, [json.loads(l) for l in out.getvalue().splitlines()]
+
+
+def test_changes_found_despite_order_and_orientation(snap):
+    counts, changes = run(snap)
+    assert counts == {'link added': 1000, 'link removed': 1000, 'link moved': 500, 'device changed': 500}
+    moved = [c for c in changes if c['change'] == 'moved']
+    assert all(c['old_local_int'] != c['local_int'] or c['old_remote_int'] != c['remote_int'] for c in moved)
+    changed = [c for c in changes if c['kind'] == 'device']
+    assert all(list(c['old']) == ['ipv4'] for c in changed)
+
+
+def test_stream_reports_moves_as_removed_and_added(snap):
+    counts, _ = run(snap, stream=True)
+    assert counts == {'link added': 1500, 'link removed': 1500, 'device changed': 500}
+
+
+def test_same_snapshot_has_no_changes(snap):
+    out = io.StringIO()
+    assert diff.diff(snap + '_new_nei.csv', snap + '_new_nei.csv', out) == dict()
+
+
+def test_bad_files_name_the_file(snap, tmp_path):
+    bad = tmp_path / 'bad.csv'
+    bad.write_text('local_device_id,local_int,remote_device_id\nsw1,Gi1/0/1,sw2\n')
+    with pytest.raises(ValueError, match='bad.csv: missing columns remote_int'):
+        diff.diff(str(bad), snap + '_new_nei.csv', io.StringIO())
+
+    bad.write_text('local_device_id,local_int,remote_device_id,remote_int\n\nsw1,Gi1/0/1,sw2\n')
+    with pytest.raises(ValueError, match='bad.csv: line 3 has 3 of 4 columns'):
+        diff.diff(snap + '_new_nei.csv', str(bad), io.StringIO())
@@ -0,0 +1,21 @@
+'Incremental recrawl tests'
+from ndlib.incremental import PreviousRun
+
+NEI = 'local_device_id,remote_device_id,local_int,remote_int,platform,ipv4,os,description,distance\n' \
+      'sw1,sw2,Gi1/0/1,Gi1/0/2,WS-C3850-48P,10.0.0.2,cisco_ios,,1\n'
+
+
+def test_saved_commands_come_from_the_plan(tmp_path):
+    state_file, nei_file = str(tmp_path / 'state.json'), str(tmp_path / 'nei.csv')
+    with open(nei_file, 'w') as f:
+        f.write(NEI)
+
+    full = PreviousRun(state_file)
+    for key in ('sw1', 'sw2'):
+        assert full.check(key, ['sw%s Gi1/0/1 120' % key], 3) is None
+    full.save(10.0)
+
+    again = PreviousRun(state_file, nei_file, incremental=True)
+    assert again.check('sw1', ['swsw1 Gi1/0/1 170'], 3)
+    assert again.check('sw2', ['swsw2 Gi1/0/1 99'], 1)
+    assert (again.skipped, again.saved) == (2, 4)
@@ -0,0 +1,65 @@
+'Parser parity tests against the regex-per-line parser it replaced'
+import os
+import json
+import pytest
+from ndlib import parse
+from ndlib.record import Neighbor, normalize_int
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+# parse_cdp and parse_lldp output of the original parser on each fixture,
+# see benchmarks/corpus.py for how the large ones were made
+with open(os.path.join(FIXTURES, 'parse_expected.json'), 'r') as f:
+    EXPECTED = json.load(f)
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), 'r') as f:
+        return f.read().splitlines()
+
+
+def records(nd):
+    return [{k: n[k] for k in ('local_device_id', 'remote_device_id', 'platform', 'local_int', \
+                                'remote_int', 'ipv4', 'os', 'description')} for n in nd]
+
+
+def expected(name, kind):
+    'Original output, with the full interface names neighbors have carried since normalize_int'
+
+    rows = EXPECTED[name][kind]
+    for r in rows:
+        r['local_int'] = normalize_int(r['local_int'])
+        r['remote_int'] = normalize_int(r['remote_int'])
+    return rows
+
+
+@pytest.fixture(autouse=True)
+def config():
+    parse.config = {'main': {'ignore_regex': '(oobsw|lab)'}}
+
+
+@pytest.mark.parametrize('name', sorted(EXPECTED))
+def test_cdp_parity(name):
+    dev = EXPECTED[name]['device']
+    device = Neighbor('', dev['remote_device_id'], os=dev['os'])
+    assert records(parse.parse_cdp(fixture(name + '_cdp_detail.txt'), device)) == expected(name, 'cdp')
+
+
+@pytest.mark.parametrize('name', sorted(EXPECTED))
+def test_lldp_parity(name):
+    dev = EXPECTED[name]['device']
+    device = Neighbor('', dev['remote_device_id'], os=dev['os'])
+
+    # NX-OS detail has the local port, the summary is only run on IOS
+    summary = list()
+    if dev['os'] != 'cisco_nxos':
+        summary = fixture(name + '_lldp_summary.txt')
+    nd = parse.parse_lldp(fixture(name + '_lldp_detail.txt'), summary, device)
+    assert records(nd) == expected(name, 'lldp')
+
+
+def test_ignore_regex_drops_lab_and_oob():
+    device = Neighbor('', 'core1.example.com', os='cisco_nxos')
+    nd = parse.parse_cdp(fixture('nxos_core_cdp_detail.txt'), device)
+    assert len(nd) == 55
+    assert not [n for n in nd if 'lab' in n.remote_device_id or 'oobsw' in n.remote_device_id]
@@ -0,0 +1,30 @@
+'Parse pool tests'
+import os
+from ndlib import parse
+from ndlib.parsepool import ParsePool
+from ndlib.plan import CDP_DETAIL, LLDP_DETAIL, LLDP_SUMMARY
+from ndlib.record import Neighbor
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+MAIN = {'ignore_regex': '(oobsw|lab)'}
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), 'r') as f:
+        return f.read().splitlines()
+
+
+def test_pool_matches_in_place_parse():
+    parse.config = {'main': MAIN}
+    device = Neighbor('', 'acc1.example.com', os='cisco_ios')
+    outputs = {CDP_DETAIL: fixture('ios_access_cdp_detail.txt'), \
+               LLDP_DETAIL: fixture('ios_access_lldp_detail.txt'), \
+               LLDP_SUMMARY: fixture('ios_access_lldp_summary.txt')}
+    local = parse.parse_nd(device, outputs[CDP_DETAIL], outputs[LLDP_DETAIL], outputs[LLDP_SUMMARY])
+
+    pool = ParsePool(2, MAIN)
+    try:
+        pooled = pool.parse(device, outputs)
+    finally:
+        pool.close()
+    assert [dict(n) for n in pooled] == [dict(n) for n in local]
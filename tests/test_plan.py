@@ -0,0 +1,80 @@
+'Command plan tests'
+from ndlib.plan import CommandPlan, CDP_DETAIL, LLDP_DETAIL, LLDP_SUMMARY
+from ndlib.record import Neighbor
+
+INVALID = ["% Invalid input detected at '^' marker."]
+CDP = ['Device ID: core1', 'Interface: Ethernet1/1,  Port ID (outgoing port): Ethernet3/1']
+LLDP = ['Chassis id: 0026.981c.35f9']
+
+
+def device(os='cisco_ios', platform='WS-C3850-48P'):
+    return Neighbor('sw1', 'sw1', platform=platform, os=os)
+
+
+def run(plan, dev, reply):
+    sent = list()
+
+    def send(cmd):
+        sent.append(cmd)
+        return reply(cmd)
+    return plan.run(dev, send), sent
+
+
+def test_filter_quoted_on_nxos_only():
+    plan = CommandPlan(filtered=True)
+    assert plan.command(CDP_DETAIL, device('cisco_nxos', 'N9K-C93180YC-EX'), 'cdp').endswith('"')
+    assert '"' not in plan.command(CDP_DETAIL, device(), 'cdp')
+
+
+def test_rejected_filter_falls_back_to_plain_command():
+    plan = CommandPlan(filtered=True)
+
+    def reply(cmd):
+        if ' | include ' in cmd:
+            return INVALID
+        return {CDP_DETAIL: CDP, LLDP_DETAIL: LLDP, LLDP_SUMMARY: []}[cmd]
+
+    outputs, sent = run(plan, device(), reply)
+    assert outputs[CDP_DETAIL] == CDP
+    assert outputs[LLDP_DETAIL] == LLDP
+    assert sent[1] == CDP_DETAIL and sent[3] == LLDP_DETAIL
+    assert not plan.unsupported
+
+    # The rest of the platform goes straight to the plain commands
+    outputs, sent = run(plan, device(), reply)
+    assert sent == [CDP_DETAIL, LLDP_DETAIL, LLDP_SUMMARY]
+    assert outputs[CDP_DETAIL] == CDP
+
+
+def test_invalid_plain_command_skips_feature():
+    plan = CommandPlan()
+    outputs, sent = run(plan, device(), lambda cmd: INVALID if cmd == LLDP_DETAIL else CDP)
+    assert outputs[LLDP_DETAIL] == []
+    _, sent = run(plan, device(), lambda cmd: CDP)
+    assert sent == [CDP_DETAIL]
+
+
+def test_async_driver_matches_run():
+    import asyncio
+
+    def reply(cmd):
+        return {CDP_DETAIL: CDP, LLDP_DETAIL: LLDP, LLDP_SUMMARY: []}[cmd]
+
+    sent = list()
+
+    async def send(cmd):
+        sent.append(cmd)
+        return reply(cmd)
+
+    outputs = asyncio.run(CommandPlan().arun(device(), send))
+    assert (outputs, sent) == run(CommandPlan(), device(), reply)
+
+
+def test_planned_follows_learned_capabilities():
+    plan = CommandPlan()
+    ios, nxos = device(), device('cisco_nxos', 'N9K-C93180YC-EX')
+    assert (plan.planned(ios), plan.planned(nxos)) == (2, 2)
+
+    run(plan, ios, lambda cmd: {CDP_DETAIL: CDP, LLDP_DETAIL: LLDP, LLDP_SUMMARY: []}[cmd])
+    run(plan, nxos, lambda cmd: INVALID if cmd == LLDP_DETAIL else CDP)
+    assert (plan.planned(ios), plan.planned(nxos)) == (3, 1)
@@ -0,0 +1,56 @@
+'Timing profile tests'
+import json
+from multiprocessing import Process
+from ndlib.profiles import TimingProfiles, WINDOW
+from ndlib.record import Neighbor
+
+
+def device(platform):
+    return Neighbor('sw1', 'sw1', platform=platform, os='cisco_ios')
+
+
+def record(profile_file, platform, count):
+    profiles = TimingProfiles(profile_file)
+    tp = profiles.session(device(platform))
+    for i in range(count):
+        tp.command(0.5)
+        if i % 10 == 0:
+            profiles.save()
+    tp.fallback()
+    profiles.save()
+
+
+def test_saves_merge_with_the_file(tmp_path):
+    'A crawl saving after another keeps the other crawl\'s platforms'
+
+    profile_file = str(tmp_path / 'profiles.json')
+    first = TimingProfiles(profile_file)
+    second = TimingProfiles(profile_file)
+    first.session(device('WS-C3850-48P')).command(0.1)
+    second.session(device('C9300-48P')).command(0.2)
+    first.save()
+    second.save()
+
+    with open(profile_file, 'r') as f:
+        saved = json.load(f)
+    assert saved['cisco_ios|WS-C3850-48P']['samples'] == [0.1]
+    assert saved['cisco_ios|C9300-48P']['samples'] == [0.2]
+    assert saved['cisco_ios|*']['samples'] == [0.1, 0.2]
+
+
+def test_concurrent_saves_keep_every_worker(tmp_path):
+    profile_file = str(tmp_path / 'profiles.json')
+    platforms = ['P%s' % str(i) for i in range(4)]
+    procs = [Process(target=record, args=(profile_file, p, 30)) for p in platforms]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+    with open(profile_file, 'r') as f:
+        saved = json.load(f)
+    for p in platforms:
+        assert len(saved['cisco_ios|' + p]['samples']) == 30
+        assert saved['cisco_ios|' + p]['timeouts'] == 1
+    assert len(saved['cisco_ios|*']['samples']) == WINDOW
+    assert saved['cisco_ios|*']['timeouts'] == 4
@@ -0,0 +1,34 @@
+'Neighbor record and interface name tests'
+import pytest
+from ndlib.record import Neighbor, normalize_int, pack, unpack
+
+
+@pytest.mark.parametrize('name, full', [
+    ('Eth1/1', 'Ethernet1/1'),
+    ('Gi1/0/1', 'GigabitEthernet1/0/1'),
+    ('Te1/1/1', 'TenGigabitEthernet1/1/1'),
+    ('Twe1/0/1', 'TwentyFiveGigE1/0/1'),
+    ('Fa0/1', 'FastEthernet0/1'),
+    ('Po10', 'Port-channel10'),
+    ('GigabitEthernet1/0/1', 'GigabitEthernet1/0/1'),
+    ('mgmt0', 'mgmt0'),
+])
+def test_cisco_names_expand(name, full):
+    assert normalize_int(name) == full
+
+
+@pytest.mark.parametrize('name', ['eth0', 'eth1', 'ens192', 'eno1', 'enp3s0', 'bond0', 'em1', 'p1p1', 'vmnic0'])
+def test_server_names_pass_through(name):
+    assert normalize_int(name) == name
+
+
+def test_records_are_slotted_and_interned():
+    a = Neighbor('core1', ''.join(['sw', '1']), platform=''.join(['N9K-', 'C93180YC-EX']))
+    b = Neighbor('core1', ''.join(['sw', '1']), platform=''.join(['N9K-', 'C93180YC-EX']))
+    assert not hasattr(a, '__dict__')
+    assert a.platform is b.platform and a.remote_device_id is b.remote_device_id
+
+
+def test_pack_round_trip():
+    n = Neighbor('core1', 'sw1', 'N9K-C93180YC-EX', 'Ethernet1/1', 'Ethernet1/49', '10.0.0.1', 'cisco_nxos')
+    assert dict(unpack(pack(n))) == dict(n)
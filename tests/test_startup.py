@@ -0,0 +1,43 @@
+'Offline commands must not load the SSH stack'
+import os
+import sys
+import subprocess
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, 'tests', 'fixtures')
+HEAVY = ('netmiko', 'paramiko', 'tqdm', 'asyncssh')
+
+
+def imported(argv):
+    'Top level modules imported by an ndcrawl.py command, from python -X importtime'
+
+    proc = subprocess.run([sys.executable, '-X', 'importtime', 'ndcrawl.py'] + argv, cwd=ROOT, \
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    assert 'Traceback' not in proc.stderr
+    return {l.rsplit('|', 1)[-1].strip().split('.')[0] for l in proc.stderr.splitlines() \
+            if l.startswith('import time:')}
+
+
+def write_csv(path, rows):
+    with open(path, 'w') as f:
+        f.write('local_device_id,remote_device_id,local_int,remote_int\n')
+        for r in rows:
+            f.write(','.join(r) + '\n')
+
+
+@pytest.mark.parametrize('argv', [
+    ['--help'],
+    ['parse', os.path.join(FIXTURES, 'ios_cdp_detail.txt'), os.path.join(FIXTURES, 'ios_lldp_detail.txt'), \
+     '--device', 'sw1', '--os', 'cisco_ios'],
+])
+def test_offline_commands_skip_ssh_stack(argv):
+    assert not imported(argv) & set(HEAVY)
+
+
+def test_diff_skips_ssh_stack(tmp_path):
+    old, new = str(tmp_path / 'old.csv'), str(tmp_path / 'new.csv')
+    write_csv(old, [('sw1', 'sw2', 'Eth1/1', 'Eth1/2')])
+    write_csv(new, [('sw2', 'sw1', 'Ethernet1/2', 'Ethernet1/1')])
+    assert not imported(['diff', old, new]) & set(HEAVY)
+
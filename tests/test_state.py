@@ -0,0 +1,28 @@
+'Crawl state bookkeeping tests on a synthetic network'
+from benchmarks import corpus
+from ndlib.state import CrawlState
+
+
+def crawl(count, max_crawl=10000):
+    nd = corpus.topology(count)
+    cs = CrawlState(max_crawl=max_crawl)
+    cs.add_seed('sw0.example.com', 'cisco_nxos')
+    while cs.ready():
+        key = cs.pop()
+        cs.complete(key, nd[key])
+    return nd, cs
+
+
+def test_every_device_once_and_every_link_once():
+    nd, cs = crawl(2000)
+    assert cs.completed == cs.crawl_count == 2000
+    assert not cs.pending()
+    assert len(cs.neighbors) == sum(len(n) for n in nd.values()) // 2
+    assert len(cs.graph) == 2000
+
+
+def test_max_crawl_leaves_devices_queued():
+    _, cs = crawl(2000, max_crawl=500)
+    assert cs.completed == 500
+    assert cs.enqueued and not cs.ready()
+    assert cs.total() == 500
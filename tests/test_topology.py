@@ -0,0 +1,57 @@
+'Threaded engine session handling tests'
+import pytest
+from ndlib import topology
+from ndlib.plan import CommandPlan
+from ndlib.record import Neighbor
+from ndlib.throttle import Throttle
+
+
+class FakeSession:
+    def __init__(self, fail=None):
+        self.fail = fail
+        self.disconnects = 0
+
+    def disconnect(self):
+        self.disconnects += 1
+        if self.fail:
+            raise OSError('Socket is closed')
+
+
+class FailingPlan(CommandPlan):
+    def run(self, device, send):
+        raise OSError('Connection reset')
+
+
+@pytest.mark.parametrize('fail', [None, 'closed'])
+def test_session_closed_when_commands_fail(monkeypatch, fail):
+    'A failed command closes the session and its error is the one raised'
+
+    ses = FakeSession(fail)
+    monkeypatch.setattr(topology.execute, 'get_session', lambda *args: ses)
+    monkeypatch.setattr(topology, 'plan', FailingPlan())
+    device = Neighbor('sw1.example.com', 'sw1.example.com', os='cisco_ios')
+
+    with pytest.raises(OSError, match='Connection reset'):
+        topology.scrape_device(device, 'sw1.example.com', 'u', 'pw')
+    assert ses.disconnects == 1
+
+
+@pytest.mark.parametrize('reachable, results', [
+    (('10.0.0.1',), [True]),
+    ((), [False]),
+])
+def test_throttle_counts_one_outcome_per_device(monkeypatch, reachable, results):
+    'Trying the device id then the IPv4 address is one connect outcome'
+
+    def scrape_device(device, host, username, password, deadline=None, connects=None):
+        if host not in reachable:
+            raise OSError('Connection refused')
+        connects.append(0.1)
+        return list()
+
+    monkeypatch.setattr(topology, 'scrape_device', scrape_device)
+    monkeypatch.setattr(topology, 'throttle', Throttle(8, adaptive=False))
+    device = Neighbor('sw1.example.com', 'sw1.example.com', ipv4='10.0.0.1', os='cisco_ios')
+
+    topology.gather_nd(device, 'u', 'pw')
+    assert list(topology.throttle.results) == results